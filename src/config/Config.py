@@ -1,38 +1,118 @@
 import json
+import logging
 import os
+import threading
+import time
+from types import MappingProxyType
+
+CONFIG_POLL_INTERVAL = 2 # seconds between the mtime checks of the loaded config files
+
+def freeze(value):
+  # json data as immutable objects so the cached config can be handed out without copies
+  if isinstance(value, dict):
+    return MappingProxyType({key: freeze(item) for key, item in value.items()})
+  if isinstance(value, list):
+    return tuple([freeze(item) for item in value])
+  return value
+
+class ConfigFile:
+  # One json file kept in memory, loaded again only when its mtime or size changes. Reads never touch the disk,
+  # the change check is done by the config poller thread every CONFIG_POLL_INTERVAL seconds.
+  def __init__(self, path, convert = freeze, default = None):
+    self.path = path
+    self.convert = convert
+    self.default = default # value of a missing file, a missing file raises when None
+    self.lock = threading.Lock()
+    self.fileVersion = None # (mtime, size) of the loaded file
+    self.value = None
+
+  def get(self):
+    value = self.value
+    if value is None:
+      self.reloadIfChanged()
+      value = self.value
+    return value
+
+  def reloadIfChanged(self, force = False):
+    with self.lock:
+      try:
+        stat = os.stat(self.path)
+        fileVersion = (stat.st_mtime_ns, stat.st_size)
+      except FileNotFoundError:
+        if self.default is None:
+          raise
+        fileVersion = None
+      if not force and self.value is not None and fileVersion == self.fileVersion:
+        return
+      if fileVersion == None:
+        data = self.default
+      else:
+        try:
+          with open(self.path, 'r') as configFile:
+            data = json.load(configFile)
+        except ValueError as e:
+          # Ex: read while the file is being written, the next check loads it again
+          if self.value is None:
+            raise
+          logging.error('Config: Keeping the loaded %s, failed to parse the changed file. Error => %s', self.path, str(e))
+          return
+      self.value = self.convert(data)
+      if self.fileVersion != None:
+        logging.info('Config: Reloaded %s', self.path)
+      self.fileVersion = fileVersion
+
+configFiles = {} # path -> ConfigFile
+configFilesLock = threading.Lock()
+configPoller = None
+
+def getConfigFile(path, convert = freeze, default = None):
+  global configPoller
+  configFile = configFiles.get(path, None)
+  if configFile != None:
+    return configFile
+  with configFilesLock:
+    configFile = configFiles.get(path, None)
+    if configFile == None:
+      configFile = ConfigFile(path, convert, default)
+      configFiles[path] = configFile
+    if configPoller == None:
+      configPoller = threading.Thread(target=pollConfigFiles, name="ConfigPoller", daemon=True)
+      configPoller.start()
+  return configFile
+
+def pollConfigFiles():
+  while True:
+    time.sleep(CONFIG_POLL_INTERVAL)
+    for configFile in list(configFiles.values()):
+      try:
+        configFile.reloadIfChanged()
+      except Exception as e:
+        logging.error('Config: Failed to check %s for changes. Error => %s', configFile.path, str(e))
+
+# The config returned below is shared and read only (mappings, tuples, frozensets), copy it before changing it.
 
 def getServerConfig():
-  with open('../config/server.json', 'r') as server:
-    jsonServerData = json.load(server)
-    return jsonServerData
+  return getConfigFile('../config/server.json').get()
 
 def getSystemConfig():
-  with open('../config/system.json', 'r') as system:
-    jsonSystemData = json.load(system)
-    return jsonSystemData
+  return getConfigFile('../config/system.json').get()
 
 def getBrokerAppConfig(short_code):
-  with open('../config/{short_code}.json'.format(short_code = short_code), 'r') as brokerapp:
-    jsonUserData = json.load(brokerapp)
-    return jsonUserData
+  return getConfigFile('../config/{short_code}.json'.format(short_code = short_code)).get()
 
 def getHolidays():
-  with open('../config/holidays.json', 'r') as holidays:
-    holidaysData = json.load(holidays)
-    return holidaysData
+  return getConfigFile('../config/holidays.json', frozenset).get()
+
+def getTimestampsFilePath():
+  return os.path.join(getServerConfig()['deployDir'], 'timestamps.json')
 
 def getTimestampsData():
-  serverConfig = getServerConfig()
-  timestampsFilePath = os.path.join(serverConfig['deployDir'], 'timestamps.json')
-  if os.path.exists(timestampsFilePath) == False:
-    return {}
-  timestampsFile = open(timestampsFilePath, 'r')
-  timestamps = json.loads(timestampsFile.read())
-  return timestamps
+  return getConfigFile(getTimestampsFilePath(), default = {}).get()
 
 def saveTimestampsData(timestamps = {}):
-  serverConfig = getServerConfig()
-  timestampsFilePath = os.path.join(serverConfig['deployDir'], 'timestamps.json')
+  timestampsFilePath = getTimestampsFilePath()
   with open(timestampsFilePath, 'w') as timestampsFile:
     json.dump(timestamps, timestampsFile, indent=2)
+  # readers see the saved data right away, not only after the next poll
+  getConfigFile(timestampsFilePath, default = {}).reloadIfChanged(force = True)
   print("saved timestamps data to file " + timestampsFilePath)
@@ -0,0 +1,210 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from models.Candle import Candle
+
+class CandleAggregator:
+  # Builds OHLCV candles for several timeframes straight from the tick stream. Running candles live in
+  # (timeframe x slot) NumPy arrays indexed by the MarketSnapshot slot, so every tick is an O(1) update per timeframe.
+  # Candles are bucketed on the exchange timestamp and closed when the first tick of the next bucket arrives
+  # (or closeCandles() is called), closed candles are kept in a short history and passed to the candle listeners.
+  def __init__(self, marketSnapshot, timeframes = [1, 3, 5, 15], historySize = 375):
+    self.marketSnapshot = marketSnapshot
+    self.timeframes = list(timeframes)
+    self.periods = np.array([timeframe * 60 for timeframe in self.timeframes], dtype=np.float64).reshape(-1, 1)
+    self.periodSeconds = [float(timeframe * 60) for timeframe in self.timeframes]
+    self.historySize = historySize
+    self.lock = threading.RLock()
+    self.capacity = 0
+    shape = (len(self.timeframes), 0)
+    self.open = np.zeros(shape, dtype=np.float64)
+    self.high = np.zeros(shape, dtype=np.float64)
+    self.low = np.zeros(shape, dtype=np.float64)
+    self.close = np.zeros(shape, dtype=np.float64)
+    self.volume = np.zeros(shape, dtype=np.int64)
+    self.startTime = np.zeros(shape, dtype=np.float64) # epoch seconds of the running candle, 0 = no candle yet
+    self.volumeAtStart = np.zeros(shape, dtype=np.int64) # cumulative day volume when the running candle opened
+    self.isClosed = np.zeros(shape, dtype=np.bool_) # closed by closeCandles() before the next bucket ticked
+    self.lastVolume = np.zeros(0, dtype=np.int64) # latest cumulative day volume per slot
+    self.history = {} # (slot, timeframe index) -> deque of closed Candles
+    self.candleListeners = []
+
+  def addCandleListener(self, listener):
+    # listener(candle) is called on the tick thread for every closed candle, it should return quickly
+    self.candleListeners = self.candleListeners + [listener]
+
+  def getTimeframes(self):
+    return list(self.timeframes)
+
+  def update(self, tradingSymbol, lastTradedPrice, volume = 0, exchangeTimestamp = None):
+    # one tick of the dict path, plain indexed reads and writes as building arrays for a single tick costs more
+    # than it saves. Same rules as _update which is used for whole batches.
+    slot = self.marketSnapshot.getSlot(tradingSymbol)
+    timestamp = self._getTimestamp(exchangeTimestamp.timestamp() if exchangeTimestamp else 0)
+    closed = []
+    with self.lock:
+      if slot >= self.capacity:
+        self._grow(max(self.marketSnapshot.capacity, slot + 1))
+      for timeframeIndex, period in enumerate(self.periodSeconds):
+        bucketStart = timestamp - timestamp % period
+        currentStart = self.startTime[timeframeIndex, slot]
+        if bucketStart > currentStart:
+          if currentStart > 0 and not self.isClosed[timeframeIndex, slot]:
+            closed.append(self._closeCandle(timeframeIndex, slot))
+          self.startTime[timeframeIndex, slot] = bucketStart
+          self.open[timeframeIndex, slot] = lastTradedPrice
+          self.high[timeframeIndex, slot] = lastTradedPrice
+          self.low[timeframeIndex, slot] = lastTradedPrice
+          self.volume[timeframeIndex, slot] = 0
+          previousVolume = self.lastVolume[slot]
+          self.volumeAtStart[timeframeIndex, slot] = previousVolume if previousVolume > 0 else volume
+          self.isClosed[timeframeIndex, slot] = False
+        elif bucketStart < currentStart or self.isClosed[timeframeIndex, slot]:
+          # late packet or candle already closed by closeCandles()
+          continue
+        if lastTradedPrice > self.high[timeframeIndex, slot]:
+          self.high[timeframeIndex, slot] = lastTradedPrice
+        if lastTradedPrice < self.low[timeframeIndex, slot]:
+          self.low[timeframeIndex, slot] = lastTradedPrice
+        self.close[timeframeIndex, slot] = lastTradedPrice
+        if volume > 0:
+          self.volume[timeframeIndex, slot] = max(volume - self.volumeAtStart[timeframeIndex, slot], 0)
+      if volume > 0:
+        self.lastVolume[slot] = volume
+    self._notify(closed)
+
+  def updateFromTick(self, tick):
+    self.update(tick.tradingSymbol, tick.lastTradedPrice, tick.volume, tick.exchange_timestamp)
+
+  def updateBatch(self, batch):
+    rows = batch.getRows()
+    rows = rows[rows["slot"] >= 0]
+    if len(rows) == 0:
+      return
+    timestamps = np.where(rows["exchangeTimestamp"] > 0, rows["exchangeTimestamp"], self._getTimestamp(0))
+    self._update(rows["slot"], rows["ltp"], rows["volume"], timestamps)
+
+  def closeCandles(self, exchangeTimestamp = None):
+    # close the running candles whose period is over even if the symbol did not tick since, Ex: illiquid strikes
+    now = self._getTimestamp(exchangeTimestamp.timestamp() if exchangeTimestamp else 0)
+    closed = []
+    with self.lock:
+      due = (self.startTime > 0) & (self.isClosed == False) & (self.startTime + self.periods <= now)
+      for (timeframeIndex, slot) in zip(*np.nonzero(due)):
+        closed.append(self._closeCandle(timeframeIndex, slot))
+      self.isClosed[due] = True
+    self._notify(closed)
+
+  def getCandles(self, tradingSymbol, timeframe, count = None):
+    # closed candles oldest first
+    slot = self.marketSnapshot.findSlot(tradingSymbol)
+    if slot == None or timeframe not in self.timeframes:
+      return []
+    with self.lock:
+      candles = list(self.history.get((slot, self.timeframes.index(timeframe)), []))
+    return candles if count == None else candles[-count:]
+
+  def getRunningCandle(self, tradingSymbol, timeframe):
+    slot = self.marketSnapshot.findSlot(tradingSymbol)
+    if slot == None or slot >= self.capacity or timeframe not in self.timeframes:
+      return None
+    timeframeIndex = self.timeframes.index(timeframe)
+    with self.lock:
+      if self.startTime[timeframeIndex, slot] == 0 or self.isClosed[timeframeIndex, slot]:
+        return None
+      return self._makeCandle(timeframeIndex, slot)
+
+  def _update(self, slots, ltps, volumes, timestamps):
+    closed = []
+    with self.lock:
+      if len(slots) > 0 and slots.max() >= self.capacity:
+        self._grow(max(self.marketSnapshot.capacity, int(slots.max()) + 1))
+      for timeframeIndex in range(len(self.timeframes)):
+        period = self.periods[timeframeIndex, 0]
+        bucketStarts = timestamps - np.mod(timestamps, period)
+        currentStarts = self.startTime[timeframeIndex, slots]
+        newBucket = bucketStarts > currentStarts
+        if newBucket.any():
+          for i in np.flatnonzero(newBucket & (currentStarts > 0) & (self.isClosed[timeframeIndex, slots] == False)):
+            closed.append(self._closeCandle(timeframeIndex, slots[i]))
+          newSlots = slots[newBucket]
+          newLtps = ltps[newBucket]
+          self.startTime[timeframeIndex, newSlots] = bucketStarts[newBucket]
+          self.open[timeframeIndex, newSlots] = newLtps
+          self.high[timeframeIndex, newSlots] = newLtps
+          self.low[timeframeIndex, newSlots] = newLtps
+          self.volume[timeframeIndex, newSlots] = 0
+          # baseline is the day volume before this tick, for the first tick of a symbol we only have its own volume
+          previousVolumes = self.lastVolume[newSlots]
+          self.volumeAtStart[timeframeIndex, newSlots] = np.where(previousVolumes > 0, previousVolumes, volumes[newBucket])
+          self.isClosed[timeframeIndex, newSlots] = False
+        # ticks older than the running candle (late packets) are ignored
+        current = (bucketStarts == self.startTime[timeframeIndex, slots]) & (self.isClosed[timeframeIndex, slots] == False)
+        if not current.any():
+          continue
+        currentSlots = slots[current]
+        currentLtps = ltps[current]
+        np.maximum.at(self.high[timeframeIndex], currentSlots, currentLtps)
+        np.minimum.at(self.low[timeframeIndex], currentSlots, currentLtps)
+        self.close[timeframeIndex, currentSlots] = currentLtps
+        currentVolumes = volumes[current]
+        withVolume = currentVolumes > 0
+        if withVolume.any():
+          volumeSlots = currentSlots[withVolume]
+          self.volume[timeframeIndex, volumeSlots] = np.maximum(currentVolumes[withVolume] - self.volumeAtStart[timeframeIndex, volumeSlots], 0)
+      withVolume = volumes > 0
+      self.lastVolume[slots[withVolume]] = volumes[withVolume]
+    self._notify(closed)
+
+  def _closeCandle(self, timeframeIndex, slot):
+    # called with the lock held
+    candle = self._makeCandle(timeframeIndex, slot)
+    key = (int(slot), timeframeIndex)
+    history = self.history.get(key, None)
+    if history == None:
+      history = deque(maxlen=self.historySize)
+      self.history[key] = history
+    history.append(candle)
+    return candle
+
+  def _makeCandle(self, timeframeIndex, slot):
+    candle = Candle(self.marketSnapshot.getSymbol(int(slot)), self.timeframes[timeframeIndex])
+    candle.startTimestamp = datetime.fromtimestamp(float(self.startTime[timeframeIndex, slot]))
+    candle.open = float(self.open[timeframeIndex, slot])
+    candle.high = float(self.high[timeframeIndex, slot])
+    candle.low = float(self.low[timeframeIndex, slot])
+    candle.close = float(self.close[timeframeIndex, slot])
+    candle.volume = int(self.volume[timeframeIndex, slot])
+    return candle
+
+  def _notify(self, candles):
+    for candle in candles:
+      for listener in self.candleListeners:
+        try:
+          listener(candle)
+        except Exception as e:
+          logging.error('CandleAggregator: Exception from candle listener for %s. Error => %s', candle.tradingSymbol, str(e))
+
+  def _getTimestamp(self, exchangeTimestamp):
+    # Quote mode ticks do not carry an exchange timestamp, fall back to the latest one seen on any symbol
+    if exchangeTimestamp > 0:
+      return exchangeTimestamp
+    if self.marketSnapshot.lastExchangeTimestamp != None:
+      return self.marketSnapshot.lastExchangeTimestamp.timestamp()
+    return datetime.now().timestamp()
+
+  def _grow(self, capacity):
+    # called with the lock held
+    for field in ["open", "high", "low", "close", "volume", "startTime", "volumeAtStart", "isClosed"]:
+      old = getattr(self, field)
+      new = np.zeros((len(self.timeframes), capacity), dtype=old.dtype)
+      new[:, :old.shape[1]] = old
+      setattr(self, field, new)
+    lastVolume = np.zeros(capacity, dtype=np.int64)
+    lastVolume[:len(self.lastVolume)] = self.lastVolume
+    self.lastVolume = lastVolume
+    self.capacity = capacity
@@ -0,0 +1,163 @@
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from models.TickBatch import TickBatch
+
+class MarketSnapshot:
+  # Live market view of all instruments we receive ticks for. Each symbol gets a dense slot and every
+  # field lives in a NumPy array indexed by that slot, so writes are O(1) and reads across a strike
+  # ladder are vectorised. All writes and multi field reads go through one lock to keep the view consistent.
+  def __init__(self, capacity = 256):
+    self.lock = threading.RLock()
+    self.symbolToSlot = {}
+    self.slotToSymbol = []
+    self.capacity = 0
+    self.ltp = np.zeros(0, dtype=np.float64)
+    self.totalBuyQuantity = np.zeros(0, dtype=np.int64)
+    self.totalSellQuantity = np.zeros(0, dtype=np.int64)
+    self.volume = np.zeros(0, dtype=np.int64)
+    self.oi = np.zeros(0, dtype=np.int64)
+    self.lastUpdateTime = np.zeros(0, dtype=np.float64) # epoch seconds of last tick received, 0 = never updated
+    self.exchangeTimestamp = np.zeros(0, dtype=np.float64) # epoch seconds, 0 when broker does not send it
+    self.lastExchangeTimestamp = None # latest exchange timestamp (datetime) seen across all symbols
+    self._grow(capacity)
+
+  def getSlot(self, tradingSymbol):
+    slot = self.symbolToSlot.get(tradingSymbol, None)
+    if slot != None:
+      return slot
+    with self.lock:
+      slot = self.symbolToSlot.get(tradingSymbol, None)
+      if slot == None:
+        slot = len(self.slotToSymbol)
+        if slot >= self.capacity:
+          self._grow(self.capacity * 2)
+        self.slotToSymbol.append(tradingSymbol)
+        self.symbolToSlot[tradingSymbol] = slot
+      return slot
+
+  def findSlot(self, tradingSymbol):
+    return self.symbolToSlot.get(tradingSymbol, None)
+
+  def getSymbol(self, slot):
+    return self.slotToSymbol[slot]
+
+  def update(self, tradingSymbol, lastTradedPrice, totalBuyQuantity = 0, totalSellQuantity = 0, volume = 0, oi = 0, exchangeTimestamp = None):
+    # quote fields passed as None are left untouched
+    slot = self.getSlot(tradingSymbol)
+    with self.lock:
+      self.ltp[slot] = lastTradedPrice
+      if totalBuyQuantity != None:
+        self.totalBuyQuantity[slot] = totalBuyQuantity
+      if totalSellQuantity != None:
+        self.totalSellQuantity[slot] = totalSellQuantity
+      if volume != None:
+        self.volume[slot] = volume
+      if oi != None:
+        self.oi[slot] = oi
+      self.lastUpdateTime[slot] = time.time()
+      if exchangeTimestamp:
+        self.exchangeTimestamp[slot] = exchangeTimestamp.timestamp()
+        if self.lastExchangeTimestamp == None or exchangeTimestamp > self.lastExchangeTimestamp:
+          self.lastExchangeTimestamp = exchangeTimestamp
+
+  def updateFromTick(self, tick):
+    # fields not carried by the tick mode are left untouched, same as updateBatch
+    if tick.mode == TickBatch.MODE_LTP:
+      self.update(tick.tradingSymbol, tick.lastTradedPrice, None, None, None, None, tick.exchange_timestamp)
+      return
+    self.update(tick.tradingSymbol, tick.lastTradedPrice, tick.totalBuyQuantity, tick.totalSellQuantity,
+      tick.volume, tick.oi if tick.mode != TickBatch.MODE_QUOTE else None, tick.exchange_timestamp)
+
+  def updateBatch(self, batch):
+    # Vectorised write of a whole TickBatch, fields not carried by the tick mode are left untouched
+    rows = batch.getRows()
+    rows = rows[rows["slot"] >= 0]
+    if len(rows) == 0:
+      return
+    slots = rows["slot"]
+    withQuote = (rows["mode"] >= TickBatch.MODE_QUOTE) & (rows["isIndex"] == False)
+    withOI = (rows["mode"] == TickBatch.MODE_FULL) & (rows["isIndex"] == False)
+    withTimestamp = rows["exchangeTimestamp"] > 0
+    with self.lock:
+      self.ltp[slots] = rows["ltp"]
+      self.lastUpdateTime[slots] = time.time()
+      self.totalBuyQuantity[slots[withQuote]] = rows["totalBuyQuantity"][withQuote]
+      self.totalSellQuantity[slots[withQuote]] = rows["totalSellQuantity"][withQuote]
+      self.volume[slots[withQuote]] = rows["volume"][withQuote]
+      self.oi[slots[withOI]] = rows["oi"][withOI]
+      if withTimestamp.any():
+        self.exchangeTimestamp[slots[withTimestamp]] = rows["exchangeTimestamp"][withTimestamp]
+        latest = datetime.fromtimestamp(float(rows["exchangeTimestamp"].max()))
+        if self.lastExchangeTimestamp == None or latest > self.lastExchangeTimestamp:
+          self.lastExchangeTimestamp = latest
+
+  def getLastTradedPrice(self, tradingSymbol):
+    # Raises KeyError for a symbol which never received a tick, same as the old symbol -> ltp map
+    slot = self.symbolToSlot[tradingSymbol]
+    return float(self.ltp[slot])
+
+  def getLastTradedPrices(self, tradingSymbols):
+    # Vectorised read for a list of symbols (Ex: a strike ladder), NaN for symbols without ticks
+    slots = self._slotsFor(tradingSymbols)
+    with self.lock:
+      prices = self.ltp[np.maximum(slots, 0)]
+    return np.where(slots >= 0, prices, np.nan)
+
+  def getAge(self, tradingSymbol, now = None):
+    # Seconds since the last tick of the symbol, None if it never ticked
+    slot = self.symbolToSlot.get(tradingSymbol, None)
+    if slot == None or self.lastUpdateTime[slot] == 0:
+      return None
+    now = time.time() if now == None else now
+    return now - float(self.lastUpdateTime[slot])
+
+  def getStaleSymbols(self, maxAgeSeconds, tradingSymbols = None, now = None):
+    now = time.time() if now == None else now
+    with self.lock:
+      if tradingSymbols == None:
+        tradingSymbols = list(self.slotToSymbol)
+      slots = self._slotsFor(tradingSymbols)
+      updateTimes = self.lastUpdateTime[np.maximum(slots, 0)]
+    stale = (slots < 0) | (updateTimes == 0) | (now - updateTimes > maxAgeSeconds)
+    return [tradingSymbols[i] for i in np.flatnonzero(stale)]
+
+  def getView(self):
+    # Consistent copy of the snapshot keyed by symbol, meant for UI and reporting code
+    with self.lock:
+      count = len(self.slotToSymbol)
+      symbols = list(self.slotToSymbol)
+      ltps = self.ltp[:count].tolist()
+      totalBuys = self.totalBuyQuantity[:count].tolist()
+      totalSells = self.totalSellQuantity[:count].tolist()
+      volumes = self.volume[:count].tolist()
+      ois = self.oi[:count].tolist()
+      updateTimes = self.lastUpdateTime[:count].tolist()
+      lastExchangeTimestamp = self.lastExchangeTimestamp
+    return {
+      "ltps": dict(zip(symbols, ltps)),
+      "totalBuys": dict(zip(symbols, totalBuys)),
+      "totalSells": dict(zip(symbols, totalSells)),
+      "volumes": dict(zip(symbols, volumes)),
+      "ois": dict(zip(symbols, ois)),
+      "lastUpdateTimes": dict(zip(symbols, updateTimes)),
+      "exchangeTimestamp": lastExchangeTimestamp
+    }
+
+  def _slotsFor(self, tradingSymbols):
+    return np.fromiter((self.symbolToSlot.get(s, -1) for s in tradingSymbols), dtype=np.int64, count=len(tradingSymbols))
+
+  def _grow(self, capacity):
+    with self.lock:
+      capacity = max(int(capacity), 1)
+      if capacity <= self.capacity:
+        return
+      for field in ["ltp", "totalBuyQuantity", "totalSellQuantity", "volume", "oi", "lastUpdateTime", "exchangeTimestamp"]:
+        old = getattr(self, field)
+        new = np.zeros(capacity, dtype=old.dtype)
+        new[:len(old)] = old
+        setattr(self, field, new)
+      self.capacity = capacity
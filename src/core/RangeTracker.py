@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from utils.Utils import Utils
+
+class RangeTracker:
+  # Keeps the high/low of registered (tradingSymbol, window start, window end) ranges up to date from the tick
+  # stream so breakout strategies get their range without querying QuestDB. A range registered after its window
+  # started (Ex: app restart) misses the earlier ticks, that part is recovered once from QuestDB tick data.
+  def __init__(self, marketSnapshot, short_code):
+    self.marketSnapshot = marketSnapshot
+    self.short_code = short_code
+    self.lock = threading.Lock()
+    self.ranges = {} # (tradingSymbol, startTimestamp, endTimestamp) -> range dict
+    self.slotToRanges = {} # MarketSnapshot slot -> ranges of that symbol
+    self.trackedSlots = np.zeros(0, dtype=np.int64)
+
+  def registerRange(self, tradingSymbol, startTimestamp, endTimestamp):
+    key = (tradingSymbol, startTimestamp, endTimestamp)
+    with self.lock:
+      if key in self.ranges:
+        return
+      slot = self.marketSnapshot.getSlot(tradingSymbol)
+      registeredAt = time.time()
+      priceRange = {
+        "start": startTimestamp.timestamp(),
+        "end": endTimestamp.timestamp(),
+        "high": None,
+        "low": None,
+        # ticks before registration were never seen, they need to be recovered from QuestDB
+        "needsRecovery": registeredAt > startTimestamp.timestamp(),
+        "registeredAt": datetime.fromtimestamp(registeredAt),
+        "nextRecoveryTime": 0
+      }
+      self.ranges[key] = priceRange
+      self.slotToRanges[slot] = self.slotToRanges.get(slot, []) + [priceRange]
+      self.trackedSlots = np.array(sorted(self.slotToRanges.keys()), dtype=np.int64)
+    logging.info('RangeTracker: Tracking range of %s between %s and %s', tradingSymbol, startTimestamp, endTimestamp)
+
+  def unregisterRange(self, tradingSymbol, startTimestamp, endTimestamp):
+    with self.lock:
+      priceRange = self.ranges.pop((tradingSymbol, startTimestamp, endTimestamp), None)
+      if priceRange == None:
+        return
+      slot = self.marketSnapshot.findSlot(tradingSymbol)
+      remaining = [r for r in self.slotToRanges.get(slot, []) if r is not priceRange]
+      if len(remaining) > 0:
+        self.slotToRanges[slot] = remaining
+      else:
+        self.slotToRanges.pop(slot, None)
+      self.trackedSlots = np.array(sorted(self.slotToRanges.keys()), dtype=np.int64)
+
+  def getRange(self, tradingSymbol, startTimestamp, endTimestamp):
+    # returns (high, low), (None, None) when no price is known for the window yet
+    priceRange = self.ranges.get((tradingSymbol, startTimestamp, endTimestamp), None)
+    if priceRange == None:
+      # not tracked, answer from the stored ticks
+      result = Utils.getPriceRange(self.short_code, startTimestamp, endTimestamp, tradingSymbol)
+      return result if result != None else (None, None)
+    if priceRange["needsRecovery"] and time.time() >= priceRange["nextRecoveryTime"]:
+      self._recover(tradingSymbol, priceRange)
+    return (priceRange["high"], priceRange["low"])
+
+  def updateFromTick(self, tick):
+    slot = self.marketSnapshot.findSlot(tick.tradingSymbol)
+    ranges = self.slotToRanges.get(slot, None)
+    if ranges == None:
+      return
+    timestamp = self._getTimestamp(tick.exchange_timestamp.timestamp() if tick.exchange_timestamp else 0)
+    with self.lock:
+      for priceRange in ranges:
+        self._updateRange(priceRange, timestamp, tick.lastTradedPrice, tick.lastTradedPrice)
+
+  def updateBatch(self, batch):
+    if len(self.trackedSlots) == 0:
+      return
+    rows = batch.getRows()
+    rows = rows[np.isin(rows["slot"], self.trackedSlots)]
+    if len(rows) == 0:
+      return
+    fallbackTimestamp = self._getTimestamp(0)
+    with self.lock:
+      for slot in np.unique(rows["slot"]):
+        slotRows = rows[rows["slot"] == slot]
+        timestamps = np.where(slotRows["exchangeTimestamp"] > 0, slotRows["exchangeTimestamp"], fallbackTimestamp)
+        for priceRange in self.slotToRanges.get(int(slot), []):
+          inWindow = (timestamps >= priceRange["start"]) & (timestamps <= priceRange["end"])
+          if inWindow.any():
+            ltps = slotRows["ltp"][inWindow]
+            self._updateRange(priceRange, priceRange["start"], float(ltps.max()), float(ltps.min()))
+
+  def _updateRange(self, priceRange, timestamp, high, low):
+    # called with the lock held
+    if timestamp < priceRange["start"] or timestamp > priceRange["end"] or high <= 0:
+      return
+    if priceRange["high"] == None or high > priceRange["high"]:
+      priceRange["high"] = high
+    if priceRange["low"] == None or low < priceRange["low"]:
+      priceRange["low"] = low
+
+  def _recover(self, tradingSymbol, priceRange):
+    # merge the ticks stored before we started tracking, retried after 30 seconds if QuestDB is down
+    recoverTill = min(priceRange["registeredAt"], datetime.fromtimestamp(priceRange["end"]))
+    result = Utils.getPriceRange(self.short_code, datetime.fromtimestamp(priceRange["start"]), recoverTill, tradingSymbol)
+    if result == None:
+      priceRange["nextRecoveryTime"] = time.time() + 30
+      logging.warn('RangeTracker: Could not recover range of %s from QuestDB, using live ticks only', tradingSymbol)
+      return
+    high, low = result
+    with self.lock:
+      if high != None:
+        self._updateRange(priceRange, priceRange["start"], high, low)
+      priceRange["needsRecovery"] = False
+
+  def _getTimestamp(self, exchangeTimestamp):
+    if exchangeTimestamp > 0:
+      return exchangeTimestamp
+    if self.marketSnapshot.lastExchangeTimestamp != None:
+      return self.marketSnapshot.lastExchangeTimestamp.timestamp()
+    return time.time()
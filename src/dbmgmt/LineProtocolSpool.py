@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+
+class LineProtocolSpool:
+  # Append only local spool of ILP lines for the time QuestDB is unreachable. Lines are appended to the active
+  # segment which is rotated every maxSegmentBytes, closed segments are replayed oldest first in chunks that end
+  # on a line boundary. The replayed offset of a segment is kept in a sidecar file so a restart does not resend it.
+  SEGMENT_SUFFIX = ".ilp"
+  OFFSET_SUFFIX = ".offset"
+
+  def __init__(self, spoolDir, maxSegmentBytes = 8 * 1024 * 1024, chunkBytes = 256 * 1024):
+    self.spoolDir = spoolDir
+    self.maxSegmentBytes = maxSegmentBytes
+    self.chunkBytes = chunkBytes
+    self.lock = threading.Lock()
+    self.activeFile = None
+    self.activeSegment = None
+    self.activeBytes = 0
+    self.spooledBytes = 0
+    self.replayedBytes = 0
+    if os.path.exists(self.spoolDir) == False:
+      os.makedirs(self.spoolDir)
+    self.nextSequence = self._findLastSequence() + 1
+
+  def append(self, payload):
+    with self.lock:
+      if self.activeFile == None:
+        self._openSegment()
+      self.activeFile.write(payload)
+      self.activeFile.flush()
+      self.activeBytes += len(payload)
+      self.spooledBytes += len(payload)
+      if self.activeBytes >= self.maxSegmentBytes:
+        self._closeSegment()
+
+  def hasPending(self):
+    return self.activeBytes > 0 or len(self._listSegments()) > 0
+
+  def replay(self, send):
+    # sends one chunk of the oldest segment with send(payload), returns False when there was nothing to send.
+    # send raising an exception leaves the chunk in the spool for the next attempt.
+    with self.lock:
+      segments = self._listSegments()
+      if len(segments) == 0 and self.activeBytes > 0:
+        # nothing closed yet, rotate so the lines written so far can be replayed
+        self._closeSegment()
+        segments = self._listSegments()
+    if len(segments) == 0:
+      return False
+    segment = segments[0]
+    segmentPath = os.path.join(self.spoolDir, segment)
+    offset = self._readOffset(segmentPath)
+    with open(segmentPath, 'rb') as segmentFile:
+      segmentFile.seek(offset)
+      chunk = segmentFile.read(self.chunkBytes)
+    # only whole lines, the rest goes with the next chunk. A partial last line left by a crash is discarded.
+    chunk = chunk[:chunk.rfind(b"\n") + 1]
+    if len(chunk) == 0:
+      self._removeSegment(segmentPath)
+      return True
+    send(chunk)
+    self.replayedBytes += len(chunk)
+    if offset + len(chunk) >= os.path.getsize(segmentPath):
+      self._removeSegment(segmentPath)
+      logging.info('LineProtocolSpool: Replayed segment %s', segmentPath)
+    else:
+      self._writeOffset(segmentPath, offset + len(chunk))
+    return True
+
+  def getStats(self):
+    segments = self._listSegments()
+    pendingBytes = self.activeBytes + sum([os.path.getsize(os.path.join(self.spoolDir, segment)) for segment in segments])
+    return {
+      "pendingSegments": len(segments) + (1 if self.activeBytes > 0 else 0),
+      "pendingBytes": pendingBytes,
+      "spooledBytes": self.spooledBytes,
+      "replayedBytes": self.replayedBytes
+    }
+
+  def _openSegment(self):
+    self.activeSegment = "segment-%010d%s" % (self.nextSequence, LineProtocolSpool.SEGMENT_SUFFIX)
+    self.nextSequence += 1
+    # written under a temporary name so the replayer only sees closed segments
+    self.activeFile = open(os.path.join(self.spoolDir, self.activeSegment + ".active"), 'ab')
+    self.activeBytes = 0
+
+  def _closeSegment(self):
+    if self.activeFile == None:
+      return
+    self.activeFile.flush()
+    os.fsync(self.activeFile.fileno())
+    self.activeFile.close()
+    os.replace(os.path.join(self.spoolDir, self.activeSegment + ".active"), os.path.join(self.spoolDir, self.activeSegment))
+    self.activeFile = None
+    self.activeSegment = None
+    self.activeBytes = 0
+
+  def _listSegments(self):
+    # segment names are zero padded so they sort oldest first, segments left .active by a crash are replayed too
+    segments = []
+    for name in sorted(os.listdir(self.spoolDir)):
+      if name.endswith(LineProtocolSpool.SEGMENT_SUFFIX) or (name.endswith(LineProtocolSpool.SEGMENT_SUFFIX + ".active")
+          and name != (self.activeSegment or "") + ".active"):
+        segments.append(name)
+    return segments
+
+  def _findLastSequence(self):
+    lastSequence = 0
+    for name in os.listdir(self.spoolDir):
+      if name.startswith("segment-"):
+        try:
+          lastSequence = max(lastSequence, int(name[len("segment-"):].split(".")[0]))
+        except ValueError:
+          pass
+    return lastSequence
+
+  def _readOffset(self, segmentPath):
+    offsetPath = segmentPath + LineProtocolSpool.OFFSET_SUFFIX
+    if os.path.exists(offsetPath) == False:
+      return 0
+    with open(offsetPath, 'r') as offsetFile:
+      return int(offsetFile.read().strip() or 0)
+
+  def _writeOffset(self, segmentPath, offset):
+    offsetPath = segmentPath + LineProtocolSpool.OFFSET_SUFFIX
+    with open(offsetPath + ".tmp", 'w') as offsetFile:
+      offsetFile.write(str(offset))
+    os.replace(offsetPath + ".tmp", offsetPath)
+
+  def _removeSegment(self, segmentPath):
+    os.remove(segmentPath)
+    if os.path.exists(segmentPath + LineProtocolSpool.OFFSET_SUFFIX):
+      os.remove(segmentPath + LineProtocolSpool.OFFSET_SUFFIX)
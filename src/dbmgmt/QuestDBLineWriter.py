@@ -0,0 +1,238 @@
+import logging
+import numbers
+import socket
+import threading
+import time
+from collections import deque
+
+class QuestDBLineWriter(threading.Thread):
+  # Writes rows to QuestDB over the InfluxDB line protocol (ILP) from a background thread.
+  # Callers only enqueue (table, tags, fields, timestamp in ns) into a bounded buffer, rows are formatted and sent
+  # in batches of at most batchSize rows or every flushInterval seconds, whichever comes first.
+  # When the buffer is full the overflowPolicy decides which rows are dropped: "dropOldest" or "dropNewest".
+  # With a spool set (see setSpool) batches that can not be sent are appended to the local spool instead of being
+  # retried, and the spool is replayed from this thread once QuestDB accepts writes again.
+  MAX_DATAGRAM_SIZE = 1400 # keep UDP datagrams within a typical MTU
+
+  def __init__(self, name, host = "127.0.0.1", port = 9009, protocol = "tcp", capacity = 100000, batchSize = 1000,
+      flushInterval = 1.0, overflowPolicy = "dropOldest"):
+    super(QuestDBLineWriter, self).__init__(name=name, daemon=True)
+    self.host = host
+    self.port = port
+    self.protocol = protocol
+    self.capacity = max(int(capacity), 1)
+    self.batchSize = max(int(batchSize), 1)
+    self.flushInterval = flushInterval
+    self.overflowPolicy = overflowPolicy
+    self.buffer = deque()
+    self.condition = threading.Condition()
+    self.running = True
+    self.sock = None
+    self.nextConnectTime = 0
+    self.spool = None
+    self.spooledCount = 0
+    self.enqueuedCount = 0
+    self.writtenCount = 0
+    self.droppedCount = 0
+    self.flushCount = 0
+    self.failedFlushCount = 0
+    self.lastFlushTime = None
+    self.lastFlushLatency = 0
+    self.maxBufferDepth = 0
+    self.lastDropLogTime = 0
+
+  def write(self, table, tags, fields, timestampNs = None):
+    # tags: dict of symbol columns (or None), fields: dict of column -> value. Never blocks the caller.
+    row = (table, tags, fields, timestampNs if timestampNs != None else time.time_ns())
+    with self.condition:
+      if len(self.buffer) >= self.capacity:
+        self.droppedCount += 1
+        if self.overflowPolicy == "dropNewest":
+          return False
+        self.buffer.popleft()
+      self.buffer.append(row)
+      self.enqueuedCount += 1
+      if len(self.buffer) > self.maxBufferDepth:
+        self.maxBufferDepth = len(self.buffer)
+      if len(self.buffer) >= self.batchSize:
+        self.condition.notify()
+    return True
+
+  def setSpool(self, spool):
+    self.spool = spool
+
+  def stop(self):
+    with self.condition:
+      self.running = False
+      self.condition.notify()
+
+  def run(self):
+    logging.info('QuestDBLineWriter: %s started, sending to %s:%d over %s', self.getName(), self.host, self.port, self.protocol)
+    while True:
+      with self.condition:
+        if self.running and len(self.buffer) < self.batchSize:
+          self.condition.wait(self.flushInterval)
+        running = self.running
+      self.flush()
+      if not running:
+        break
+      self._replaySpool()
+    self._closeSocket()
+    logging.info('QuestDBLineWriter: %s stopped. Stats => %s', self.getName(), self.getStats())
+
+  def flush(self):
+    while True:
+      with self.condition:
+        if len(self.buffer) == 0:
+          return
+        count = min(self.batchSize, len(self.buffer))
+        rows = [self.buffer.popleft() for i in range(count)]
+      if not self._send(rows):
+        self._requeue(rows)
+        return
+
+  def getStats(self):
+    return {
+      "bufferDepth": len(self.buffer),
+      "maxBufferDepth": self.maxBufferDepth,
+      "capacity": self.capacity,
+      "enqueued": self.enqueuedCount,
+      "written": self.writtenCount,
+      "dropped": self.droppedCount,
+      "flushes": self.flushCount,
+      "failedFlushes": self.failedFlushCount,
+      "lastFlushTime": self.lastFlushTime,
+      "lastFlushLatencyMs": self.lastFlushLatency * 1000,
+      "connected": self.sock != None,
+      "spooled": self.spooledCount,
+      "spool": self.spool.getStats() if self.spool != None else None
+    }
+
+  def _send(self, rows):
+    startTime = time.time()
+    payload = "".join([QuestDBLineWriter.formatLine(*row) for row in rows]).encode("utf-8")
+    if self.spool != None and self.sock == None and time.time() < self.nextConnectTime:
+      # QuestDB is known to be down, straight to the spool without waiting for it
+      return self._spill(payload, len(rows))
+    try:
+      self._sendPayload(payload)
+    except Exception as e:
+      self.failedFlushCount += 1
+      logging.error('QuestDBLineWriter: %s failed to send %d rows. Error => %s', self.getName(), len(rows), str(e))
+      if self.spool != None:
+        return self._spill(payload, len(rows))
+      return False
+    self.lastFlushLatency = time.time() - startTime
+    self.lastFlushTime = time.time()
+    self.flushCount += 1
+    self.writtenCount += len(rows)
+    return True
+
+  def _sendPayload(self, payload):
+    try:
+      if self.sock == None:
+        self._connect()
+      if self.protocol == "udp":
+        self._sendDatagrams(payload)
+      else:
+        self.sock.sendall(payload)
+    except Exception:
+      self._closeSocket()
+      # back off before reconnecting so a down QuestDB does not spin this thread
+      self.nextConnectTime = time.time() + 5
+      raise
+
+  def _spill(self, payload, count):
+    try:
+      self.spool.append(payload)
+    except Exception as e:
+      logging.error('QuestDBLineWriter: %s failed to spool %d rows. Error => %s', self.getName(), count, str(e))
+      return False
+    self.spooledCount += count
+    return True
+
+  def _replaySpool(self):
+    # drains the spool a chunk at a time while the live buffer is not backing up
+    if self.spool == None or time.time() < self.nextConnectTime:
+      return
+    try:
+      while len(self.buffer) < self.batchSize and self.spool.replay(self._sendPayload):
+        pass
+    except Exception as e:
+      logging.error('QuestDBLineWriter: %s failed to replay the spool. Error => %s', self.getName(), str(e))
+
+  def _sendDatagrams(self, payload):
+    start = 0
+    while start < len(payload):
+      end = start + QuestDBLineWriter.MAX_DATAGRAM_SIZE
+      if end < len(payload):
+        # never split a line across datagrams
+        end = payload.rfind(b"\n", start, end) + 1
+        if end <= start:
+          end = payload.find(b"\n", start) + 1
+      else:
+        end = len(payload)
+      self.sock.sendto(payload[start:end], (self.host, self.port))
+      start = end
+
+  def _requeue(self, rows):
+    # failed rows go back to the front of the buffer, whatever does not fit is dropped
+    with self.condition:
+      room = self.capacity - len(self.buffer)
+      if room < len(rows):
+        self.droppedCount += len(rows) - max(room, 0)
+        rows = rows[len(rows) - max(room, 0):]
+      self.buffer.extendleft(reversed(rows))
+    self._logDrops()
+    if self.running:
+      time.sleep(max(self.nextConnectTime - time.time(), 0))
+
+  def _connect(self):
+    if time.time() < self.nextConnectTime:
+      raise Exception("waiting to reconnect")
+    if self.protocol == "udp":
+      self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    else:
+      self.sock = socket.create_connection((self.host, self.port), timeout=5)
+      self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+  def _closeSocket(self):
+    if self.sock == None:
+      return
+    try:
+      self.sock.close()
+    except Exception:
+      pass
+    self.sock = None
+
+  def _logDrops(self):
+    if self.droppedCount == 0:
+      return
+    now = time.time()
+    if now - self.lastDropLogTime >= 60:
+      self.lastDropLogTime = now
+      logging.warn('QuestDBLineWriter: %s is dropping rows, dropped %d so far. Stats => %s',
+        self.getName(), self.droppedCount, self.getStats())
+
+  @staticmethod
+  def formatLine(table, tags, fields, timestampNs):
+    line = QuestDBLineWriter.escapeName(table)
+    if tags:
+      for name, value in tags.items():
+        line += "," + QuestDBLineWriter.escapeName(name) + "=" + QuestDBLineWriter.escapeName(str(value))
+    line += " " + ",".join([QuestDBLineWriter.escapeName(name) + "=" + QuestDBLineWriter.formatField(value) for name, value in fields.items()])
+    return line + " " + str(int(timestampNs)) + "\n"
+
+  @staticmethod
+  def formatField(value):
+    if isinstance(value, bool):
+      return "t" if value else "f"
+    if isinstance(value, numbers.Integral):
+      return str(int(value)) + "i"
+    if isinstance(value, numbers.Real):
+      return repr(float(value))
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+  @staticmethod
+  def escapeName(name):
+    return name.replace("\\", "\\\\").replace(" ", "\\ ").replace(",", "\\,").replace("=", "\\=").replace("\n", "\\n")
@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+from config.Config import getServerConfig
+from dbmgmt.SchemaManager import SchemaManager
+
+class QuestDBPool:
+  # Small thread safe pool of QuestDB (postgres wire) connections, one pool per short_code.
+  # Tables are created once when the pool first connects, idle connections are health checked and
+  # reconnected by a background thread so readers and writers never pay the connection setup cost.
+  __instances = {}
+  __instancesLock = threading.Lock()
+
+  @staticmethod
+  def getInstance(short_code):
+    with QuestDBPool.__instancesLock:
+      pool = QuestDBPool.__instances.get(short_code, None)
+      if pool == None:
+        pool = QuestDBPool(short_code)
+        QuestDBPool.__instances[short_code] = pool
+        pool.start()
+      return pool
+
+  def __init__(self, short_code, maxConnections = 4, healthCheckInterval = 30):
+    serverConfig = getServerConfig()
+    self.short_code = short_code
+    self.host = serverConfig.get("questDBHost", "127.0.0.1")
+    self.port = serverConfig.get("questDBPGPort", 8812)
+    self.maxConnections = maxConnections
+    self.healthCheckInterval = healthCheckInterval
+    self.condition = threading.Condition()
+    self.idleConnections = []
+    self.openCount = 0 # idle + checked out
+    self.schemaCreated = False
+    self.healthy = False # last connection attempt or health check succeeded
+    self.healthThread = None
+
+  def start(self):
+    self.healthThread = threading.Thread(target=self._run, name=self.short_code + "_QuestDBPool", daemon=True)
+    self.healthThread.start()
+
+  @contextmanager
+  def connection(self, timeout = 5):
+    # with QuestDBPool.getInstance(short_code).connection() as cursor: ...
+    # raises an Exception when QuestDB can not be reached within the timeout
+    connection = self._checkout(timeout)
+    broken = False
+    try:
+      yield connection.cursor()
+      if not connection.autocommit:
+        connection.commit()
+    except Exception as e:
+      # any error inside the with block, the next borrower must not inherit an open or aborted transaction
+      broken = connection.closed != 0 or isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+      if not broken:
+        try:
+          connection.rollback()
+        except psycopg2.Error as rollbackError:
+          logging.warn('QuestDBPool: Discarding connection, rollback failed. Error => %s', str(rollbackError))
+          broken = True
+      raise
+    finally:
+      self._checkin(connection, broken)
+
+  def isAvailable(self):
+    # cheap check for writers which must not wait on a dead database
+    return self.schemaCreated and self.healthy
+
+  def _checkout(self, timeout):
+    deadline = time.time() + timeout
+    with self.condition:
+      while True:
+        if len(self.idleConnections) > 0:
+          return self.idleConnections.pop()
+        if self.openCount < self.maxConnections:
+          self.openCount += 1
+          break
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          raise Exception("No QuestDB connection available for " + self.short_code)
+        self.condition.wait(remaining)
+    try:
+      return self._connect()
+    except Exception:
+      with self.condition:
+        self.openCount -= 1
+        self.condition.notify()
+      raise
+
+  def _checkin(self, connection, broken):
+    with self.condition:
+      if broken or connection.closed != 0:
+        self.healthy = False
+        self.openCount -= 1
+        self._close(connection)
+      else:
+        self.idleConnections.append(connection)
+      self.condition.notify()
+
+  def _connect(self):
+    try:
+      connection = psycopg2.connect(user = "admin", password = "quest", host = self.host, port = self.port, database = "qdb",
+        connect_timeout = 3)
+      if not self.schemaCreated:
+        self._createSchema(connection)
+    except Exception:
+      self.healthy = False
+      raise
+    self.healthy = True
+    return connection
+
+  def _createSchema(self, connection):
+    SchemaManager(self.short_code).migrate(connection)
+    self.schemaCreated = True
+    logging.info("QuestDBPool: Created schema for %s", self.short_code)
+
+  def _close(self, connection):
+    try:
+      connection.close()
+    except Exception:
+      pass
+
+  def _run(self):
+    while True:
+      try:
+        self._healthCheck()
+      except Exception as e:
+        logging.error("QuestDBPool: Health check failed for %s. Error => %s", self.short_code, str(e))
+      # retry sooner while QuestDB is down
+      time.sleep(self.healthCheckInterval if self.healthy else 5)
+
+  def _healthCheck(self):
+    # ping idle connections and drop dead ones, then make sure at least one connection is ready
+    with self.condition:
+      connections = self.idleConnections
+      self.idleConnections = []
+    healthy = []
+    for connection in connections:
+      try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        cursor.close()
+        healthy.append(connection)
+      except Exception:
+        self.healthy = False
+        self._close(connection)
+    with self.condition:
+      self.openCount -= len(connections) - len(healthy)
+      self.idleConnections.extend(healthy)
+      needsConnection = self.openCount == 0
+      if needsConnection:
+        self.openCount += 1
+    if needsConnection:
+      try:
+        connection = self._connect()
+        logging.info("QuestDBPool: Connected to Quest DB for %s", self.short_code)
+      except Exception as e:
+        with self.condition:
+          self.openCount -= 1
+        logging.info("QuestDBPool: Can't connect to QuestDB for %s. Error => %s", self.short_code, str(e))
+        return
+      self._checkin(connection, False)
@@ -0,0 +1,69 @@
+import logging
+from datetime import datetime
+
+class SchemaManager:
+  # Versioned schema of the QuestDB tables of a short_code. The applied version is recorded in {short_code}_schemaVersion
+  # and every migration above it is applied in order when the pool first connects.
+  #   version 1: original tables, string columns and partition by year
+  #   version 2: SYMBOL columns for strategy/tradingSymbol/tradeId/status, tradingSymbol indexed, partition by DAY
+  # QuestDB can not change the partitioning of a table, so existing tables are copied into a new table which then
+  # replaces the old one.
+  LATEST_VERSION = 2
+
+  def __init__(self, short_code):
+    self.short_code = short_code
+    self.tradesTable = short_code
+    self.tickDataTable = short_code + "_tickData"
+    self.versionTable = short_code + "_schemaVersion"
+
+  def migrate(self, connection):
+    cursor = connection.cursor()
+    cursor.execute("CREATE TABLE IF NOT EXISTS \"{0}\" (ts TIMESTAMP, version INT) timestamp(ts)".format(self.versionTable))
+    version = self.getVersion(cursor)
+    if version == 0 and not self._tableExists(cursor, self.tradesTable) and not self._tableExists(cursor, self.tickDataTable):
+      # fresh install, nothing to migrate
+      self._createTables(cursor, "")
+      self._setVersion(cursor, SchemaManager.LATEST_VERSION)
+    elif version < 2:
+      logging.info("SchemaManager: Migrating QuestDB tables of %s from version %d to 2", self.short_code, version)
+      self._migrateToVersion2(cursor)
+      self._setVersion(cursor, 2)
+    connection.commit()
+    cursor.close()
+
+  def getVersion(self, cursor):
+    cursor.execute("SELECT max(version) FROM \"{0}\"".format(self.versionTable))
+    result = cursor.fetchone()
+    return result[0] if result != None and result[0] != None else 0
+
+  def _createTables(self, cursor, suffix):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS "{0}{1}" (ts TIMESTAMP, strategy SYMBOL CAPACITY 256 CACHE, tradingSymbol SYMBOL CAPACITY 2048 CACHE,
+      tradeId SYMBOL CAPACITY 4096 NOCACHE, cmp float, entry float, pnl float, qty int, status SYMBOL CAPACITY 16 CACHE)
+      timestamp(ts) partition by DAY'''.format(self.tradesTable, suffix))
+    cursor.execute('''CREATE TABLE IF NOT EXISTS "{0}{1}" (ts TIMESTAMP, tradingSymbol SYMBOL CAPACITY 2048 CACHE INDEX, ltp float, qty int,
+      avgPrice float, volume int, totalBuyQuantity int, totalSellQuantity int, open float, high float, low float, close float, change float)
+      timestamp(ts) partition by DAY'''.format(self.tickDataTable, suffix))
+
+  def _migrateToVersion2(self, cursor):
+    for table in [self.tradesTable, self.tickDataTable]:
+      if self._tableExists(cursor, table + "_v2") and self._tableExists(cursor, table):
+        # left over by a migration that did not finish, the old table is still the complete copy
+        cursor.execute("DROP TABLE \"{0}_v2\"".format(table))
+    self._createTables(cursor, "_v2")
+    if self._tableExists(cursor, self.tradesTable):
+      cursor.execute('''INSERT INTO "{0}_v2" SELECT ts, cast(strategy as SYMBOL), cast(tradingSymbol as SYMBOL), cast(tradeId as SYMBOL),
+        cmp, entry, pnl, qty, cast(status as SYMBOL) FROM "{0}"'''.format(self.tradesTable))
+    if self._tableExists(cursor, self.tickDataTable):
+      cursor.execute('''INSERT INTO "{0}_v2" SELECT ts, cast(tradingSymbol as SYMBOL), ltp, qty, avgPrice, volume, totalBuyQuantity,
+        totalSellQuantity, open, high, low, close, change FROM "{0}"'''.format(self.tickDataTable))
+    for table in [self.tradesTable, self.tickDataTable]:
+      if self._tableExists(cursor, table):
+        cursor.execute("DROP TABLE \"{0}\"".format(table))
+      cursor.execute("RENAME TABLE \"{0}_v2\" TO \"{0}\"".format(table))
+
+  def _setVersion(self, cursor, version):
+    cursor.execute("INSERT INTO \"{0}\" VALUES(%s, %s)".format(self.versionTable), (datetime.now(), version))
+
+  def _tableExists(self, cursor, table):
+    cursor.execute("SELECT count() FROM tables() WHERE table_name = %s", (table,))
+    return cursor.fetchone()[0] > 0
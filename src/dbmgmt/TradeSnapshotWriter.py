@@ -0,0 +1,64 @@
+import logging
+import threading
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+from dbmgmt.QuestDBPool import QuestDBPool
+
+class TradeSnapshotWriter:
+  # Collects the trade and index rows of one tracking cycle and writes them to the {short_code} QuestDB table
+  # as a single multi row INSERT with bound parameters and one commit. Rows added outside the cycle
+  # (Ex: a trade completed from an order update) go out with the next flush.
+  # While QuestDB is unavailable the rows are handed to the line writer, which spools them locally.
+  def __init__(self, short_code):
+    self.short_code = short_code
+    self.lineWriter = None
+    self.lock = threading.Lock()
+    self.rows = []
+    self.writtenCount = 0
+    self.failedFlushCount = 0
+
+  def setLineWriter(self, lineWriter):
+    self.lineWriter = lineWriter
+
+  def addTradeRow(self, trade):
+    self._addRow((datetime.now(), trade.strategy, trade.tradingSymbol, trade.tradeID, trade.cmp, trade.entry, trade.pnl,
+      trade.qty, trade.tradeState))
+
+  def addIndexRow(self, name, tradingSymbol, lastTradedPrice):
+    self._addRow((datetime.now(), name, tradingSymbol, "", lastTradedPrice, 0, 0, 0, ""))
+
+  def flush(self):
+    with self.lock:
+      rows = self.rows
+      self.rows = []
+    if len(rows) == 0:
+      return
+    questDBPool = QuestDBPool.getInstance(self.short_code)
+    if not questDBPool.isAvailable():
+      self._spill(rows)
+      return
+    try:
+      # the pool commits once when the block exits
+      with questDBPool.connection() as cursor:
+        execute_values(cursor, "INSERT INTO \"" + self.short_code + "\" VALUES %s", rows, page_size=len(rows))
+      self.writtenCount += len(rows)
+    except Exception as err:
+      self.failedFlushCount += 1
+      logging.error("Error inserting %d rows into Quest DB %s", len(rows), str(err))
+      self._spill(rows)
+
+  def _spill(self, rows):
+    if self.lineWriter == None:
+      logging.error("Dropping %d trade rows, Quest DB is not available", len(rows))
+      return
+    for (ts, strategy, tradingSymbol, tradeId, cmp, entry, pnl, qty, status) in rows:
+      # SYMBOL columns go as tags, ILP has no empty tag value so those stay null
+      tags = {"strategy": strategy, "tradingSymbol": tradingSymbol, "tradeId": tradeId, "status": status}
+      self.lineWriter.write(self.short_code, {name: value for name, value in tags.items() if value},
+        {"cmp": float(cmp), "entry": float(entry), "pnl": float(pnl), "qty": int(qty)}, int(ts.timestamp() * 1000000000))
+
+  def _addRow(self, row):
+    with self.lock:
+      self.rows.append(row)
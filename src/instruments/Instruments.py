@@ -25,7 +25,8 @@ class Instruments:
 
   @staticmethod
   def updateLastSavedTimestamp():
-    timestamps = getTimestampsData()
+    # the cached timestamps are read only
+    timestamps = dict(getTimestampsData())
     timestamps['instrumentsLastSavedAt'] = Utils.getEpoch()
     saveTimestampsData(timestamps)
 
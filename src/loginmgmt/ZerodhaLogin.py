@@ -1,7 +1,7 @@
 import logging
 from kiteconnect import KiteConnect
 
-from config.Config import getSystemConfig
+from config.Config import getServerConfig, getSystemConfig
 from loginmgmt.BaseLogin import BaseLogin
 
 class ZerodhaLogin(BaseLogin):
@@ -11,7 +11,11 @@ class ZerodhaLogin(BaseLogin):
   def login(self, args):
     logging.info('==> ZerodhaLogin .args => %s', args);
     systemConfig = getSystemConfig()
-    brokerHandle = KiteConnect(api_key=self.brokerAppDetails.appKey)
+    # the HTTP session of the handle is shared by every order call of the account, sized for concurrent
+    # order traffic (Ex: all legs of a square off) instead of the default pool of 10 connections
+    poolSize = getServerConfig().get("brokerHTTPPoolSize", 20)
+    brokerHandle = KiteConnect(api_key=self.brokerAppDetails.appKey,
+      pool={"pool_connections": poolSize, "pool_maxsize": poolSize, "max_retries": 0, "pool_block": False})
     self.setBrokerHandle(brokerHandle)
     redirectUrl = None
     if 'request_token' in args:
@@ -10,6 +10,7 @@ from restapis.HomeAPI import HomeAPI
 from restapis.BrokerLoginAPI import BrokerLoginAPI
 from restapis.StartAlgoAPI import StartAlgoAPI
 from restapis.ChartAPI import ChartAPI
+from restapis.TickerStatsAPI import TickerStatsAPI
 
 app = Flask(__name__)
 
@@ -28,6 +29,7 @@ app.add_url_rule("/me/<short_code>", 'home', view_func=HomeAPI.as_view("home_api
 app.add_url_rule("/apis/broker/login/zerodha", view_func=BrokerLoginAPI.as_view("broker_login_api"))
 app.add_url_rule("/apis/algo/start", view_func=StartAlgoAPI.as_view("start_algo_api"))
 app.add_url_rule("/chart/<short_code>", view_func=ChartAPI.as_view("chart_api"))
+app.add_url_rule("/apis/ticker/stats/<short_code>", view_func=TickerStatsAPI.as_view("ticker_stats_api"))
 
 
 def initLoggingConfg(filepath):
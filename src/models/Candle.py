@@ -0,0 +1,14 @@
+class Candle:
+  def __init__(self, tradingSymbol, timeframe):
+    self.tradingSymbol = tradingSymbol
+    self.timeframe = timeframe # in minutes
+    self.startTimestamp = None # datetime of the candle open as per exchange time
+    self.open = 0
+    self.high = 0
+    self.low = 0
+    self.close = 0
+    self.volume = 0
+
+  def __str__(self):
+    return "tradingSymbol=" + str(self.tradingSymbol) + ", timeframe=" + str(self.timeframe) + "m, start=" + str(self.startTimestamp) \
+      + ", open=" + str(self.open) + ", high=" + str(self.high) + ", low=" + str(self.low) + ", close=" + str(self.close) + ", volume=" + str(self.volume)
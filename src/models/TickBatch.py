@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import numpy as np
+
+from models.TickData import TickData
+
+class TickBatch:
+  # A batch of ticks stored in one preallocated NumPy structured array, one row per tick.
+  # slot is the MarketSnapshot slot of the instrument (-1 if unknown), exchangeTimestamp is epoch seconds (0 if not sent)
+  MODE_LTP = 0
+  MODE_QUOTE = 1
+  MODE_FULL = 2
+
+  dtype = np.dtype([
+    ("token", np.uint32),
+    ("slot", np.int64),
+    ("mode", np.int8),
+    ("isIndex", np.bool_),
+    ("ltp", np.float64),
+    ("lastTradedQuantity", np.int64),
+    ("avgTradedPrice", np.float64),
+    ("volume", np.int64),
+    ("totalBuyQuantity", np.int64),
+    ("totalSellQuantity", np.int64),
+    ("open", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("close", np.float64),
+    ("change", np.float64),
+    ("oi", np.int64),
+    ("exchangeTimestamp", np.float64)
+  ])
+
+  def __init__(self, capacity = 512):
+    self.rows = np.zeros(capacity, dtype=TickBatch.dtype)
+    self.count = 0
+
+  def reset(self, count):
+    if count > len(self.rows):
+      self.rows = np.zeros(max(count, 2 * len(self.rows)), dtype=TickBatch.dtype)
+    else:
+      self.rows[:count] = 0
+    self.count = count
+
+  def getRows(self):
+    return self.rows[:self.count]
+
+  def toTickData(self, index, tradingSymbol):
+    # Only used for listeners which still work on TickData objects
+    row = self.rows[index]
+    tick = TickData(tradingSymbol)
+    tick.lastTradedPrice = float(row["ltp"])
+    tick.lastTradedQuantity = int(row["lastTradedQuantity"])
+    tick.avgTradedPrice = float(row["avgTradedPrice"])
+    tick.volume = int(row["volume"])
+    tick.totalBuyQuantity = int(row["totalBuyQuantity"])
+    tick.totalSellQuantity = int(row["totalSellQuantity"])
+    tick.open = float(row["open"])
+    tick.high = float(row["high"])
+    tick.low = float(row["low"])
+    tick.close = float(row["close"])
+    tick.change = float(row["change"])
+    tick.oi = int(row["oi"])
+    tick.mode = int(row["mode"])
+    if row["exchangeTimestamp"] > 0:
+      tick.exchange_timestamp = datetime.fromtimestamp(float(row["exchangeTimestamp"]))
+    return tick
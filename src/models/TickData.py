@@ -13,4 +13,7 @@ class TickData:
     self.low = 0
     self.close = 0
     self.change = 0
+    self.oi = 0
     self.exchange_timestamp = None
+    self.mode = None # models.TickBatch mode of the packet, None when every field was sent
+    self.receivedTime = 0 # epoch seconds when the tick was read from the socket
@@ -0,0 +1,17 @@
+import itertools
+
+# one counter for all objects so a version only ever moves forward, even when orders of a trade are replaced
+versionCounter = itertools.count(1)
+
+class Versioned:
+  # Stamps the object with a new version whenever one of its attributes changes value.
+  # Persistence compares versions to write only what changed since the last save.
+  def __setattr__(self, name, value):
+    current = self.__dict__.get(name, Versioned)
+    # properties stamp through the attribute their setter assigns
+    if current is not value and current != value and not isinstance(getattr(type(self), name, None), property):
+      self.__dict__['_version'] = next(versionCounter)
+    object.__setattr__(self, name, value)
+
+  def getVersion(self):
+    return self.__dict__.get('_version', 0)
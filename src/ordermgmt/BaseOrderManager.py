@@ -5,21 +5,27 @@ class BaseOrderManager:
     self.broker = broker
     self.brokerHandle = brokerHandle
 
-  def placeOrder(self, orderInputParams):
+  def placeOrder(self, orderInputParams, priority = None):
     pass
 
-  def modifyOrder(self, order, orderModifyParams):
+  def modifyOrder(self, order, orderModifyParams, tradeQty, priority = None):
     pass
 
   def modifyOrderToMarket(self, order):
     pass
 
-  def cancelOrder(self, order):
+  def cancelOrder(self, order, priority = None):
     pass
 
   def fetchAndUpdateAllOrderDetails(self, orders):
     pass
 
+  def updateOrderFromBrokerOrder(self, order, bOrder):
+    pass
+
+  def createChildOrder(self, parentOrder, bOrder):
+    pass
+
   def convertToBrokerProductType(self, productType):
     return productType
 
@@ -1,5 +1,6 @@
+from models.Versioned import Versioned
 
-class Order:
+class Order(Versioned):
   def __init__(self, orderInputParams = None):
     self.tradingSymbol = orderInputParams.tradingSymbol if orderInputParams != None else ""
     self.exchange = orderInputParams.exchange if orderInputParams != None else "NSE"
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from collections import deque
+
+class RateLimiter:
+  # Paces the order requests (place/modify/cancel) of one account under the broker limits, shared by every
+  # order manager of the account. Each limit is a bucket of `count` tokens where a used token comes back `window`
+  # seconds after it was taken, so no window ever sees more requests than the broker allows
+  # (Kite: 10 order requests per second and 200 per minute).
+  # Waiting requests are served by priority, exits/SL before modifications before entries, FIFO within a lane.
+  EXIT = 0
+  MODIFY = 1
+  ENTRY = 2
+  LANE_NAMES = ["exit", "modify", "entry"]
+
+  __instances = {}
+  __instancesLock = threading.Lock()
+
+  @staticmethod
+  def getInstance(account):
+    with RateLimiter.__instancesLock:
+      rateLimiter = RateLimiter.__instances.get(account, None)
+      if rateLimiter == None:
+        rateLimiter = RateLimiter(account)
+        RateLimiter.__instances[account] = rateLimiter
+      return rateLimiter
+
+  def __init__(self, account, limits = [(10, 1), (200, 60)]):
+    self.account = account
+    self.limits = limits # (count, window in seconds)
+    self.usedTimes = [deque() for limit in limits] # per limit, times of the requests still inside its window
+    self.condition = threading.Condition()
+    self.lanes = [deque() for name in RateLimiter.LANE_NAMES] # waiting tickets per priority
+    self.acquiredCount = [0 for name in RateLimiter.LANE_NAMES]
+    self.totalWait = [0.0 for name in RateLimiter.LANE_NAMES]
+    self.maxWait = [0.0 for name in RateLimiter.LANE_NAMES]
+    self.lastWait = [0.0 for name in RateLimiter.LANE_NAMES]
+
+  def acquire(self, priority = ENTRY):
+    # blocks until the request may be sent, returns the seconds it waited
+    startTime = time.time()
+    ticket = object()
+    with self.condition:
+      lane = self.lanes[priority]
+      lane.append(ticket)
+      while True:
+        if self._isNext(ticket, priority):
+          waitTime = self._getWaitTime(time.time())
+          if waitTime <= 0:
+            break
+          self.condition.wait(waitTime)
+        else:
+          self.condition.wait()
+      lane.popleft()
+      now = time.time()
+      for usedTimes in self.usedTimes:
+        usedTimes.append(now)
+      waited = now - startTime
+      self.acquiredCount[priority] += 1
+      self.totalWait[priority] += waited
+      self.lastWait[priority] = waited
+      self.maxWait[priority] = max(self.maxWait[priority], waited)
+      # the next waiter may be able to go right away
+      self.condition.notify_all()
+    if waited >= 1:
+      logging.warn('RateLimiter: %s %s request waited %.2f seconds for the broker rate limit',
+        self.account, RateLimiter.LANE_NAMES[priority], waited)
+    return waited
+
+  def markExhausted(self):
+    # the broker rejected a request for its rate (Ex: other apps on the same account), the shortest window is
+    # treated as used up from now on
+    with self.condition:
+      now = time.time()
+      count, window = self.limits[0]
+      self.usedTimes[0].clear()
+      self.usedTimes[0].extend([now] * count)
+
+  def getStats(self):
+    stats = {}
+    with self.condition:
+      for priority, name in enumerate(RateLimiter.LANE_NAMES):
+        count = self.acquiredCount[priority]
+        stats[name] = {
+          "queued": len(self.lanes[priority]),
+          "acquired": count,
+          "avgWaitMs": (self.totalWait[priority] / count * 1000) if count > 0 else 0,
+          "maxWaitMs": self.maxWait[priority] * 1000,
+          "lastWaitMs": self.lastWait[priority] * 1000
+        }
+    return stats
+
+  def _isNext(self, ticket, priority):
+    # the ticket is at the head of its lane and every higher priority lane is empty
+    for lane in self.lanes[:priority]:
+      if len(lane) > 0:
+        return False
+    return self.lanes[priority][0] is ticket
+
+  def _getWaitTime(self, now):
+    waitTime = 0
+    for (count, window), usedTimes in zip(self.limits, self.usedTimes):
+      while len(usedTimes) > 0 and usedTimes[0] <= now - window:
+        usedTimes.popleft()
+      if len(usedTimes) >= count:
+        waitTime = max(waitTime, usedTimes[0] + window - now)
+    return waitTime
@@ -1,8 +1,10 @@
 import logging
+import math
 
 from ordermgmt.BaseOrderManager import BaseOrderManager
 from ordermgmt.Order import Order
 from ordermgmt.OrderInputParams import OrderInputParams
+from ordermgmt.RateLimiter import RateLimiter
 
 from models.ProductType import ProductType
 from models.OrderType import OrderType
@@ -14,16 +16,29 @@ from utils.Utils import Utils
 
 class ZerodhaOrderManager(BaseOrderManager):
   clientID = None
+  MAX_ATTEMPTS = 3 # a request rejected with "Too many requests" is sent again at most twice
+  # statuses Kite reports while a modify or cancel of the order is being processed, not a state of the order
+  TRANSIENT_STATUSES = ["UPDATE", "MODIFIED", "MODIFY PENDING", "MODIFY VALIDATION PENDING", "MODIFY ORDER REQ RECEIVED",
+    "CANCEL PENDING", "CANCEL ORDER REQ RECEIVED"]
 
   def __init__(self, brokerHandle, clientID = None):
     super().__init__("zerodha", brokerHandle)
     self.clientID = clientID
-
-  def placeOrder(self, orderInputParams):
+    # shared by all order managers of the account, they are created again on every login
+    self.rateLimiter = RateLimiter.getInstance(clientID)
+
+  def isRateLimited(self, e, attempt, action, order):
+    # True when the request should be sent again, the rate limiter paces the next attempt
+    if "Too many requests" not in str(e) or attempt >= ZerodhaOrderManager.MAX_ATTEMPTS - 1:
+      return False
+    logging.info('%s:%s retrying order %s for %s, attempt %d', self.broker, self.clientID, action, order, attempt + 2)
+    self.rateLimiter.markExhausted()
+    return True
+
+  def placeOrder(self, orderInputParams, priority = RateLimiter.ENTRY):
     logging.debug('%s:%s:: Going to place order with params %s', self.broker, self.clientID, orderInputParams)
     kite = self.brokerHandle
     orderInputParams.qty = int(orderInputParams.qty)
-    import math
     freeze_limit = 900 if orderInputParams.tradingSymbol.startswith("BANK") else 1800
     lot_size = Instruments.getInstrumentDataBySymbol(orderInputParams.tradingSymbol)['lot_size']
     leg_count = max(math.ceil(orderInputParams.qty/freeze_limit), 2)
@@ -34,36 +49,35 @@ class ZerodhaOrderManager(BaseOrderManager):
     if orderInputParams.qty>freeze_limit and orderInputParams.orderType == OrderType.MARKET:
       orderInputParams.orderType = OrderType.LIMIT
 
-    try:
-      orderId = kite.place_order(
-        variety= kite.VARIETY_REGULAR if orderInputParams.qty<=freeze_limit else kite.VARIETY_ICEBERG,
-        iceberg_legs = iceberg_legs,
-        iceberg_quantity = iceberg_quantity,
-        exchange=kite.EXCHANGE_NFO if orderInputParams.isFnO == True else kite.EXCHANGE_NSE,
-        tradingsymbol=orderInputParams.tradingSymbol,
-        transaction_type=self.convertToBrokerDirection(orderInputParams.direction),
-        quantity=orderInputParams.qty,
-        price=orderInputParams.price,
-        trigger_price=orderInputParams.triggerPrice,
-        product=self.convertToBrokerProductType(orderInputParams.productType),
-        order_type=self.convertToBrokerOrderType(orderInputParams.orderType))
-
-      logging.info('%s:%s:: Order placed successfully, orderId = %s with tag: %s', self.broker, self.clientID, orderId, orderInputParams.tag)
-      order = Order(orderInputParams)
-      order.orderId = orderId
-      order.orderPlaceTimestamp = Utils.getEpoch()
-      order.lastOrderUpdateTimestamp = Utils.getEpoch()
-      return order
-    except Exception as e:
-      if "Too many requests" in str(e):
-        logging.info('%s:%s retrying order placement in 1 s for %s', self.broker, self.clientID, order.orderId)
-        import time
-        time.sleep(1)
-        self.placeOrder(orderInputParams)
-      logging.info('%s:%s Order placement failed: %s', self.broker, self.clientID, str(e))
-      raise Exception(str(e))
-
-  def modifyOrder(self, order, orderModifyParams, tradeQty):
+    for attempt in range(ZerodhaOrderManager.MAX_ATTEMPTS):
+      self.rateLimiter.acquire(priority)
+      try:
+        orderId = kite.place_order(
+          variety= kite.VARIETY_REGULAR if orderInputParams.qty<=freeze_limit else kite.VARIETY_ICEBERG,
+          iceberg_legs = iceberg_legs,
+          iceberg_quantity = iceberg_quantity,
+          exchange=kite.EXCHANGE_NFO if orderInputParams.isFnO == True else kite.EXCHANGE_NSE,
+          tradingsymbol=orderInputParams.tradingSymbol,
+          transaction_type=self.convertToBrokerDirection(orderInputParams.direction),
+          quantity=orderInputParams.qty,
+          price=orderInputParams.price,
+          trigger_price=orderInputParams.triggerPrice,
+          product=self.convertToBrokerProductType(orderInputParams.productType),
+          order_type=self.convertToBrokerOrderType(orderInputParams.orderType))
+
+        logging.info('%s:%s:: Order placed successfully, orderId = %s with tag: %s', self.broker, self.clientID, orderId, orderInputParams.tag)
+        order = Order(orderInputParams)
+        order.orderId = orderId
+        order.orderPlaceTimestamp = Utils.getEpoch()
+        order.lastOrderUpdateTimestamp = Utils.getEpoch()
+        return order
+      except Exception as e:
+        if self.isRateLimited(e, attempt, "placement", orderInputParams.tradingSymbol):
+          continue
+        logging.info('%s:%s Order placement failed: %s', self.broker, self.clientID, str(e))
+        raise Exception(str(e))
+
+  def modifyOrder(self, order, orderModifyParams, tradeQty, priority = RateLimiter.MODIFY):
     logging.debug('%s:%s:: Going to modify order with params %s', self.broker, self.clientID, orderModifyParams)
     
     if order.orderType == OrderType.SL_LIMIT and orderModifyParams.newTriggerPrice == order.triggerPrice:
@@ -78,26 +92,25 @@ class ZerodhaOrderManager(BaseOrderManager):
     kite = self.brokerHandle
     freeze_limit = 900 if order.tradingSymbol.startswith("BANK") else 1800
 
-    try:
-      orderId = kite.modify_order(
-        variety= kite.VARIETY_REGULAR if tradeQty<=freeze_limit else kite.VARIETY_ICEBERG,
-        order_id=order.orderId,
-        quantity=int(orderModifyParams.newQty) if orderModifyParams.newQty > 0 else None,
-        price=orderModifyParams.newPrice if orderModifyParams.newPrice > 0 else None,
-        trigger_price=orderModifyParams.newTriggerPrice if orderModifyParams.newTriggerPrice > 0 else None,
-        order_type=orderModifyParams.newOrderType if orderModifyParams.newOrderType != None else None)
-
-      logging.info('%s:%s Order modified successfully for orderId = %s', self.broker, self.clientID, orderId)
-      order.lastOrderUpdateTimestamp = Utils.getEpoch()
-      return order
-    except Exception as e:
-      if "Too many requests" in str(e):
-        logging.info('%s:%s retrying order modification in 1 s for %s', self.broker, self.clientID, order.orderId)
-        import time
-        time.sleep(1)
-        self.modifyOrder(order, orderModifyParams, tradeQty)
-      logging.info('%s:%s Order %s modify failed: %s', self.broker, self.clientID, order.orderId, str(e))
-      raise Exception(str(e))
+    for attempt in range(ZerodhaOrderManager.MAX_ATTEMPTS):
+      self.rateLimiter.acquire(priority)
+      try:
+        orderId = kite.modify_order(
+          variety= kite.VARIETY_REGULAR if tradeQty<=freeze_limit else kite.VARIETY_ICEBERG,
+          order_id=order.orderId,
+          quantity=int(orderModifyParams.newQty) if orderModifyParams.newQty > 0 else None,
+          price=orderModifyParams.newPrice if orderModifyParams.newPrice > 0 else None,
+          trigger_price=orderModifyParams.newTriggerPrice if orderModifyParams.newTriggerPrice > 0 else None,
+          order_type=orderModifyParams.newOrderType if orderModifyParams.newOrderType != None else None)
+
+        logging.info('%s:%s Order modified successfully for orderId = %s', self.broker, self.clientID, orderId)
+        order.lastOrderUpdateTimestamp = Utils.getEpoch()
+        return order
+      except Exception as e:
+        if self.isRateLimited(e, attempt, "modification", order.orderId):
+          continue
+        logging.info('%s:%s Order %s modify failed: %s', self.broker, self.clientID, order.orderId, str(e))
+        raise Exception(str(e))
 
   def modifyOrderToMarket(self, order):
     raise Exception("Method not to be called")
@@ -116,26 +129,25 @@ class ZerodhaOrderManager(BaseOrderManager):
     #   logging.info('%s:%s Order modify to market failed: %s', self.broker, self.clientID, str(e))
     #   raise Exception(str(e))
 
-  def cancelOrder(self, order):
+  def cancelOrder(self, order, priority = RateLimiter.MODIFY):
     logging.debug('%s:%s Going to cancel order %s', self.broker, self.clientID, order.orderId)
     kite = self.brokerHandle
     freeze_limit = 900 if order.tradingSymbol.startswith("BANK") else 1800
-    try:
-      orderId = kite.cancel_order(
-        variety= kite.VARIETY_REGULAR if order.qty<=freeze_limit else kite.VARIETY_ICEBERG,
-        order_id=order.orderId)
-
-      logging.info('%s:%s Order cancelled successfully, orderId = %s', self.broker, self.clientID, orderId)
-      order.lastOrderUpdateTimestamp = Utils.getEpoch()
-      return order
-    except Exception as e:
-      if "Too many requests" in str(e):
-        logging.info('%s:%s retrying order cancellation in 1 s for %s', self.broker, self.clientID, order.orderId)
-        import time
-        time.sleep(1)
-        self.cancelOrder(order)
-      logging.info('%s:%s Order cancel failed: %s', self.broker, self.clientID, str(e))
-      raise Exception(str(e))
+    for attempt in range(ZerodhaOrderManager.MAX_ATTEMPTS):
+      self.rateLimiter.acquire(priority)
+      try:
+        orderId = kite.cancel_order(
+          variety= kite.VARIETY_REGULAR if order.qty<=freeze_limit else kite.VARIETY_ICEBERG,
+          order_id=order.orderId)
+
+        logging.info('%s:%s Order cancelled successfully, orderId = %s', self.broker, self.clientID, orderId)
+        order.lastOrderUpdateTimestamp = Utils.getEpoch()
+        return order
+      except Exception as e:
+        if self.isRateLimited(e, attempt, "cancellation", order.orderId):
+          continue
+        logging.info('%s:%s Order cancel failed: %s', self.broker, self.clientID, str(e))
+        raise Exception(str(e))
 
   def fetchAndUpdateAllOrderDetails(self, orders):
     logging.debug('%s:%s Going to fetch order book', self.broker, self.clientID)
@@ -150,51 +162,60 @@ class ZerodhaOrderManager(BaseOrderManager):
     logging.debug('%s:%s Order book length = %d', self.broker, self.clientID, len(orderBook))
     numOrdersUpdated = 0
     missingOrders = []
-    
+    # one pass over the order book, orders are looked up by id instead of scanning all of them per broker order
+    ordersById = {}
+    for order in orders.keys():
+      if order.orderId != None:
+        ordersById[order.orderId] = order
+
     for bOrder in orderBook:
-      foundOrder = None
-      foundChildOrder = None
-      parentOrder = None
-      for order in orders.keys():
-        if order.orderId == bOrder['order_id']:
-          foundOrder = order
-        if order.orderId == bOrder['parent_order_id']:
-          foundChildOrder = bOrder
-          parentOrder = order
-          
+      foundOrder = ordersById.get(bOrder['order_id'], None)
       if foundOrder != None:
         logging.debug('Found order for orderId %s', foundOrder.orderId)
-        foundOrder.qty = bOrder['quantity']
-        foundOrder.filledQty = bOrder['filled_quantity']
-        foundOrder.pendingQty = bOrder['pending_quantity']
-        foundOrder.orderStatus = bOrder['status']
-        if foundOrder.orderStatus == OrderStatus.CANCELLED and foundOrder.filledQty > 0:
-          # Consider this case as completed in our system as we cancel the order with pending qty when strategy stop timestamp reaches
-          foundOrder.orderStatus = OrderStatus.COMPLETE
-        foundOrder.price = bOrder['price']
-        foundOrder.triggerPrice = bOrder['trigger_price']
-        foundOrder.averagePrice = bOrder['average_price']
-        foundOrder.lastOrderUpdateTimestamp = bOrder['exchange_update_timestamp']
+        self.updateOrderFromBrokerOrder(foundOrder, bOrder)
         logging.debug('%s:%s:%s Updated order %s', self.broker, self.clientID, orders[foundOrder], foundOrder)
         numOrdersUpdated += 1
-      elif foundChildOrder != None:
-        oip = OrderInputParams(parentOrder.tradingSymbol)
-        oip.exchange = parentOrder.exchange
-        oip.productType = parentOrder.productType
-        oip.orderType = parentOrder.orderType
-        oip.price = parentOrder.price
-        oip.triggerPrice = parentOrder.triggerPrice
-        oip.qty = parentOrder.qty
-        oip.tag = parentOrder.tag
-        oip.productType = parentOrder.productType
-        order = Order(oip)
-        order.orderId = bOrder['order_id']
-        order.parentOrderId = parentOrder.orderId
-        order.orderPlaceTimestamp = Utils.getEpoch() #TODO should get from bOrder
-        missingOrders.append(order)
+        continue
+      parentOrder = ordersById.get(bOrder.get('parent_order_id', None), None)
+      if parentOrder != None:
+        # child (Ex: iceberg leg) of one of our orders which we do not know yet
+        missingOrders.append(self.createChildOrder(parentOrder, bOrder))
       
     return missingOrders
 
+  def createChildOrder(self, parentOrder, bOrder):
+    oip = OrderInputParams(parentOrder.tradingSymbol)
+    oip.exchange = parentOrder.exchange
+    oip.productType = parentOrder.productType
+    oip.orderType = parentOrder.orderType
+    oip.price = parentOrder.price
+    oip.triggerPrice = parentOrder.triggerPrice
+    oip.qty = parentOrder.qty
+    oip.tag = parentOrder.tag
+    oip.productType = parentOrder.productType
+    order = Order(oip)
+    order.orderId = bOrder['order_id']
+    order.parentOrderId = parentOrder.orderId
+    order.orderPlaceTimestamp = Utils.getEpoch() #TODO should get from bOrder
+    return order
+
+  def updateOrderFromBrokerOrder(self, order, bOrder):
+    order.qty = bOrder['quantity']
+    order.filledQty = bOrder['filled_quantity']
+    order.pendingQty = bOrder['pending_quantity']
+    if bOrder['status'] not in ZerodhaOrderManager.TRANSIENT_STATUSES:
+      order.orderStatus = bOrder['status']
+    elif order.orderStatus == None:
+      # Ex: first update of a child order, it is live until the broker says otherwise
+      order.orderStatus = OrderStatus.OPEN
+    if order.orderStatus == OrderStatus.CANCELLED and order.filledQty > 0:
+      # Consider this case as completed in our system as we cancel the order with pending qty when strategy stop timestamp reaches
+      order.orderStatus = OrderStatus.COMPLETE
+    order.price = bOrder['price']
+    order.triggerPrice = bOrder['trigger_price']
+    order.averagePrice = bOrder['average_price']
+    order.lastOrderUpdateTimestamp = bOrder['exchange_update_timestamp']
+
   def convertToBrokerProductType(self, productType):
     kite = self.brokerHandle
     if productType == ProductType.MIS:
@@ -3,6 +3,7 @@ from flask.views import MethodView
 from flask import render_template, request
 from flask import redirect
 from utils.Utils import Utils 
+from dbmgmt.QuestDBPool import QuestDBPool
 
 import logging
 import json
@@ -22,10 +23,11 @@ class ChartAPI(MethodView):
       return redirect("/me/"+short_code, code=302)
     else:
       try:
-        questDBCursor = Utils.getTradeManager(short_code).questDBCursor
-        if questDBCursor is not None:
-          df = pd.read_sql_query("select * from %(short_code)s where ts > to_timestamp(%(dstart)s, 'yyyy-MM-dd HH:mm:ss')", 
-                    con = questDBCursor.connection, params = {"short_code" : short_code, "dstart" : date.today().strftime("%Y-%m-%d %H:%M:%S")})
+        questDBPool = QuestDBPool.getInstance(short_code)
+        if questDBPool.isAvailable():
+          with questDBPool.connection() as questDBCursor:
+            df = pd.read_sql_query("select * from \"{0}\" where ts > to_timestamp(%(dstart)s, 'yyyy-MM-dd HH:mm:ss')".format(short_code), 
+                      con = questDBCursor.connection, params = {"dstart" : date.today().strftime("%Y-%m-%d %H:%M:%S")})
 
           if not df.empty:
 
@@ -16,9 +16,12 @@ class HomeAPI(MethodView):
       return render_template('index.html')
     else:
       trademanager = Utils.getTradeManager(short_code)
+      # one consistent copy of the live market snapshot for the whole page
+      marketView = trademanager.marketSnapshot.getView() if trademanager is not None else {}
       return render_template('index_algostarted.html', strategies = trademanager.strategyToInstanceMap.values() if trademanager is not None else {}, 
-                                                        ltps = trademanager.symbolToCMPMap if trademanager is not None else {},
-                                                        totalBuys = trademanager.symboltoTotalBuy if trademanager is not None else {},
-                                                        totalSells = trademanager.symboltoTotalSell if trademanager is not None else {},
+                                                        ltps = marketView.get("ltps", {}),
+                                                        totalBuys = marketView.get("totalBuys", {}),
+                                                        totalSells = marketView.get("totalSells", {}),
+                                                        exchangeTimestamp = marketView.get("exchangeTimestamp", None),
                                                         algoStarted = True if trademanager is not None else False,
                                                         margins = Controller.getBrokerLogin(short_code).getBrokerHandle().margins() if Controller.getBrokerLogin(short_code) is not None else {})
\ No newline at end of file
@@ -0,0 +1,15 @@
+from flask.views import MethodView
+import json
+from utils.Utils import Utils
+
+class TickerStatsAPI(MethodView):
+  def get(self, short_code):
+    tradeManager = Utils.getTradeManager(short_code)
+    if tradeManager == None or tradeManager.ticker == None:
+      return json.dumps({"error": "Ticker not running for " + short_code}), 404
+    stats = tradeManager.ticker.getLatencyStats()
+    stats["questDBWriter"] = tradeManager.tickWriter.getStats() if tradeManager.tickWriter != None else None
+    stats["tradePersister"] = tradeManager.tradePersister.getStats() if tradeManager.tradePersister != None else None
+    stats["orderRateLimiter"] = tradeManager.orderManager.rateLimiter.getStats() if getattr(tradeManager.orderManager, "rateLimiter", None) != None else None
+    stats["legExecutor"] = tradeManager.legExecutor.getStats() if tradeManager.legExecutor != None else None
+    return json.dumps(stats)
@@ -157,7 +157,7 @@ class BaseStrategy:
       if waitSeconds > 0:
         time.sleep(waitSeconds) 
 
-    if self.getVIXThreshold() > Utils.getTradeManager(self.short_code).symbolToCMPMap["INDIA VIX"]:
+    if self.getVIXThreshold() > Utils.getTradeManager(self.short_code).getLastTradedPrice("INDIA VIX"):
       Utils.getTradeManager(self.short_code).deRgisterStrategy(self)
       logging.warn("%s: Not going to conitnue strategy as VIX threshold is not met today.", self.getName())
       return
@@ -204,6 +204,15 @@ class BaseStrategy:
     if trade != None:
       self.trades.append(trade)
 
+  def onCandleClose(self, candle):
+    # Called by TradeManager on the tick thread whenever a candle (models.Candle) closes, override to act on candles
+    # without polling. Keep it quick, no broker or DB calls here.
+    pass
+
+  def getCandles(self, tradingSymbol, timeframe, count = None):
+    # closed candles of the given timeframe (in minutes), oldest first
+    return Utils.getTradeManager(self.short_code).getCandles(tradingSymbol, timeframe, count)
+
   def getQuote(self, tradingSymbol):
     try :
       return Quotes.getQuote(tradingSymbol, self.short_code, self.isFnO)
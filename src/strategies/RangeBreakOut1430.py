@@ -48,6 +48,11 @@ class RangeBreakOut1430(BaseStrategy):
     if now < self.startTimestamp or not self.isEnabled():
       return
 
+    if now > self.stopTimestamp:
+      # no new trades from here on
+      self.stopTracking([self.ITMCESymbol])
+      return
+
     if len(self.trades) >= self.maxTradesPerDay or not self.isEnabled():
       return
     
@@ -69,14 +74,15 @@ class RangeBreakOut1430(BaseStrategy):
 
       #register symbols with ticker to track
       Utils.getTradeManager(self.short_code).registerTradingSymbolToTrack([self.ITMCESymbol])
+      Utils.getTradeManager(self.short_code).registerRangeToTrack([self.ITMCESymbol], self.startTimestamp, self.rangeBreakOutTimestamp)
 
     elif now >= self.rangeBreakOutTimestamp:
 
       if self.ITMCESymbol is not None and len(self.ceTrades) == 0:
 
         #Get Highest CE price
-        highestCEPrice = Utils.getHighestPrice(self.short_code, self.startTimestamp, 
-                                              self.rangeBreakOutTimestamp, self.ITMCESymbol)
+        highestCEPrice, lowestCEPrice = Utils.getTradeManager(self.short_code).getRange(self.ITMCESymbol, self.startTimestamp,
+                                                                                      self.rangeBreakOutTimestamp)
         if highestCEPrice is not None:
           quote = self.getQuote(self.ITMCESymbol)
           if quote.lastTradedPrice > highestCEPrice:
@@ -84,6 +90,19 @@ class RangeBreakOut1430(BaseStrategy):
           # Place CE trade
           logging.info("Place CE trade for %s at price %d", self.ITMCESymbol, highestCEPrice + 0.5)
           self.generateTrade(self.ITMCESymbol, Direction.LONG, int(self.getLots()), highestCEPrice + 0.5, placeMarketOrder=False)
+          if len(self.ceTrades) > 0:
+            # range is captured, the trade keeps its own subscription from here on
+            self.stopTracking([self.ITMCESymbol])
+
+  def stopTracking(self, tradingSymbols):
+    # the ticks and the range of the symbols are not needed anymore
+    tradingSymbols = [tradingSymbol for tradingSymbol in tradingSymbols if tradingSymbol is not None]
+    Utils.getTradeManager(self.short_code).unregisterTradingSymbolToTrack(tradingSymbols)
+    Utils.getTradeManager(self.short_code).unregisterRangeToTrack(tradingSymbols, self.startTimestamp, self.rangeBreakOutTimestamp)
+
+  def setDisabled(self):
+    super().setDisabled()
+    self.stopTracking([self.ITMCESymbol])
 
   def addTradeToList(self, trade):
     if trade != None:
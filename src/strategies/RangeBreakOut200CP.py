@@ -48,6 +48,11 @@ class RangeBreakOut200CP(BaseStrategy):
     if now < self.startTimestamp or not self.isEnabled():
       return
 
+    if now > self.stopTimestamp:
+      # no new trades from here on
+      self.stopTracking([self.CESymbol, self.PESymbol])
+      return
+
     if len(self.trades) >= self.maxTradesPerDay or not self.isEnabled():
       return
     
@@ -65,20 +70,18 @@ class RangeBreakOut200CP(BaseStrategy):
 
       #register symbols with ticker to track
       Utils.getTradeManager(self.short_code).registerTradingSymbolToTrack([self.CESymbol, self.PESymbol])
+      Utils.getTradeManager(self.short_code).registerRangeToTrack([self.CESymbol, self.PESymbol], self.startTimestamp, self.rangeBreakOutTimestamp)
 
     elif now >= self.rangeBreakOutTimestamp:
 
       if self.CESymbol is not None and len(self.ceTrades) == 0:
 
-        #Get Highest CE price
-        highestCEPrice = Utils.getHighestPrice(self.short_code, self.startTimestamp, 
-                                              self.rangeBreakOutTimestamp, self.CESymbol)
-        lowestCEPrice = Utils.getLowestPrice(self.short_code, self.startTimestamp,
-                                              self.rangeBreakOutTimestamp, self.CESymbol)
-        
-        CERange = highestCEPrice - lowestCEPrice
+        #Get Highest and Lowest CE price
+        highestCEPrice, lowestCEPrice = Utils.getTradeManager(self.short_code).getRange(self.CESymbol, self.startTimestamp,
+                                                                                      self.rangeBreakOutTimestamp)
 
-        if highestCEPrice is not None:
+        if highestCEPrice is not None and lowestCEPrice is not None:
+          CERange = highestCEPrice - lowestCEPrice
           quote = self.getQuote(self.CESymbol)
           if quote.lastTradedPrice > highestCEPrice:
             highestCEPrice = quote.lastTradedPrice + 0.5
@@ -86,16 +89,17 @@ class RangeBreakOut200CP(BaseStrategy):
           logging.info("Place CE trade for %s at price %d", self.CESymbol, highestCEPrice + 0.5)
           self.generateTrade(self.CESymbol, Direction.LONG, int(self.getLots()), highestCEPrice + 0.5, placeMarketOrder=False, \
                              slPrice=highestCEPrice + 0.5 - 0.5 * CERange, targetPrice=highestCEPrice + 0.5 + 2 * CERange)
+          if len(self.ceTrades) > 0:
+            # range is captured, the trade keeps its own subscription from here on
+            self.stopTracking([self.CESymbol])
           
       if self.PESymbol is not None and len(self.peTrades) == 0:
 
-        highestPEPrice = Utils.getHighestPrice(self.short_code, self.startTimestamp,
-                                              self.rangeBreakOutTimestamp, self.PESymbol)
-        lowestPEPrice = Utils.getLowestPrice(self.short_code, self.startTimestamp,
-                                              self.rangeBreakOutTimestamp, self.PESymbol)
-        PERange = highestPEPrice - lowestPEPrice
+        highestPEPrice, lowestPEPrice = Utils.getTradeManager(self.short_code).getRange(self.PESymbol, self.startTimestamp,
+                                                                                      self.rangeBreakOutTimestamp)
 
-        if highestPEPrice is not None:
+        if highestPEPrice is not None and lowestPEPrice is not None:
+          PERange = highestPEPrice - lowestPEPrice
           quote = self.getQuote(self.PESymbol)
           if quote.lastTradedPrice > highestPEPrice:
             highestPEPrice = quote.lastTradedPrice + 0.5
@@ -103,6 +107,18 @@ class RangeBreakOut200CP(BaseStrategy):
           logging.info("Place PE trade for %s at price %d", self.PESymbol, highestPEPrice + 0.5)
           self.generateTrade(self.PESymbol, Direction.LONG, int(self.getLots()), highestPEPrice + 0.5, placeMarketOrder=False, \
                               slPrice=highestPEPrice + 0.5 - 0.5 * PERange, targetPrice=highestPEPrice + 0.5 + 2 * PERange)
+          if len(self.peTrades) > 0:
+            self.stopTracking([self.PESymbol])
+
+  def stopTracking(self, tradingSymbols):
+    # the ticks and the range of the symbols are not needed anymore
+    tradingSymbols = [tradingSymbol for tradingSymbol in tradingSymbols if tradingSymbol is not None]
+    Utils.getTradeManager(self.short_code).unregisterTradingSymbolToTrack(tradingSymbols)
+    Utils.getTradeManager(self.short_code).unregisterRangeToTrack(tradingSymbols, self.startTimestamp, self.rangeBreakOutTimestamp)
+
+  def setDisabled(self):
+    super().setDisabled()
+    self.stopTracking([self.CESymbol, self.PESymbol])
 
   def addTradeToList(self, trade):
     if trade != None:
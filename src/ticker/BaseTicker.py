@@ -1,14 +1,33 @@
 import logging
+import threading
+import time
 
 from core.Controller import Controller
+from ticker.TickDispatcher import TickDispatcher
+from ticker.TickLatencyTracker import TickLatencyTracker
 
 class BaseTicker:
+  # tick modes in increasing order of payload, a symbol is streamed in the highest mode any of its owners asks for
+  MODE_LTP = "ltp"
+  MODE_QUOTE = "quote"
+  MODE_FULL = "full"
+
   def __init__(self, broker, short_code):
     self.short_code = short_code
     self.broker = broker
     self.brokerLogin = Controller.getBrokerLogin(short_code)
     self.ticker = None
-    self.tickListeners = []
+    self.tickListeners = [] # listeners interested in every tick
+    self.symbolToListeners = {} # routing table tradingSymbol -> listeners interested only in those symbols
+    self.predicateListeners = [] # (listener, predicate) pairs, predicate is called with the tradingSymbol
+    self.listenersLock = threading.Lock()
+    self.marketSnapshot = None # written on ingest, before ticks reach the dispatcher or the listeners
+    self.tickStores = [] # Ex: candles, ranges. Updated on ingest right after the market snapshot
+    self.tickDispatcher = None
+    self.latencyTracker = TickLatencyTracker(short_code)
+    self.orderUpdateListeners = [] # called with the broker order update, on the websocket thread
+    self.connected = False
+    self.connectCount = 0 # a new count means order updates may have been missed while disconnected
 
   def startTicker(self):
     pass
@@ -16,29 +35,174 @@ class BaseTicker:
   def stopTicker(self):
     pass
 
-  def registerListener(self, listener):
-    # All registered tick listeners will be notified on new ticks
-    self.tickListeners.append(listener)
+  def setMarketSnapshot(self, marketSnapshot):
+    self.marketSnapshot = marketSnapshot
+
+  def addTickStore(self, tickStore):
+    # tickStore has to implement updateFromTick(tick) and updateBatch(batch), see core.CandleAggregator
+    self.tickStores = self.tickStores + [tickStore]
+
+  def startDispatcher(self, capacity = 10000):
+    # Optional mode: websocket thread only enqueues ticks, listeners are called from a dispatcher thread
+    if self.tickDispatcher != None:
+      return
+    self.tickDispatcher = TickDispatcher(self.short_code + "_TickDispatcher", self.dispatchTicks, capacity)
+    self.tickDispatcher.start()
+
+  def stopDispatcher(self):
+    if self.tickDispatcher == None:
+      return
+    self.tickDispatcher.stop()
+    self.tickDispatcher = None
+
+  def getDispatcherStats(self):
+    if self.tickDispatcher == None:
+      return None
+    return self.tickDispatcher.getStats()
+
+  def getLatencyStats(self):
+    stats = self.latencyTracker.getStats()
+    stats["dispatcher"] = self.getDispatcherStats()
+    return stats
+
+  def registerListener(self, listener, symbols = None, predicate = None):
+    # Without symbols/predicate the listener is notified on every new tick, else only on the ticks it cares about
+    with self.listenersLock:
+      if symbols == None and predicate == None:
+        self.tickListeners = self.tickListeners + [listener]
+      elif predicate != None:
+        self.predicateListeners = self.predicateListeners + [(listener, predicate)]
+    if symbols != None:
+      self.addListenerSymbols(listener, symbols)
+
+  def addListenerSymbols(self, listener, symbols):
+    # routing lists are replaced, never mutated, so dispatch can read them without the lock
+    with self.listenersLock:
+      for symbol in symbols:
+        listeners = self.symbolToListeners.get(symbol, [])
+        if listener not in listeners:
+          self.symbolToListeners[symbol] = listeners + [listener]
+
+  def removeListenerSymbols(self, listener, symbols):
+    with self.listenersLock:
+      for symbol in symbols:
+        listeners = [l for l in self.symbolToListeners.get(symbol, []) if l != listener]
+        if len(listeners) > 0:
+          self.symbolToListeners[symbol] = listeners
+        else:
+          self.symbolToListeners.pop(symbol, None)
+
+  def unregisterListener(self, listener):
+    with self.listenersLock:
+      self.tickListeners = [l for l in self.tickListeners if l != listener]
+      self.predicateListeners = [(l, p) for (l, p) in self.predicateListeners if l != listener]
+      for symbol in list(self.symbolToListeners.keys()):
+        listeners = [l for l in self.symbolToListeners[symbol] if l != listener]
+        if len(listeners) > 0:
+          self.symbolToListeners[symbol] = listeners
+        else:
+          del self.symbolToListeners[symbol]
 
-  def registerSymbols(self, symbols):
+  def registerOrderUpdateListener(self, listener):
+    with self.listenersLock:
+      self.orderUpdateListeners = self.orderUpdateListeners + [listener]
+
+  def isConnected(self):
+    return self.connected
+
+  def getConnectCount(self):
+    return self.connectCount
+
+  def hasListeners(self, tradingSymbol):
+    if len(self.tickListeners) > 0 or tradingSymbol in self.symbolToListeners:
+      return True
+    for (listener, predicate) in self.predicateListeners:
+      if predicate(tradingSymbol):
+        return True
+    return False
+
+  def getListeners(self, tradingSymbol):
+    routedListeners = self.symbolToListeners.get(tradingSymbol, [])
+    if len(self.tickListeners) == 0 and len(self.predicateListeners) == 0:
+      return routedListeners
+    listeners = self.tickListeners + routedListeners
+    for (listener, predicate) in self.predicateListeners:
+      if predicate(tradingSymbol) and listener not in listeners:
+        listeners.append(listener)
+    return listeners
+
+  def registerSymbols(self, symbols, mode = None, owner = None):
+    # registering again with the same owner only changes the mode that owner needs,
+    # returns the symbols that could not be subscribed (Ex: broker limit of instruments per connection)
+    return []
+
+  def unregisterSymbols(self, symbols, owner = None):
     pass
 
-  def unregisterSymbols(self, symbols):
+  def flushSubscriptions(self):
     pass
 
-  def onNewTicks(self, ticks):
+  def onNewTicks(self, ticks, receivedTime = None):
     # logging.info('New ticks received %s', ticks)
+    self.latencyTracker.recordReceive(ticks, receivedTime if receivedTime != None else time.time())
+    if self.marketSnapshot != None:
+      for tick in ticks:
+        self.marketSnapshot.updateFromTick(tick)
+    for tickStore in self.tickStores:
+      for tick in ticks:
+        tickStore.updateFromTick(tick)
+    ticks = [tick for tick in ticks if self.hasListeners(tick.tradingSymbol)]
+    if len(ticks) > 0:
+      self.publishTicks(ticks)
+
+  def onNewTickBatch(self, batch, receivedTime = None):
+    receivedTime = receivedTime if receivedTime != None else time.time()
+    # batch is a models.TickBatch produced by a binary parser, the snapshot is updated in one vectorised write
+    if self.marketSnapshot != None:
+      self.marketSnapshot.updateBatch(batch)
+    for tickStore in self.tickStores:
+      tickStore.updateBatch(batch)
+    # TickData objects are only built for ticks which some listener is interested in
+    ticks = []
+    for i in range(batch.count):
+      slot = batch.rows[i]["slot"]
+      if slot < 0:
+        continue
+      tradingSymbol = self.marketSnapshot.getSymbol(slot)
+      if self.hasListeners(tradingSymbol):
+        ticks.append(batch.toTickData(i, tradingSymbol))
+    self.latencyTracker.recordReceive(ticks, receivedTime)
+    if len(ticks) > 0:
+      self.publishTicks(ticks)
+
+  def publishTicks(self, ticks):
+    if self.tickDispatcher != None:
+      self.tickDispatcher.enqueue(ticks)
+    else:
+      self.dispatchTicks(ticks)
+
+  def dispatchTicks(self, ticks):
+    latencyTracker = self.latencyTracker
     for tick in ticks:
-      for listener in self.tickListeners:
+      startTime = time.time()
+      latencyTracker.recordDispatch(tick, startTime)
+      for listener in self.getListeners(tick.tradingSymbol):
         try:
           listener(tick)
         except Exception as e:
           logging.error('BaseTicker: Exception from listener callback function. Error => %s', str(e))
+        endTime = time.time()
+        latencyTracker.recordListener(listener, tick, startTime, endTime)
+        startTime = endTime
+    latencyTracker.logSummaryIfDue()
 
   def onConnect(self):
+    self.connected = True
+    self.connectCount += 1
     logging.info('Ticker connection successful.')
 
   def onDisconnect(self, code, reason):
+    self.connected = False
     logging.error('Ticker got disconnected. code = %d, reason = %s', code, reason)
 
   def onError(self, code, reason):
@@ -48,8 +212,13 @@ class BaseTicker:
     logging.warn('Ticker reconnecting.. attemptsCount = %d', attemptsCount)
 
   def onMaxReconnectsAttempt(self):
+    self.connected = False
     logging.error('Ticker max auto reconnects attempted and giving up..')
 
   def onOrderUpdate(self, data):
     #logging.info('Ticker: order update %s', data)
-    pass
+    for listener in self.orderUpdateListeners:
+      try:
+        listener(data)
+      except Exception as e:
+        logging.error('Ticker: Exception in order update listener for order %s. Error => %s', data.get('order_id', None), str(e))
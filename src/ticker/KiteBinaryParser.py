@@ -0,0 +1,124 @@
+import struct
+
+import numpy as np
+
+from models.TickBatch import TickBatch
+
+class KiteBinaryParser:
+  # Parses raw KiteTicker binary frames straight into a preallocated TickBatch.
+  # Frame layout: int16 number of packets, then for every packet int16 length followed by the packet.
+  # All packet fields are big endian int32, prices are in paise (or the segment specific divisor).
+  LTP_PACKET = 8
+  INDEX_QUOTE_PACKET = 28
+  INDEX_FULL_PACKET = 32
+  QUOTE_PACKET = 44
+  FULL_PACKET = 184
+
+  SEGMENT_CDS = 3
+  SEGMENT_BCD = 6
+  SEGMENT_INDICES = 9
+
+  def __init__(self, capacity = 512):
+    self.batch = TickBatch(capacity)
+    self.offsets = np.zeros(capacity, dtype=np.int64)
+    self.lengths = np.zeros(capacity, dtype=np.int64)
+    self.tokenToSlot = {}
+    self.knownTokens = np.zeros(0, dtype=np.uint32)
+    self.knownSlots = np.zeros(0, dtype=np.int64)
+    self.byteIndex = np.arange(64, dtype=np.int64) # full packets are only read up to the exchange timestamp, depth is skipped
+    self.shortStruct = struct.Struct('>H')
+
+  def registerToken(self, token, slot):
+    if self.tokenToSlot.get(token, None) == slot:
+      return
+    self.tokenToSlot[token] = slot
+    tokens = np.array(sorted(self.tokenToSlot.keys()), dtype=np.uint32)
+    slots = np.array([self.tokenToSlot[int(t)] for t in tokens], dtype=np.int64)
+    # swap both arrays in one go so the websocket thread never sees a half updated lookup table
+    self.knownTokens, self.knownSlots = tokens, slots
+
+  def parse(self, payload):
+    numPackets = self.shortStruct.unpack_from(payload, 0)[0]
+    if numPackets > len(self.offsets):
+      self.offsets = np.zeros(max(numPackets, 2 * len(self.offsets)), dtype=np.int64)
+      self.lengths = np.zeros(len(self.offsets), dtype=np.int64)
+
+    offset = 2
+    for i in range(numPackets):
+      length = self.shortStruct.unpack_from(payload, offset)[0]
+      self.offsets[i] = offset + 2
+      self.lengths[i] = length
+      offset += 2 + length
+
+    batch = self.batch
+    batch.reset(numPackets)
+    if numPackets == 0:
+      return batch
+
+    raw = np.frombuffer(payload, dtype=np.uint8)
+    offsets = self.offsets[:numPackets]
+    lengths = self.lengths[:numPackets]
+    rows = batch.rows
+
+    for packetLength in [KiteBinaryParser.LTP_PACKET, KiteBinaryParser.INDEX_QUOTE_PACKET, KiteBinaryParser.INDEX_FULL_PACKET,
+        KiteBinaryParser.QUOTE_PACKET, KiteBinaryParser.FULL_PACKET]:
+      index = np.flatnonzero(lengths == packetLength)
+      if index.size == 0:
+        continue
+      numBytes = min(packetLength, 64)
+      words = raw[offsets[index, None] + self.byteIndex[:numBytes]].view('>u4').astype(np.int64)
+      self._fillRows(rows, index, words, packetLength)
+
+    tokens = rows["token"][:numPackets]
+    position = np.searchsorted(self.knownTokens, tokens)
+    position = np.minimum(position, max(len(self.knownTokens) - 1, 0))
+    if len(self.knownTokens) > 0:
+      found = self.knownTokens[position] == tokens
+      rows["slot"][:numPackets] = np.where(found, self.knownSlots[position], -1)
+    else:
+      rows["slot"][:numPackets] = -1
+    return batch
+
+  def _fillRows(self, rows, index, words, packetLength):
+    tokens = words[:, 0]
+    segments = tokens & 0xff
+    divisor = np.where(segments == KiteBinaryParser.SEGMENT_CDS, 10000000.0,
+      np.where(segments == KiteBinaryParser.SEGMENT_BCD, 10000.0, 100.0))
+    rows["token"][index] = tokens
+    rows["isIndex"][index] = segments == KiteBinaryParser.SEGMENT_INDICES
+    rows["ltp"][index] = words[:, 1] / divisor
+
+    if packetLength == KiteBinaryParser.LTP_PACKET:
+      rows["mode"][index] = TickBatch.MODE_LTP
+      return
+
+    if packetLength in [KiteBinaryParser.INDEX_QUOTE_PACKET, KiteBinaryParser.INDEX_FULL_PACKET]:
+      rows["high"][index] = words[:, 2] / divisor
+      rows["low"][index] = words[:, 3] / divisor
+      rows["open"][index] = words[:, 4] / divisor
+      close = words[:, 5] / divisor
+      if packetLength == KiteBinaryParser.INDEX_FULL_PACKET:
+        rows["mode"][index] = TickBatch.MODE_FULL
+        rows["exchangeTimestamp"][index] = words[:, 7]
+      else:
+        rows["mode"][index] = TickBatch.MODE_QUOTE
+    else:
+      rows["lastTradedQuantity"][index] = words[:, 2]
+      rows["avgTradedPrice"][index] = words[:, 3] / divisor
+      rows["volume"][index] = words[:, 4]
+      rows["totalBuyQuantity"][index] = words[:, 5]
+      rows["totalSellQuantity"][index] = words[:, 6]
+      rows["open"][index] = words[:, 7] / divisor
+      rows["high"][index] = words[:, 8] / divisor
+      rows["low"][index] = words[:, 9] / divisor
+      close = words[:, 10] / divisor
+      if packetLength == KiteBinaryParser.FULL_PACKET:
+        rows["mode"][index] = TickBatch.MODE_FULL
+        rows["oi"][index] = words[:, 12]
+        rows["exchangeTimestamp"][index] = words[:, 15]
+      else:
+        rows["mode"][index] = TickBatch.MODE_QUOTE
+
+    rows["close"][index] = close
+    ltp = rows["ltp"][index]
+    rows["change"][index] = np.where(close != 0, (ltp - close) * 100 / np.where(close != 0, close, 1), 0)
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import numpy as np
+
+class LatencyHistogram:
+  # HDR style histogram of latencies in microseconds. Values below 32us get their own bucket, above that every
+  # power of two is split into 16 linear sub buckets, so any recorded value is off by at most ~6% and recording is O(1).
+  # Counts roll over every windowSeconds, stats cover the previous and the current window.
+  SUB_BUCKETS = 16
+  NUM_BUCKETS = 2 * SUB_BUCKETS + 32 * SUB_BUCKETS
+
+  def __init__(self, windowSeconds = 60):
+    self.windowSeconds = windowSeconds
+    self.lock = threading.Lock()
+    self.current = np.zeros(LatencyHistogram.NUM_BUCKETS, dtype=np.int64)
+    self.previous = np.zeros(LatencyHistogram.NUM_BUCKETS, dtype=np.int64)
+    self.windowStart = time.time()
+    self.totalCount = 0
+    self.maxValue = 0
+
+  def record(self, seconds):
+    micros = int(seconds * 1000000)
+    if micros < 0:
+      micros = 0
+    index = LatencyHistogram.bucketIndex(micros)
+    with self.lock:
+      self._rotate()
+      self.current[index] += 1
+      self.totalCount += 1
+      if micros > self.maxValue:
+        self.maxValue = micros
+
+  def getStats(self):
+    # percentiles are reported in milliseconds
+    with self.lock:
+      self._rotate()
+      counts = self.current + self.previous
+      totalCount = self.totalCount
+      maxValue = self.maxValue
+    count = int(counts.sum())
+    stats = {"count": count, "totalCount": totalCount, "maxEverMs": maxValue / 1000.0}
+    if count == 0:
+      return stats
+    cumulative = np.cumsum(counts)
+    for name, percentile in [("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9)]:
+      index = int(np.searchsorted(cumulative, count * percentile / 100.0))
+      stats[name + "Ms"] = min(LatencyHistogram.bucketUpperValue(index), maxValue) / 1000.0
+    nonEmpty = np.flatnonzero(counts)
+    stats["minMs"] = LatencyHistogram.bucketLowerValue(int(nonEmpty[0])) / 1000.0
+    stats["maxMs"] = min(LatencyHistogram.bucketUpperValue(int(nonEmpty[-1])), maxValue) / 1000.0
+    return stats
+
+  def _rotate(self):
+    # called with the lock held
+    now = time.time()
+    elapsed = now - self.windowStart
+    if elapsed < self.windowSeconds:
+      return
+    if elapsed < 2 * self.windowSeconds:
+      self.previous = self.current
+    else:
+      self.previous = np.zeros(LatencyHistogram.NUM_BUCKETS, dtype=np.int64)
+    self.current = np.zeros(LatencyHistogram.NUM_BUCKETS, dtype=np.int64)
+    self.windowStart = now
+
+  @staticmethod
+  def bucketIndex(micros):
+    if micros < 2 * LatencyHistogram.SUB_BUCKETS:
+      return micros
+    shift = micros.bit_length() - 5
+    index = 2 * LatencyHistogram.SUB_BUCKETS + (shift - 1) * LatencyHistogram.SUB_BUCKETS + ((micros >> shift) - LatencyHistogram.SUB_BUCKETS)
+    return min(index, LatencyHistogram.NUM_BUCKETS - 1)
+
+  @staticmethod
+  def bucketLowerValue(index):
+    if index < 2 * LatencyHistogram.SUB_BUCKETS:
+      return index
+    shift = (index - 2 * LatencyHistogram.SUB_BUCKETS) // LatencyHistogram.SUB_BUCKETS + 1
+    subBucket = (index - 2 * LatencyHistogram.SUB_BUCKETS) % LatencyHistogram.SUB_BUCKETS + LatencyHistogram.SUB_BUCKETS
+    return subBucket << shift
+
+  @staticmethod
+  def bucketUpperValue(index):
+    if index < 2 * LatencyHistogram.SUB_BUCKETS:
+      return index
+    shift = (index - 2 * LatencyHistogram.SUB_BUCKETS) // LatencyHistogram.SUB_BUCKETS + 1
+    return LatencyHistogram.bucketLowerValue(index) + (1 << shift) - 1
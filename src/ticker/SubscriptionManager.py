@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+
+class SubscriptionManager:
+  # Reference counts instrument subscriptions per owner (a trade, a strategy, the tracker etc) and
+  # batches the resulting subscribe / mode / unsubscribe changes into one websocket message each per flush.
+  # A token is unsubscribed as soon as its last owner releases it. Every owner asks for a mode and the token
+  # is streamed in the cheapest mode that satisfies all of them, so it is upgraded and downgraded as owners come and go.
+  MAX_TOKENS = 3000 # Kite allows 3000 instruments per websocket connection, tokens above it are refused
+  MODE_RANK = {"ltp": 0, "quote": 1, "full": 2}
+
+  def __init__(self, name, subscribe, unsubscribe, setMode, flushInterval = 0.5):
+    self.name = name
+    self.subscribe = subscribe
+    self.unsubscribe = unsubscribe
+    self.setMode = setMode
+    self.flushInterval = flushInterval
+    self.lock = threading.Lock()
+    self.flushLock = threading.Lock() # one flush at a time, held while talking to the websocket
+    self.tokenToOwners = {} # token -> {owner: mode requested by the owner}
+    self.subscribedTokens = {} # token -> mode currently set on the websocket
+    self.pendingTokens = set() # tokens changed since the last flush
+    self.flushEvent = threading.Event()
+    self.flushThread = None
+
+  def start(self):
+    if self.flushThread != None:
+      return
+    self.flushThread = threading.Thread(target=self._run, name=self.name, daemon=True)
+    self.flushThread.start()
+
+  def addOwner(self, tokens, owner, mode):
+    # returns the tokens refused because the connection already has MAX_TOKENS, the owner does not own them
+    refused = []
+    with self.lock:
+      for token in tokens:
+        owners = self.tokenToOwners.get(token, None)
+        if owners == None:
+          if len(self.tokenToOwners) >= SubscriptionManager.MAX_TOKENS:
+            refused.append(token)
+            continue
+          owners = {}
+          self.tokenToOwners[token] = owners
+        if owners.get(owner, None) == mode:
+          continue
+        owners[owner] = mode
+        self.pendingTokens.add(token)
+    if len(refused) > 0:
+      logging.error('%s: Refused %d tokens for %s, %d tokens are the limit per connection. Refused => %s', self.name,
+        len(refused), owner, SubscriptionManager.MAX_TOKENS, refused)
+    self.flushEvent.set()
+    return refused
+
+  def removeOwner(self, tokens, owner):
+    with self.lock:
+      for token in tokens:
+        owners = self.tokenToOwners.get(token, None)
+        if owners == None or owner not in owners:
+          continue
+        del owners[owner]
+        if len(owners) == 0:
+          del self.tokenToOwners[token]
+        self.pendingTokens.add(token)
+    self.flushEvent.set()
+
+  def isSubscribed(self, token):
+    return token in self.tokenToOwners
+
+  def getOwners(self, token):
+    return dict(self.tokenToOwners.get(token, {}))
+
+  def getMode(self, token):
+    return self.subscribedTokens.get(token, None)
+
+  def getEffectiveMode(self, token):
+    owners = self.tokenToOwners.get(token, None)
+    if owners == None or len(owners) == 0:
+      return None
+    return max(owners.values(), key=lambda mode: SubscriptionManager.MODE_RANK.get(mode, 0))
+
+  def getSubscribedCount(self):
+    return len(self.subscribedTokens)
+
+  def flush(self):
+    # the changes are worked out under the lock, the websocket calls are made after releasing it so
+    # addOwner/removeOwner never wait on network I/O
+    with self.flushLock:
+      with self.lock:
+        if len(self.pendingTokens) == 0:
+          return
+        toSubscribe = []
+        toUnsubscribe = []
+        modeToTokens = {}
+        for token in self.pendingTokens:
+          wantedMode = self.getEffectiveMode(token)
+          currentMode = self.subscribedTokens.get(token, None)
+          if wantedMode == None:
+            if token in self.subscribedTokens:
+              toUnsubscribe.append(token)
+            continue
+          if token not in self.subscribedTokens:
+            toSubscribe.append(token)
+          if wantedMode != currentMode:
+            modeToTokens.setdefault(wantedMode, []).append(token)
+        self.pendingTokens = set()
+
+      try:
+        # released tokens go first so the connection never holds more than MAX_TOKENS
+        if len(toUnsubscribe) > 0:
+          logging.info('%s: Unsubscribing tokens %s', self.name, toUnsubscribe)
+          self.unsubscribe(toUnsubscribe)
+        if len(toSubscribe) > 0:
+          logging.debug('%s: Subscribing tokens %s', self.name, toSubscribe)
+          self.subscribe(toSubscribe)
+        for mode in modeToTokens:
+          logging.debug('%s: Setting mode %s for tokens %s', self.name, mode, modeToTokens[mode])
+          self.setMode(mode, modeToTokens[mode])
+      except Exception as e:
+        # retry the same changes on the next flush
+        with self.lock:
+          self.pendingTokens.update(toSubscribe)
+          self.pendingTokens.update(toUnsubscribe)
+          for mode in modeToTokens:
+            self.pendingTokens.update(modeToTokens[mode])
+        logging.error('%s: Failed to update subscriptions. Error => %s', self.name, str(e))
+        self.flushEvent.set()
+        return
+
+      with self.lock:
+        for mode in modeToTokens:
+          for token in modeToTokens[mode]:
+            self.subscribedTokens[token] = mode
+        for token in toUnsubscribe:
+          self.subscribedTokens.pop(token, None)
+
+  def _run(self):
+    while True:
+      self.flushEvent.wait()
+      self.flushEvent.clear()
+      self.flush()
+      # changes arriving within the interval go out together in the next flush
+      time.sleep(self.flushInterval)
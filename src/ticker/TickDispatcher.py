@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from collections import deque
+
+class TickDispatcher(threading.Thread):
+  # Decouples tick listeners from the websocket thread. The websocket callback only enqueues ticks into
+  # a bounded ring buffer, this thread drains it and keeps only the latest tick per symbol when it falls behind
+  def __init__(self, name, dispatch, capacity = 10000):
+    super(TickDispatcher, self).__init__(name=name, daemon=True)
+    self.dispatch = dispatch
+    self.capacity = max(int(capacity), 1)
+    self.buffer = deque()
+    self.condition = threading.Condition()
+    self.running = True
+    self.enqueuedCount = 0
+    self.dispatchedCount = 0
+    self.conflatedCount = 0 # older ticks replaced by a newer tick of the same symbol
+    self.droppedCount = 0 # ticks lost because the buffer was full even after conflation
+    self.maxQueueDepth = 0
+    self.lastDropLogTime = 0
+
+  def stop(self):
+    with self.condition:
+      self.running = False
+      self.condition.notify()
+
+  def enqueue(self, ticks):
+    with self.condition:
+      for tick in ticks:
+        if len(self.buffer) >= self.capacity:
+          self._conflateBuffer()
+        if len(self.buffer) >= self.capacity:
+          self.buffer.popleft()
+          self.droppedCount += 1
+        self.buffer.append(tick)
+      self.enqueuedCount += len(ticks)
+      self.maxQueueDepth = max(self.maxQueueDepth, len(self.buffer))
+      self.condition.notify()
+
+  def run(self):
+    logging.info('TickDispatcher: %s started with capacity %d', self.getName(), self.capacity)
+    while True:
+      with self.condition:
+        while self.running and len(self.buffer) == 0:
+          self.condition.wait(1)
+        if not self.running:
+          break
+        pending = self.buffer
+        self.buffer = deque()
+      if len(pending) > self.capacity // 2:
+        # behind by more than half the buffer, only the latest tick of each symbol is worth dispatching
+        ticks = self._latestTickPerSymbol(pending)
+        self.conflatedCount += len(pending) - len(ticks)
+      else:
+        ticks = list(pending)
+      self._logDrops()
+      try:
+        self.dispatch(ticks)
+      except Exception as e:
+        logging.error('TickDispatcher: Exception while dispatching ticks. Error => %s', str(e))
+      self.dispatchedCount += len(ticks)
+    logging.info('TickDispatcher: %s stopped', self.getName())
+
+  def getQueueDepth(self):
+    return len(self.buffer)
+
+  def getStats(self):
+    return {
+      "queueDepth": len(self.buffer),
+      "maxQueueDepth": self.maxQueueDepth,
+      "capacity": self.capacity,
+      "enqueued": self.enqueuedCount,
+      "dispatched": self.dispatchedCount,
+      "conflated": self.conflatedCount,
+      "dropped": self.droppedCount
+    }
+
+  def _conflateBuffer(self):
+    # called with the condition held when the ring buffer is full
+    ticks = self._latestTickPerSymbol(self.buffer)
+    self.conflatedCount += len(self.buffer) - len(ticks)
+    self.buffer = deque(ticks)
+
+  def _latestTickPerSymbol(self, ticks):
+    latestTicks = {}
+    for tick in ticks:
+      # keep the position of the first tick of the symbol but the data of the last one
+      latestTicks[tick.tradingSymbol] = tick
+    return list(latestTicks.values())
+
+  def _logDrops(self):
+    if self.droppedCount == 0:
+      return
+    now = time.time()
+    if now - self.lastDropLogTime >= 60:
+      self.lastDropLogTime = now
+      logging.warn('TickDispatcher: %s is falling behind, dropped %d ticks so far. Stats => %s',
+        self.getName(), self.droppedCount, self.getStats())
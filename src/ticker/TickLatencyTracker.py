@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+
+from instruments.Instruments import Instruments
+from ticker.LatencyHistogram import LatencyHistogram
+
+class TickLatencyTracker:
+  # Latency of the tick pipeline. Every tick carries its socket receive time, from which we measure
+  #   exchange    : exchange timestamp -> socket receive (only for ticks with an exchange timestamp)
+  #   queue       : socket receive -> dispatch start (time spent in the dispatcher queue)
+  #   listener    : time spent inside each listener callback
+  #   endToEnd    : socket receive -> listener completion, per listener and per symbol class
+  def __init__(self, name, logIntervalSeconds = 60):
+    self.name = name
+    self.logIntervalSeconds = logIntervalSeconds
+    self.lastLogTime = time.time()
+    self.lock = threading.Lock()
+    self.stageHistograms = {"exchange": LatencyHistogram(), "queue": LatencyHistogram()}
+    self.listenerHistograms = {} # listener -> {"listener": histogram, "endToEnd": histogram}
+    self.symbolClassHistograms = {} # symbol class -> histogram
+    self.symbolToClass = {}
+
+  def recordReceive(self, ticks, receivedTime):
+    for tick in ticks:
+      tick.receivedTime = receivedTime
+      if tick.exchange_timestamp != None:
+        self.stageHistograms["exchange"].record(receivedTime - tick.exchange_timestamp.timestamp())
+
+  def recordDispatch(self, tick, dispatchStartTime):
+    if tick.receivedTime > 0:
+      self.stageHistograms["queue"].record(dispatchStartTime - tick.receivedTime)
+
+  def recordListener(self, listener, tick, startTime, endTime):
+    histograms = self.listenerHistograms.get(listener, None)
+    if histograms == None:
+      histograms = self._createListenerHistograms(listener)
+    histograms["listener"].record(endTime - startTime)
+    if tick.receivedTime > 0:
+      histograms["endToEnd"].record(endTime - tick.receivedTime)
+      self._getSymbolClassHistogram(tick.tradingSymbol).record(endTime - tick.receivedTime)
+
+  def getStats(self):
+    return {
+      "stages": dict((stage, histogram.getStats()) for stage, histogram in self.stageHistograms.items()),
+      "listeners": dict((TickLatencyTracker.getListenerName(listener), dict((key, histogram.getStats()) for key, histogram in histograms.items()))
+        for listener, histograms in list(self.listenerHistograms.items())),
+      "symbolClasses": dict((symbolClass, histogram.getStats()) for symbolClass, histogram in list(self.symbolClassHistograms.items()))
+    }
+
+  def logSummaryIfDue(self):
+    now = time.time()
+    if now - self.lastLogTime < self.logIntervalSeconds:
+      return
+    self.lastLogTime = now
+    stats = self.getStats()
+    for stage, stageStats in stats["stages"].items():
+      self._logHistogram("stage " + stage, stageStats)
+    for listenerName, listenerStats in stats["listeners"].items():
+      for key, histogramStats in listenerStats.items():
+        self._logHistogram("listener " + listenerName + " " + key, histogramStats)
+    for symbolClass, classStats in stats["symbolClasses"].items():
+      self._logHistogram("symbols " + symbolClass + " endToEnd", classStats)
+
+  def _logHistogram(self, label, stats):
+    if stats["count"] == 0:
+      return
+    logging.info('TickLatency: %s %s => count = %d, p50 = %.3fms, p99 = %.3fms, max = %.3fms', self.name, label,
+      stats["count"], stats["p50Ms"], stats["p99Ms"], stats["maxMs"])
+
+  def _createListenerHistograms(self, listener):
+    with self.lock:
+      histograms = self.listenerHistograms.get(listener, None)
+      if histograms == None:
+        histograms = {"listener": LatencyHistogram(), "endToEnd": LatencyHistogram()}
+        self.listenerHistograms[listener] = histograms
+      return histograms
+
+  def _getSymbolClassHistogram(self, tradingSymbol):
+    symbolClass = self.symbolToClass.get(tradingSymbol, None)
+    if symbolClass == None:
+      symbolClass = TickLatencyTracker.getSymbolClass(tradingSymbol)
+      self.symbolToClass[tradingSymbol] = symbolClass
+    histogram = self.symbolClassHistograms.get(symbolClass, None)
+    if histogram == None:
+      with self.lock:
+        histogram = self.symbolClassHistograms.setdefault(symbolClass, LatencyHistogram())
+    return histogram
+
+  @staticmethod
+  def getSymbolClass(tradingSymbol):
+    try:
+      isd = Instruments.getInstrumentDataBySymbol(tradingSymbol)
+    except Exception:
+      return "OTHER"
+    if isd['segment'] == "INDICES":
+      return "INDEX"
+    if isd.get('instrument_type', None) in ["CE", "PE"]:
+      return "OPTION"
+    if isd.get('instrument_type', None) == "FUT":
+      return "FUTURE"
+    return "EQUITY"
+
+  @staticmethod
+  def getListenerName(listener):
+    return getattr(listener, '__qualname__', str(listener))
@@ -1,17 +1,24 @@
 import logging
 import json
+import time
 
 from kiteconnect import KiteTicker
 
+from core.MarketSnapshot import MarketSnapshot
 from ticker.BaseTicker import BaseTicker
+from ticker.KiteBinaryParser import KiteBinaryParser
+from ticker.SubscriptionManager import SubscriptionManager
 from instruments.Instruments import Instruments
+from models.TickBatch import TickBatch
 from models.TickData import TickData
 
 class ZerodhaTicker(BaseTicker):
   def __init__(self, short_code):
     super().__init__("zerodha", short_code)
+    self.binaryParser = None
+    self.subscriptionManager = None
 
-  def startTicker(self, appKey, accessToken):
+  def startTicker(self, appKey, accessToken, binaryTicks = False):
     if accessToken == None:
       logging.error('ZerodhaTicker startTicker: Cannot start ticker as accessToken is empty')
       return
@@ -22,30 +29,45 @@ class ZerodhaTicker(BaseTicker):
     ticker.on_error = self.on_error
     ticker.on_reconnect = self.on_reconnect
     ticker.on_noreconnect = self.on_noreconnect
-    ticker.on_ticks = self.on_ticks
+    if binaryTicks == True:
+      # parse raw frames ourselves, KiteTicker skips its own dict parsing when on_ticks is not set
+      if self.marketSnapshot == None:
+        self.setMarketSnapshot(MarketSnapshot())
+      self.binaryParser = KiteBinaryParser()
+      ticker.on_message = self.on_message
+    else:
+      ticker.on_ticks = self.on_ticks
     ticker.on_order_update = self.on_order_update
 
     logging.info('ZerodhaTicker: Going to connect..')
     self.ticker = ticker
+    self.subscriptionManager = SubscriptionManager(self.short_code + "_Subscriptions",
+      ticker.subscribe, ticker.unsubscribe, ticker.set_mode)
+    self.subscriptionManager.start()
     self.ticker.connect(threaded=True)
 
   def stopTicker(self):
     logging.info('ZerodhaTicker: stopping..')
     self.ticker.close(1000, "Manual close")
+    self.stopDispatcher()
 
-  def registerSymbols(self, symbols, mode = KiteTicker.MODE_QUOTE):
+  def registerSymbols(self, symbols, mode = KiteTicker.MODE_QUOTE, owner = "default"):
+    # Subscriptions are reference counted per owner and sent to the websocket in batches
     tokens = []
     for symbol in symbols:
       isd = Instruments.getInstrumentDataBySymbol(symbol)
       token = isd['instrument_token']
       logging.debug('ZerodhaTicker registerSymbol: %s token = %s', symbol, token)
       tokens.append(token)
+      if self.binaryParser != None:
+        self.binaryParser.registerToken(token, self.marketSnapshot.getSlot(symbol))
 
-    logging.debug('ZerodhaTicker Subscribing tokens %s', tokens)
-    self.ticker.subscribe(tokens)
-    self.ticker.set_mode(mode, tokens)
+    logging.debug('ZerodhaTicker Subscribing tokens %s for %s', tokens, owner)
+    refusedTokens = self.subscriptionManager.addOwner(tokens, owner, mode)
+    # symbols not subscribed as the connection is full
+    return [symbol for symbol, token in zip(symbols, tokens) if token in refusedTokens]
 
-  def unregisterSymbols(self, symbols):
+  def unregisterSymbols(self, symbols, owner = "default"):
     tokens = []
     for symbol in symbols:
       isd = Instruments.getInstrumentDataBySymbol(symbol)
@@ -53,23 +75,36 @@ class ZerodhaTicker(BaseTicker):
       logging.debug('ZerodhaTicker unregisterSymbols: %s token = %s', symbol, token)
       tokens.append(token)
 
-    logging.info('ZerodhaTicker Unsubscribing tokens %s', tokens)
-    self.ticker.unsubscribe(tokens)
+    logging.debug('ZerodhaTicker Unsubscribing tokens %s for %s', tokens, owner)
+    self.subscriptionManager.removeOwner(tokens, owner)
+
+  def flushSubscriptions(self):
+    self.subscriptionManager.flush()
 
   def on_ticks(self, ws, brokerTicks):
     # convert broker specific Ticks to our system specific Ticks (models.TickData) and pass to super class function
+    receivedTime = time.time()
     ticks = []
     for bTick in brokerTicks:
       isd = Instruments.getInstrumentDataByToken(bTick['instrument_token'])
       tradingSymbol = isd['tradingsymbol']
       tick = TickData(tradingSymbol)
       tick.lastTradedPrice = bTick['last_price']
+      if bTick.get('mode', None) == KiteTicker.MODE_LTP:
+        # ltp mode packets carry nothing else
+        tick.mode = TickBatch.MODE_LTP
+        ticks.append(tick)
+        continue
       if not isd['segment'] == "INDICES":
         tick.lastTradedQuantity = bTick['last_traded_quantity']
         tick.avgTradedPrice = bTick['average_traded_price']
         tick.volume = bTick['volume_traded']
         tick.totalBuyQuantity = bTick['total_buy_quantity']
         tick.totalSellQuantity = bTick['total_sell_quantity']
+        tick.oi = bTick.get('oi', 0)
+        if bTick.get('mode', None) == KiteTicker.MODE_QUOTE:
+          # quote mode packets carry no oi
+          tick.mode = TickBatch.MODE_QUOTE
       else:
         tick.exchange_timestamp = bTick['exchange_timestamp']
       tick.open = bTick['ohlc']['open']
@@ -79,7 +114,19 @@ class ZerodhaTicker(BaseTicker):
       tick.change = bTick['change']
       ticks.append(tick)
       
-    self.onNewTicks(ticks)
+    self.onNewTicks(ticks, receivedTime)
+
+  def on_message(self, ws, payload, isBinary):
+    # binary ticks mode only, heartbeats are single byte frames
+    if not isBinary or len(payload) <= 4:
+      return
+    receivedTime = time.time()
+    try:
+      batch = self.binaryParser.parse(payload)
+    except Exception as e:
+      logging.error('ZerodhaTicker: Failed to parse binary frame of %d bytes. Error => %s', len(payload), str(e))
+      return
+    self.onNewTickBatch(batch, receivedTime)
 
   def on_connect(self, ws, response):
     self.onConnect()
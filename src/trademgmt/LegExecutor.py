@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class LegResult:
+  # outcome of one leg of an action, times are seconds from the start of the action
+  def __init__(self, leg, legName, startTime, endTime, result = None, error = None):
+    self.leg = leg
+    self.legName = legName
+    self.startTime = startTime # when the leg started being sent
+    self.endTime = endTime # when the broker calls of the leg returned
+    self.result = result
+    self.error = error
+
+  def isSuccess(self):
+    return self.error == None
+
+  def __str__(self):
+    return "leg=" + str(self.legName) + ", start=" + str(round(self.startTime * 1000)) + "ms, end=" + str(round(self.endTime * 1000)) \
+      + "ms, error=" + str(self.error)
+
+class LegExecutor:
+  # Sends all legs of a strategy action (Ex: square off of the CE and PE legs) at once through a bounded thread
+  # pool, so the last leg does not go out seconds after the first one. The order requests of the legs are still
+  # paced by the RateLimiter of the account. A failed leg never stops the other legs, every leg gets a LegResult
+  # and the caller decides what to do with the failed ones.
+  # Each leg must only touch its own trade, the caller does the shared bookkeeping once the legs are back.
+  def __init__(self, name, maxWorkers = 8):
+    self.name = name
+    self.pool = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix=name)
+    self.lock = threading.Lock()
+    self.actionCount = 0
+    self.legCount = 0
+    self.failedLegCount = 0
+    self.maxStartSpread = 0
+    self.lastReport = None
+
+  def execute(self, action, legs, legFunction, legName = str):
+    # calls legFunction(leg) for every leg, returns the LegResult of every leg in the order of legs
+    if len(legs) == 0:
+      return []
+    startTime = time.time()
+    if len(legs) == 1:
+      # nothing to overlap with, no thread hop
+      results = [self._runLeg(legFunction, legs[0], legName, startTime)]
+    else:
+      futures = [self.pool.submit(self._runLeg, legFunction, leg, legName, startTime) for leg in legs]
+      results = [future.result() for future in futures]
+    self._report(action, results, time.time() - startTime)
+    return results
+
+  def getStats(self):
+    with self.lock:
+      return {
+        "actions": self.actionCount,
+        "legs": self.legCount,
+        "failedLegs": self.failedLegCount,
+        "maxStartSpreadMs": self.maxStartSpread * 1000,
+        "lastAction": self.lastReport
+      }
+
+  def _runLeg(self, legFunction, leg, legName, startTime):
+    legStartTime = time.time() - startTime
+    try:
+      result = legFunction(leg)
+    except Exception as e:
+      return LegResult(leg, legName(leg), legStartTime, time.time() - startTime, error = e)
+    return LegResult(leg, legName(leg), legStartTime, time.time() - startTime, result)
+
+  def _report(self, action, results, totalTime):
+    failed = [result for result in results if not result.isSuccess()]
+    # how far apart the first and the last leg went out, the time we carry a partial position
+    startSpread = max([result.startTime for result in results]) - min([result.startTime for result in results])
+    slowest = max(results, key = lambda result: result.endTime - result.startTime)
+    report = {
+      "action": action,
+      "legs": len(results),
+      "failed": len(failed),
+      "totalMs": totalTime * 1000,
+      "startSpreadMs": startSpread * 1000,
+      "slowestLeg": slowest.legName,
+      "slowestLegMs": (slowest.endTime - slowest.startTime) * 1000,
+      "legResults": [{"leg": result.legName, "startMs": result.startTime * 1000, "endMs": result.endTime * 1000,
+        "error": str(result.error) if result.error != None else None} for result in results]
+    }
+    with self.lock:
+      self.actionCount += 1
+      self.legCount += len(results)
+      self.failedLegCount += len(failed)
+      self.maxStartSpread = max(self.maxStartSpread, startSpread)
+      self.lastReport = report
+    logging.info('LegExecutor: %s %s: %d legs in %.0f ms, start spread %.0f ms, slowest leg %s %.0f ms, %d failed',
+      self.name, action, len(results), totalTime * 1000, startSpread * 1000, slowest.legName,
+      (slowest.endTime - slowest.startTime) * 1000, len(failed))
+    for result in failed:
+      logging.error('LegExecutor: %s %s failed for leg %s: Error => %s', self.name, action, result.legName, str(result.error))
@@ -4,8 +4,9 @@ from datetime import datetime, timedelta
 
 from trademgmt.TradeState import TradeState
 from models.ProductType import ProductType
+from models.Versioned import Versioned
 
-class Trade:
+class Trade(Versioned):
   def __init__(self, tradingSymbol = None, strategy = ""):
     self.exchange = "NSE" 
     self.tradeID = ((strategy + ":")  if not strategy == "" else "") + str(uuid.uuid4())# Unique ID for each trade
@@ -52,6 +53,13 @@ class Trade:
   def stopLoss(self, stoploss):
     self._stopLoss = stoploss
 
+  def getVersion(self):
+    # the trade changes with any of its orders
+    version = Versioned.getVersion(self)
+    for order in self.entryOrder + self.slOrder + self.targetOrder:
+      version = max(version, order.getVersion())
+    return version
+
   def equals(self, trade): # compares to trade objects and returns True if equals
     if trade == None:
       return False
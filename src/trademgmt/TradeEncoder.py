@@ -3,4 +3,5 @@ from json import JSONEncoder
 
 class TradeEncoder(JSONEncoder):
   def default(self, o):
-    return o.__dict__
\ No newline at end of file
+    # _version is bookkeeping of models.Versioned, not trade data
+    return {name: value for name, value in o.__dict__.items() if name != '_version'}
\ No newline at end of file
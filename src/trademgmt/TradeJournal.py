@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import threading
+import time
+
+class TradeJournal:
+  # Append only journal of trade state changes, one compact json line with the full trade per change.
+  # Lines are written and flushed right away so they survive a crash of the process, fsync is batched by a
+  # background thread every syncInterval seconds. The journal is split into segments, rotate() starts a new one
+  # before a snapshot of all trades is written and the segments the snapshot covers are removed after it.
+  # Replaying the records on top of the snapshot is idempotent, the last record of a trade wins.
+  SEGMENT_PREFIX = "journal-"
+  SEGMENT_SUFFIX = ".jsonl"
+
+  def __init__(self, journalDir, name, syncInterval = 0.1):
+    self.journalDir = journalDir
+    self.syncInterval = syncInterval
+    self.lock = threading.Lock()
+    self.activeFile = None
+    self.unsynced = False
+    self.appendCount = 0
+    self.syncCount = 0
+    if os.path.exists(self.journalDir) == False:
+      os.makedirs(self.journalDir)
+    self.activeSequence = self._findLastSequence() + 1
+    self.syncThread = threading.Thread(target=self._run, name=name + "_TradeJournal", daemon=True)
+    self.syncThread.start()
+
+  def append(self, tradeJSON):
+    line = json.dumps(tradeJSON, separators=(',', ':')) + "\n"
+    with self.lock:
+      if self.activeFile == None:
+        self.activeFile = open(self._segmentPath(self.activeSequence), 'a')
+      self.activeFile.write(line)
+      self.activeFile.flush()
+      self.unsynced = True
+      self.appendCount += 1
+
+  def rotate(self):
+    # closes the active segment, later appends go to a new one. Returns the sequence of the new segment.
+    with self.lock:
+      self._closeSegment()
+      self.activeSequence += 1
+      return self.activeSequence
+
+  def removeSegmentsBefore(self, sequence):
+    for segmentSequence in self._listSequences():
+      if segmentSequence < sequence:
+        os.remove(self._segmentPath(segmentSequence))
+
+  def replay(self):
+    # all records of all segments, oldest first. A partial last line left by a crash is skipped.
+    records = []
+    for segmentSequence in self._listSequences():
+      with open(self._segmentPath(segmentSequence), 'r') as segmentFile:
+        for line in segmentFile:
+          try:
+            records.append(json.loads(line))
+          except ValueError:
+            logging.warn('TradeJournal: Skipping incomplete record in segment %d', segmentSequence)
+    return records
+
+  def getStats(self):
+    return {
+      "activeSegment": self.activeSequence,
+      "appends": self.appendCount,
+      "syncs": self.syncCount
+    }
+
+  def _run(self):
+    while True:
+      time.sleep(self.syncInterval)
+      try:
+        with self.lock:
+          if self.unsynced and self.activeFile != None:
+            os.fsync(self.activeFile.fileno())
+            self.unsynced = False
+            self.syncCount += 1
+      except Exception as e:
+        logging.error('TradeJournal: Failed to sync journal %s. Error => %s', self.journalDir, str(e))
+
+  def _closeSegment(self):
+    if self.activeFile == None:
+      return
+    self.activeFile.flush()
+    os.fsync(self.activeFile.fileno())
+    self.activeFile.close()
+    self.activeFile = None
+    self.unsynced = False
+
+  def _segmentPath(self, sequence):
+    return os.path.join(self.journalDir, "%s%010d%s" % (TradeJournal.SEGMENT_PREFIX, sequence, TradeJournal.SEGMENT_SUFFIX))
+
+  def _listSequences(self):
+    sequences = []
+    for name in os.listdir(self.journalDir):
+      if name.startswith(TradeJournal.SEGMENT_PREFIX) and name.endswith(TradeJournal.SEGMENT_SUFFIX):
+        try:
+          sequences.append(int(name[len(TradeJournal.SEGMENT_PREFIX):-len(TradeJournal.SEGMENT_SUFFIX)]))
+        except ValueError:
+          pass
+    return sorted(sequences)
+
+  def _findLastSequence(self):
+    sequences = self._listSequences()
+    return sequences[-1] if len(sequences) > 0 else 0
@@ -1,33 +1,44 @@
-import json
 import logging
 import os
 import time
 import traceback
 
+from collections import deque
 from datetime import datetime
-from threading import Thread
+from threading import Event, Lock, Thread
 
 import pymongo
 
 from config.Config import getBrokerAppConfig, getServerConfig
+from core.CandleAggregator import CandleAggregator
 from core.Controller import Controller
+from core.MarketSnapshot import MarketSnapshot
+from core.RangeTracker import RangeTracker
+from dbmgmt.LineProtocolSpool import LineProtocolSpool
+from dbmgmt.QuestDBLineWriter import QuestDBLineWriter
+from dbmgmt.QuestDBPool import QuestDBPool
+from dbmgmt.TradeSnapshotWriter import TradeSnapshotWriter
 from models.Direction import Direction
 from models.OrderStatus import OrderStatus
 from models.OrderType import OrderType
 from ordermgmt.OrderInputParams import OrderInputParams
 from ordermgmt.OrderModifyParams import OrderModifyParams
+from ordermgmt.RateLimiter import RateLimiter
 from ordermgmt.ZerodhaOrderManager import ZerodhaOrderManager
+from ticker.BaseTicker import BaseTicker
 from ticker.ZerodhaTicker import ZerodhaTicker
 from utils.Utils import Utils
 
 import datetime
 from datetime import datetime
-import pandas as pd
-import numpy as np
 
-from trademgmt.TradeEncoder import TradeEncoder
 from trademgmt.TradeExitReason import TradeExitReason
+from trademgmt.TradeJournal import TradeJournal
+from trademgmt.TradePersister import TradePersister
+from trademgmt.LegExecutor import LegExecutor
+from trademgmt.TradeSnapshot import TradeSnapshot
 from trademgmt.TradeState import TradeState
+from trademgmt.TriggerBook import TriggerBook
 
 
 class TradeManager(Thread):
@@ -38,18 +49,34 @@ class TradeManager(Thread):
         self._accessToken, self.algoConfig, = args
         self.ticker = None
         self.trades = []  # to store all the trades
+        self.triggerBook = TriggerBook()  # untriggered trades indexed by symbol
+        self.tickRouteLock = Lock()
         self.strategyToInstanceMap = {}
-        self.symbolToCMPMap = {}
-        self.symboltoTotalSell = {}
-        self.symboltoTotalBuy = {}
+        self.marketSnapshot = MarketSnapshot()  # ltp, buy/sell qty, volume, oi of every ticking symbol
+        self.candleAggregator = None
+        self.rangeTracker = RangeTracker(self.marketSnapshot, name)
+        self.tickWriter = None
+        self.snapshotWriter = TradeSnapshotWriter(name)
         self.intradayTradesDir = None
-        self.registeredSymbols = []
-        self.trackTradingSymbols = []
+        self.trackTradingSymbols = set()
+        self.submittedVersions = {}  # tradeID -> trade version last handed to the persister
+        self.snapshotRows = {}  # tradeID -> (version, encoded trade) as last written to the snapshot
+        self.tradeJournal = None
+        self.tradePersister = None
+        self.journaledVersions = {}  # tradeID -> trade version last journaled
+        self.snapshotPending = False
+        self.lastSnapshotTime = 0
+        self.orderUpdates = deque()  # (received time, broker order update) pushed by the ticker
+        self.unmatchedOrderUpdates = {}  # orderId -> (received time, update) for orders not known yet
+        self.orderUpdateEvent = Event()
+        self.orderIndex = {}  # orderId -> (order, trade, name of the order list holding it)
+        self.lastOrderReconcileTime = 0
+        self.lastTickerConnectCount = 0
+        self.orderManager = None
+        self.legExecutor = None
+        self.failedSquareOffs = {}  # tradeID -> (trade, reason) of legs whose square off failed, tried again next cycle
         self.isReady = False
 
-        self.candleTime = {}
-        self.tickStore = {}
-
     def run(self):
         dburi = 'mongodb://{}:{}@localhost:27017/{}'.format(getBrokerAppConfig(self.getName())['broker'].lower()
                                                             + "_"+getBrokerAppConfig(self.getName())['clientID'], getBrokerAppConfig(self.getName())['appSecret'], self.getName())
@@ -63,7 +90,18 @@ class TradeManager(Thread):
             print("Can't connect to Mongodb server")
             self.dbTrades = None
 
-        self.questDBCursor = Utils.getQuestDBConnection(self.getName())
+        # creates the QuestDB tables once and keeps connections ready in the background
+        QuestDBPool.getInstance(self.getName())
+
+        # tick data goes to QuestDB over ILP in batches, off the tick thread
+        serverConfig = getServerConfig()
+        self.tickWriter = QuestDBLineWriter(self.getName() + "_QuestDBWriter",
+            serverConfig.get("questDBHost", "127.0.0.1"), serverConfig.get("questDBILPPort", 9009),
+            serverConfig.get("questDBILPProtocol", "tcp"), serverConfig.get("questDBWriterCapacity", 100000))
+        # writes QuestDB can not take right now are spooled to disk and replayed when it is back
+        self.tickWriter.setSpool(LineProtocolSpool(os.path.join(serverConfig['deployDir'], 'spool', self.getName())))
+        self.tickWriter.start()
+        self.snapshotWriter.setLineWriter(self.tickWriter)
 
         Utils.waitTillMarketOpens("TradeManager")
         # check and create trades directory for today`s date
@@ -75,6 +113,17 @@ class TradeManager(Thread):
             logging.info('TradeManager: Intraday Trades Directory %s does not exist. Hence going to create.',
                          self.intradayTradesDir)
             os.makedirs(self.intradayTradesDir)
+        # every trade state change is journaled, the trades file is only a periodic snapshot
+        self.tradeJournal = TradeJournal(self.getJournalDir(), self.getName())
+        # Mongo and the trades snapshot are written off the loop
+        self.tradePersister = TradePersister(self.getName() + "_TradePersister", self.dbTrades,
+            self.getTradesFilepath(), self.tradeJournal)
+        self.tradePersister.start()
+        # legs of a strategy action are sent to the broker together
+        self.legExecutor = LegExecutor(self.getName() + "_LegExecutor", serverConfig.get("legExecutorWorkers", 8))
+
+        # created once here, order placement must not pay for it
+        self.getOrderManager(self.getName())
 
         # start ticker service
         brokerName = getBrokerAppConfig(self.getName())['broker']
@@ -83,8 +132,16 @@ class TradeManager(Thread):
         # elif brokerName == "fyers" # not implemented
         # ticker = FyersTicker()
 
+        # the ticker keeps the market snapshot and the candles updated before ticks reach any listener
+        self.ticker.setMarketSnapshot(self.marketSnapshot)
+        self.candleAggregator = CandleAggregator(self.marketSnapshot,
+            getBrokerAppConfig(self.getName()).get("candleTimeframes", [1, 3, 5, 15]))
+        self.candleAggregator.addCandleListener(self.candleListener)
+        self.ticker.addTickStore(self.candleAggregator)
+        self.ticker.addTickStore(self.rangeTracker)
         self.ticker.startTicker(
-            getBrokerAppConfig(self.getName())['appKey'], self._accessToken)
+            getBrokerAppConfig(self.getName())['appKey'], self._accessToken,
+            getBrokerAppConfig(self.getName()).get("binaryTicks", False) == True)
         
 
         # sleep for 2 seconds for ticker connection establishment
@@ -92,12 +149,22 @@ class TradeManager(Thread):
             logging.warn('Waiting for ticker connection establishment..')
             time.sleep(2)
         
-        self.ticker.registerListener(self.tickerListener)
+        if getBrokerAppConfig(self.getName()).get("tickDispatcher", False) == True:
+            # listeners run on a separate thread so order placement never blocks the websocket
+            self.ticker.startDispatcher(
+                getBrokerAppConfig(self.getName()).get("tickQueueSize", 10000))
 
-        self.ticker.registerSymbols(["NIFTY 50", "NIFTY BANK", "INDIA VIX", "NIFTY FIN SERVICE"], mode = "full")
+        # tickerListener is only routed the symbols it needs, see updateTickRoute()
+        self.ticker.registerListener(self.tickerListener, symbols=[])
+        # order updates are pushed over the websocket, the order book poll is only a safety net
+        self.ticker.registerOrderUpdateListener(self.orderUpdateListener)
+
+        self.ticker.registerSymbols(["NIFTY 50", "NIFTY BANK", "INDIA VIX", "NIFTY FIN SERVICE"], mode = BaseTicker.MODE_FULL, owner = "TradeManager")
 
         # Load all trades from json files to app memory
         self.loadAllTradesFromFile()
+        # send the startup subscriptions right away instead of waiting for the next batch
+        self.ticker.flushSubscriptions()
 
         # sleep for 2 seconds for ticker to update ltp map
         time.sleep(2)
@@ -107,13 +174,12 @@ class TradeManager(Thread):
 
             self.isReady = True
 
-            if self.questDBCursor is None or self.questDBCursor.closed:
-                self.questDBCursor = Utils.getQuestDBConnection(self.getName())
-
             if not Utils.isTodayHoliday() and not Utils.isMarketClosedForTheDay() and not len(self.strategyToInstanceMap) == 0:
                 try:
                     # Fetch all order details from broker and update orders in each trade
-                    self.fetchAndUpdateAllTradeOrders()
+                    if self.isOrderReconcileDue():
+                        self.fetchAndUpdateAllTradeOrders()
+                    self.applyOrderUpdates()
                     # track each trade and take necessary action
                     self.trackAndUpdateAllTrades()
 
@@ -155,18 +221,142 @@ class TradeManager(Thread):
                     #     self.ticker.registerSymbols(symbolsToTrack)
 
                     self.checkStrategyHealth()
+                    # close candles of symbols which did not tick after their period ended
+                    self.candleAggregator.closeCandles(self.marketSnapshot.lastExchangeTimestamp)
                     # print ( "%s =>%f :: %f" %(datetime.now().strftime("%H:%M:%S"), pe_vega, ce_vega))
                 except Exception as e:
                     traceback.print_exc()
                     logging.exception("Exception in TradeManager Main thread")
 
-                # save updated data to json file
+                # one batch insert and commit for all trade and index rows of this cycle
+                self.snapshotWriter.flush()
+                # order updates, pnl etc. of this cycle
+                self.journalChangedTrades()
+                # hand the changed trades to the persister thread
                 self.saveAllTradesToFile()
 
-            # Sleep and wake up on every 30th second
+            # Sleep and wake up on every 5th second, acting on order updates as they arrive
             now = datetime.now()
             waitSeconds = 5 - (now.second % 5)
-            time.sleep(waitSeconds)
+            self.waitForOrderUpdates(waitSeconds)
+
+    def orderUpdateListener(self, data):
+        # websocket thread, trades are only touched from the TradeManager thread
+        self.orderUpdates.append((time.time(), data))
+        self.orderUpdateEvent.set()
+
+    def waitForOrderUpdates(self, timeout):
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not self.orderUpdateEvent.wait(remaining):
+                return
+            self.orderUpdateEvent.clear()
+            try:
+                updatedTrades = self.applyOrderUpdates()
+                if len(self.strategyToInstanceMap) == 0:
+                    continue
+                for trade in updatedTrades:
+                    # state changes only, the orders are chased (modified) once per cycle as every modify pushes
+                    # an order update of its own
+                    self.trackTrade(trade, chaseOrders=False)
+                    self.journalTrade(trade)
+            except Exception as e:
+                traceback.print_exc()
+                logging.exception("Exception in TradeManager while applying order updates")
+
+    def isOrderReconcileDue(self):
+        # the full order book is polled every orderReconcileInterval seconds, on every cycle while the
+        # ticker is down and once after it reconnects as order updates may have been missed meanwhile
+        connectCount = self.ticker.getConnectCount()
+        if self.ticker.isConnected() and connectCount == self.lastTickerConnectCount and \
+                time.time() - self.lastOrderReconcileTime < getBrokerAppConfig(self.getName()).get("orderReconcileInterval", 60):
+            return False
+        self.lastTickerConnectCount = connectCount
+        self.lastOrderReconcileTime = time.time()
+        return True
+
+    def buildOrderIndex(self):
+        orderIndex = {}
+        for trade in self.trades:
+            for orderList in ['entryOrder', 'slOrder', 'targetOrder']:
+                for order in getattr(trade, orderList):
+                    if order.orderId != None:
+                        orderIndex[order.orderId] = (order, trade, orderList)
+        return orderIndex
+
+    def applyOrderUpdates(self):
+        # applies the pushed order updates to our orders, returns the trades having orders whose status or filled
+        # quantity changed
+        updates = list(self.unmatchedOrderUpdates.values())
+        self.unmatchedOrderUpdates = {}
+        while len(self.orderUpdates) > 0:
+            updates.append(self.orderUpdates.popleft())
+        if len(updates) == 0:
+            return []
+        orderManager = self.getOrderManager(self.getName())
+        updatedTrades = []
+        indexRebuilt = False
+        for receivedTime, data in updates:
+            orderId = data.get('order_id', None)
+            indexed = self.orderIndex.get(orderId, None)
+            if indexed == None and not indexRebuilt:
+                # orders placed after the index was built
+                self.orderIndex = self.buildOrderIndex()
+                indexRebuilt = True
+                indexed = self.orderIndex.get(orderId, None)
+            if indexed == None:
+                parent = self.orderIndex.get(data.get('parent_order_id', None), None)
+                if parent != None:
+                    # child (Ex: iceberg leg) goes to the same order list of the trade as its parent
+                    parentOrder, trade, orderList = parent
+                    indexed = (orderManager.createChildOrder(parentOrder, data), trade, orderList)
+                    getattr(trade, orderList).append(indexed[0])
+                    self.orderIndex[orderId] = indexed
+                elif time.time() - receivedTime < 60:
+                    # Ex: the update came before placeOrder returned the order id, tried again with the next updates
+                    self.unmatchedOrderUpdates[orderId] = (receivedTime, data)
+                    continue
+                else:
+                    continue
+            order, trade, orderList = indexed
+            if order.orderStatus in [OrderStatus.COMPLETE, OrderStatus.CANCELLED, OrderStatus.REJECTED] and \
+                    data.get('status', None) not in [OrderStatus.COMPLETE, OrderStatus.CANCELLED, OrderStatus.REJECTED]:
+                # older than what the order book poll already gave us
+                continue
+            previousState = (order.orderStatus, order.filledQty)
+            orderManager.updateOrderFromBrokerOrder(order, data)
+            logging.info('TradeManager: Order update applied to %s of tradeID %s', order, trade.tradeID)
+            # Ex: the update pushed for our own modify changes neither, nothing to act on
+            if (order.orderStatus, order.filledQty) != previousState and trade not in updatedTrades:
+                updatedTrades.append(trade)
+        return updatedTrades
+
+    def candleListener(self, candle):
+        # called on the tick thread for every closed candle
+        for strategyInstance in list(self.strategyToInstanceMap.values()):
+            try:
+                strategyInstance.onCandleClose(candle)
+            except Exception as e:
+                logging.error('TradeManager: Exception in %s onCandleClose for %s. Error => %s',
+                              strategyInstance.getName(), candle.tradingSymbol, str(e))
+
+    def getCandles(self, tradingSymbol, timeframe, count=None):
+        if self.candleAggregator == None:
+            return []
+        return self.candleAggregator.getCandles(tradingSymbol, timeframe, count)
+
+    def registerRangeToTrack(self, tradingSymbolsList, startTimestamp, endTimestamp):
+        # symbols also have to be registered with registerTradingSymbolToTrack() to get their ticks
+        for tradingSymbol in tradingSymbolsList:
+            self.rangeTracker.registerRange(tradingSymbol, startTimestamp, endTimestamp)
+
+    def unregisterRangeToTrack(self, tradingSymbolsList, startTimestamp, endTimestamp):
+        for tradingSymbol in tradingSymbolsList:
+            self.rangeTracker.unregisterRange(tradingSymbol, startTimestamp, endTimestamp)
+
+    def getRange(self, tradingSymbol, startTimestamp, endTimestamp):
+        return self.rangeTracker.getRange(tradingSymbol, startTimestamp, endTimestamp)
 
     def registerStrategy(self, strategyInstance):
         self.strategyToInstanceMap[strategyInstance.getName(
@@ -177,42 +367,104 @@ class TradeManager(Thread):
 
     def loadAllTradesFromFile(self):
         tradesFilepath = self.getTradesFilepath()
-        if os.path.exists(tradesFilepath) == False:
+        trades = []
+        if os.path.exists(tradesFilepath) == True:
+            with open(tradesFilepath, 'rb') as tFile:
+                trades = TradeSnapshot.decode(tFile.read())
+        # changes after the snapshot are in the journal, the last record of a trade wins
+        journalRecords = self.tradeJournal.replay() if self.tradeJournal != None else []
+        if len(trades) == 0 and len(journalRecords) == 0:
             logging.warn(
                 'TradeManager: loadAllTradesFromFile() Trades Filepath %s does not exist', tradesFilepath)
             return
-        self.trades = []
-        tFile = open(tradesFilepath, 'r')
-        tradesData = json.loads(tFile.read())
-        for tr in tradesData:
-            trade = Utils.convertJSONToTrade(tr)
-            if self.dbTrades is not None:
-                tradeFound = self.dbTrades.find_one_and_replace(
-                    {"tradeID": trade.tradeID}, tr, upsert=True, return_document=pymongo.ReturnDocument.AFTER)
-            logging.info('loadAllTradesFromFile trade => %s', trade)
-            self.trades.append(trade)
-            if trade.tradingSymbol not in self.registeredSymbols:
-                # Algo register symbols with ticker
-                self.ticker.registerSymbols([trade.tradingSymbol])
-                self.registeredSymbols.append(trade.tradingSymbol)
-        logging.info('TradeManager: Successfully loaded %d trades from json file %s', len(
-            self.trades), tradesFilepath)
+        tradesByID = {}
+        for trade in trades:
+            tradesByID[trade.tradeID] = trade
+        journaledTrades = {}
+        for tr in journalRecords:
+            journaledTrades[tr['tradeID']] = tr
+        for tradeID, tr in journaledTrades.items():
+            tradesByID[tradeID] = Utils.convertJSONToTrade(tr)
+        self.trades = list(tradesByID.values())
+        # Mongo gets all loaded trades with the first save, in one bulk write from the persister thread,
+        # which also writes the first snapshot
+        self.submittedVersions = {}
+        self.snapshotRows = {}
+        self.journaledVersions = {}
+        self.triggerBook.clear()
+        tickModes = {}  # tradingSymbol -> {owner: mode}
+        for trade in self.trades:
+            self.journaledVersions[trade.tradeID] = trade.getVersion()
+            self.triggerBook.addTrade(trade)
+            if trade.tradeState in [TradeState.CREATED, TradeState.ACTIVE]:
+                tickModes.setdefault(trade.tradingSymbol, {})[trade.tradeID] = self.getTickMode(trade)
+        # symbols are registered after all trades are loaded, one tick route update per symbol.
+        # Completed trades do not need ticks any more
+        for tradingSymbol in set([trade.tradingSymbol for trade in self.trades]):
+            self.updateTickRoute(tradingSymbol)
+        for tradingSymbol, owners in tickModes.items():
+            for owner, mode in owners.items():
+                self.ticker.registerSymbols([tradingSymbol], mode = mode, owner = owner)
+        logging.info('TradeManager: Successfully loaded %d trades from json file %s and %d journal records', len(
+            self.trades), tradesFilepath, len(journalRecords))
 
     def getTradesFilepath(self):
         tradesFilepath = os.path.join(self.intradayTradesDir, getBrokerAppConfig(self.getName())[
                                       'broker']+'_'+getBrokerAppConfig(self.getName())['clientID']+'.json')
         return tradesFilepath
 
+    def getJournalDir(self):
+        return os.path.join(self.intradayTradesDir, 'journal_' + getBrokerAppConfig(self.getName())[
+                                      'broker']+'_'+getBrokerAppConfig(self.getName())['clientID'])
+
+    def journalTrade(self, trade):
+        # appends the trade to the journal if it changed since it was last journaled
+        if self.tradeJournal == None:
+            return
+        version = trade.getVersion()
+        if self.journaledVersions.get(trade.tradeID, None) == version:
+            return
+        self.journaledVersions[trade.tradeID] = version
+        try:
+            self.tradeJournal.append(Utils.convertTradeToJSON(trade))
+        except Exception as e:
+            logging.error('TradeManager: Failed to journal tradeID %s: Error => %s', trade.tradeID, str(e))
+
+    def journalChangedTrades(self):
+        for trade in self.trades:
+            self.journalTrade(trade)
+
     def saveAllTradesToFile(self):
-        tradesFilepath = self.getTradesFilepath()
-        with open(tradesFilepath, 'w') as tFile:
-            json.dump(self.trades, tFile, indent=2, cls=TradeEncoder)
-        if self.dbTrades is not None:
-            for trade in self.trades:
-                tradeFound = self.dbTrades.find_one_and_replace({"tradeID": trade.tradeID}, json.loads(
-                    json.dumps(trade, cls=TradeEncoder)), upsert=True, return_document=pymongo.ReturnDocument.AFTER)
-        logging.debug('TradeManager: Saved %d trades to file %s',
-                     len(self.trades), tradesFilepath)
+        # json copies of the trades changed since the last save, written by the persister thread
+        changedTrades = []
+        for trade in self.trades:
+            version = trade.getVersion()
+            if self.submittedVersions.get(trade.tradeID, None) != version:
+                self.submittedVersions[trade.tradeID] = version
+                changedTrades.append((trade.tradeID, Utils.convertTradeToJSON(trade)))
+        if len(changedTrades) > 0:
+            self.snapshotPending = True
+        # the journal has every change, the snapshot only bounds the journal replayed on restart
+        snapshot = None
+        if self.snapshotPending and time.time() - self.lastSnapshotTime >= getServerConfig().get("tradeSnapshotInterval", 60):
+            snapshot = self.prepareTradesSnapshot()
+        if len(changedTrades) > 0 or snapshot != None:
+            self.tradePersister.submit(changedTrades, snapshot)
+
+    def prepareTradesSnapshot(self):
+        # changes journaled from here on go to a new segment, the older segments are covered by this snapshot
+        journalSegment = self.tradeJournal.rotate() if self.tradeJournal != None else None
+        encodedTrades = []
+        for trade in list(self.trades):
+            version = trade.getVersion()
+            cached = self.snapshotRows.get(trade.tradeID, None)
+            if cached == None or cached[0] != version:
+                cached = (version, TradeSnapshot.encodeTrade(trade))
+                self.snapshotRows[trade.tradeID] = cached
+            encodedTrades.append(cached[1])
+        self.snapshotPending = False
+        self.lastSnapshotTime = time.time()
+        return (encodedTrades, journalSegment)
 
     def addNewTrade(self, trade):
         if trade == None:
@@ -225,12 +477,15 @@ class TradeManager(Thread):
                 return
         # Add the new trade to the list
         self.trades.append(trade)
+        self.triggerBook.addTrade(trade)
+        self.updateTickRoute(trade.tradingSymbol)
         logging.info(
             'TradeManager: trade %s added successfully to the list', trade.tradeID)
+        self.journalTrade(trade)
         # Register the symbol with ticker so that we will start getting ticks for this symbol
-        if trade.tradingSymbol not in self.registeredSymbols:
-            self.ticker.registerSymbols([trade.tradingSymbol])
-            self.registeredSymbols.append(trade.tradingSymbol)
+        # the subscription is owned by the trade and released when the trade is done
+        if len(self.ticker.registerSymbols([trade.tradingSymbol], mode = self.getTickMode(trade), owner = trade.tradeID)) > 0:
+            logging.error('TradeManager: %s could not be subscribed, tradeID %s will not get ticks', trade.tradingSymbol, trade.tradeID)
         # Also add the trade to strategy trades list
         strategyInstance = self.strategyToInstanceMap[trade.strategy]
         if strategyInstance != None:
@@ -240,63 +495,64 @@ class TradeManager(Thread):
         if trade != None:
             logging.info(
                 'TradeManager: Going to disable trade ID %s with the reason %s', trade.tradeID, reason)
-            trade.tradeState = TradeState.DISABLED
-
-    def updateCandle(self, tick):
-        return
-        timenow = datetime.now()
-        if self.tickStore.get(tick.tradingSymbol) == None:
-            self.tickStore[tick.tradingSymbol] = []
-            self.candleTime[tick.tradingSymbol] = None
-
-        if timenow.strftime("%d-%m-%Y %H:%M:00") == self.candleTime[tick.tradingSymbol]:
-            self.tickStore[tick.tradingSymbol].append(tick.lastTradedPrice)
-        elif int(timenow.strftime("%S")) < 5:
-
-            if self.candleTime[tick.tradingSymbol] is not None:
-                x_df = pd.DataFrame(self.tickStore[tick.tradingSymbol])
-                x_df.groupby(lambda _: True).agg(
-                    open=(0, 'first'),
-                    high=(0, np.max),
-                    low=(0, np.min),
-                    close=(0, 'last')
-                )
-                # store in quest db self.tickStore[tick.tradingSymbol] self.candleTime[tick.tradingSymbol], open, high, low, close
-                self.tickStore[tick.tradingSymbol] = []
-
-            self.candleTime[tick.tradingSymbol] = timenow.strftime(
-                "%d-%m-%Y %H:%M:00")
+            self.setTradeState(trade, TradeState.DISABLED)
+
+    def setTradeState(self, trade, tradeState):
+        trade.tradeState = tradeState
+        self.journalTrade(trade)
+        if tradeState != TradeState.CREATED:
+            self.triggerBook.removeTrade(trade)
+            self.updateTickRoute(trade.tradingSymbol)
+        if self.ticker == None:
+            return
+        if tradeState in [TradeState.COMPLETED, TradeState.CANCELLED, TradeState.DISABLED]:
+            self.ticker.unregisterSymbols([trade.tradingSymbol], owner = trade.tradeID)
+        elif tradeState == TradeState.ACTIVE:
+            # upgrade the subscription of the leg now that it is open
+            self.ticker.registerSymbols([trade.tradingSymbol], mode = self.getTickMode(trade), owner = trade.tradeID)
+
+    def getTickMode(self, trade):
+        # untriggered trades only compare the LTP against the entry, open legs also need buy/sell quantities
+        if trade.tradeState == TradeState.CREATED:
+            return BaseTicker.MODE_LTP
+        return BaseTicker.MODE_QUOTE
+
+    def updateTickRoute(self, tradingSymbol):
+        # tickerListener only needs ticks of symbols having untriggered trades or tracked for storing tick data
+        if self.ticker == None:
+            return
+        with self.tickRouteLock:
+            if self.triggerBook.hasPendingTrades(tradingSymbol) or tradingSymbol in self.trackTradingSymbols:
+                self.ticker.addListenerSymbols(self.tickerListener, [tradingSymbol])
+            else:
+                self.ticker.removeListenerSymbols(self.tickerListener, [tradingSymbol])
 
     def tickerListener(self, tick):
         # logging.info('tickerLister: new tick received for %s = %f', tick.tradingSymbol, tick.lastTradedPrice);
-        # Store the latest tick in map
-        self.symbolToCMPMap[tick.tradingSymbol] = tick.lastTradedPrice
-        self.symboltoTotalBuy[tick.tradingSymbol] = tick.totalBuyQuantity
-        self.symboltoTotalSell[tick.tradingSymbol] = tick.totalSellQuantity
-        if tick.exchange_timestamp:
-           self.symbolToCMPMap["exchange_timestamp"] = tick.exchange_timestamp
-        self.updateCandle(tick)
+        # Latest tick is already stored in self.marketSnapshot and self.candleAggregator by the ticker
         self.storeTickDataInDB(tick)
         # On each new tick, get a created trade and call its strategy whether to place trade or not
-        for strategy in self.strategyToInstanceMap:
+        for strategy in self.triggerBook.getPendingStrategies(tick.tradingSymbol):
+            strategyInstance = self.strategyToInstanceMap.get(strategy, None)
+            if strategyInstance == None:
+                continue
             longTrade = self.getUntriggeredTrade(
                 tick.tradingSymbol, strategy, Direction.LONG)
             shortTrade = self.getUntriggeredTrade(
                 tick.tradingSymbol, strategy, Direction.SHORT)
             if longTrade == None and shortTrade == None:
                 continue
-            strategyInstance = self.strategyToInstanceMap[strategy]
             if longTrade != None:
                 if strategyInstance.shouldPlaceTrade(longTrade, tick):
                     # place the longTrade
                     isSuccess = self.executeTrade(longTrade)
                     if isSuccess == True:
                         # set longTrade state to ACTIVE
-                        longTrade.tradeState = TradeState.ACTIVE
                         longTrade.startTimestamp = Utils.getEpoch()
+                        self.setTradeState(longTrade, TradeState.ACTIVE)
                         continue
                     else:
-                        longTrade.tradeState = TradeState.DISABLED
+                        self.setTradeState(longTrade, TradeState.DISABLED)
 
             if shortTrade != None:
                 if strategyInstance.shouldPlaceTrade(shortTrade, tick):
@@ -304,27 +560,13 @@ class TradeManager(Thread):
                     isSuccess = self.executeTrade(shortTrade)
                     if isSuccess == True:
                         # set shortTrade state to ACTIVE
-                        shortTrade.tradeState = TradeState.ACTIVE
                         shortTrade.startTimestamp = Utils.getEpoch()
+                        self.setTradeState(shortTrade, TradeState.ACTIVE)
                     else:
-                        shortTrade.tradeState = TradeState.DISABLED
+                        self.setTradeState(shortTrade, TradeState.DISABLED)
 
     def getUntriggeredTrade(self, tradingSymbol, strategy, direction):
-        trade = None
-        for tr in self.trades:
-            if tr.tradeState == TradeState.DISABLED:
-                continue
-            if tr.tradeState != TradeState.CREATED:
-                continue
-            if tr.tradingSymbol != tradingSymbol:
-                continue
-            if tr.strategy != strategy:
-                continue
-            if tr.direction != direction:
-                continue
-            trade = tr
-            break
-        return trade
+        return self.triggerBook.getUntriggeredTrade(tradingSymbol, strategy, direction)
 
     def executeTrade(self, trade):
         logging.info('TradeManager: Execute trade called for %s', trade)
@@ -348,6 +590,8 @@ class TradeManager(Thread):
             logging.error(
                 'TradeManager: Execute trade failed for tradeID %s: Error => %s', trade.tradeID, str(e))
             return False
+        # the order id is journaled before anything else can fail
+        self.journalTrade(trade)
 
         logging.info(
             'TradeManager: Execute trade successful for %s and entryOrder %s', trade, trade.entryOrder)
@@ -355,88 +599,109 @@ class TradeManager(Thread):
 
     def fetchAndUpdateAllTradeOrders(self):
         allOrders = {}
-        for trade in self.trades:
-            for entryOrder in trade.entryOrder:
-                allOrders[entryOrder] = trade.strategy
-            for slOrder in trade.slOrder:
-                allOrders[slOrder] = trade.strategy
-            for targetOrder in trade.targetOrder:
-                allOrders[targetOrder] = trade.strategy
+        self.orderIndex = self.buildOrderIndex()
+        for (order, trade, orderList) in self.orderIndex.values():
+            allOrders[order] = trade.strategy
 
         missingOrders = self.getOrderManager(
             self.getName()).fetchAndUpdateAllOrderDetails(allOrders)
-        
-        #lets find the place for these orders
-        for missingOrder in missingOrders: 
-            orderParentFound = False     
-            for trade in self.trades:
-                for entryOrder in trade.entryOrder:
-                    if entryOrder.orderId == missingOrder.parentOrderId:
-                        trade.entryOrder.append(missingOrder)
-                        orderParentFound = True
-                for slOrder in trade.slOrder:
-                    if slOrder.orderId == missingOrder.parentOrderId:
-                        trade.slOrder.append(missingOrder)
-                        orderParentFound = True
-                for targetOrder in trade.targetOrder:
-                    if targetOrder.orderId == missingOrder.parentOrderId:
-                        trade.targetOrder.append(missingOrder)
-                        orderParentFound = True
-                if orderParentFound:
-                    break
+
+        # child orders go to the same order list of the trade as their parent
+        for missingOrder in missingOrders:
+            parent = self.orderIndex.get(missingOrder.parentOrderId, None)
+            if parent == None:
+                continue
+            parentOrder, trade, orderList = parent
+            getattr(trade, orderList).append(missingOrder)
+            self.orderIndex[missingOrder.orderId] = (missingOrder, trade, orderList)
 
     def trackAndUpdateAllTrades(self):
 
-        if self.questDBCursor is not None:
-            try:
-                query = "INSERT INTO '{0}' VALUES('{1}', '{2}', '{3}', '{4}', {5}, {6}, {7}, {8}, '{9}');"\
-                    .format(self.getName(), datetime.now(), "Nifty", "NIFTY 50", "",
-                            self.getLastTradedPrice("NIFTY 50"), 0, 0, 0, "")
-                self.questDBCursor.execute(query)
-                query = "INSERT INTO '{0}' VALUES('{1}', '{2}', '{3}', '{4}', {5}, {6}, {7}, {8}, '{9}');"\
-                    .format(self.getName(), datetime.now(), "BankNifty", "NIFTY BANK", "",
-                            self.getLastTradedPrice("NIFTY BANK"), 0, 0, 0, "")
-                self.questDBCursor.execute(query)
-                query = "INSERT INTO '{0}' VALUES('{1}', '{2}', '{3}', '{4}', {5}, {6}, {7}, {8}, '{9}');"\
-                    .format(self.getName(), datetime.now(), "VIX", "INDIA VIX", "",
-                            self.getLastTradedPrice("INDIA VIX"), 0, 0, 0, "")
-                self.questDBCursor.execute(query)
-                self.questDBCursor.connection.commit()
-            except Exception as err:
-                logging.error("Error inserting into Quest DB %s", str(err))
+        try:
+            self.snapshotWriter.addIndexRow("Nifty", "NIFTY 50", self.getLastTradedPrice("NIFTY 50"))
+            self.snapshotWriter.addIndexRow("BankNifty", "NIFTY BANK", self.getLastTradedPrice("NIFTY BANK"))
+            self.snapshotWriter.addIndexRow("VIX", "INDIA VIX", self.getLastTradedPrice("INDIA VIX"))
+        except Exception as err:
+            logging.error("Error collecting index rows for Quest DB %s", str(err))
 
         for trade in self.trades:
-            if trade.tradeState == TradeState.ACTIVE:
-                self.trackEntryOrder(trade)
-                self.trackTargetOrder(trade)
-                self.trackSLOrder(trade)
-                if trade.intradaySquareOffTimestamp != None:
-                    nowEpoch = Utils.getEpoch()
-                    if nowEpoch >= trade.intradaySquareOffTimestamp:
-                        trade.target = self.symbolToCMPMap[trade.tradingSymbol]
-                        self.squareOffTrade(
-                            trade, TradeExitReason.SQUARE_OFF)
+            self.trackTrade(trade)
+
+        retriedTrades = self.retryFailedSquareOffs()
+        # legs reaching their square off time together (Ex: CE and PE of a strategy) are squared off together
+        nowEpoch = Utils.getEpoch()
+        dueTrades = [trade for trade in self.trades if trade.tradeState == TradeState.ACTIVE and trade not in retriedTrades
+                     and trade.intradaySquareOffTimestamp != None and nowEpoch >= trade.intradaySquareOffTimestamp]
+        for trade in dueTrades:
+            trade.target = self.getLastTradedPrice(trade.tradingSymbol)
+        self.squareOffTrades(dueTrades, TradeExitReason.SQUARE_OFF)
+
+    def trackTrade(self, trade, chaseOrders=True):
+        if trade.tradeState == TradeState.ACTIVE:
+            self.trackEntryOrder(trade, chaseOrders)
+            self.trackTargetOrder(trade, chaseOrders)
+            self.trackSLOrder(trade, chaseOrders)
 
     def checkStrategyHealth(self):
         for strategy in self.strategyToInstanceMap.values():
             if strategy.isEnabled():
                 SLorTargetHit = strategy.isTargetORSLHit()
                 if(SLorTargetHit is not None):
-                    for trade in strategy.trades:
-                        if trade.tradeState in (TradeState.ACTIVE):
-                            trade.target = self.symbolToCMPMap[trade.tradingSymbol]
-                            self.squareOffTrade(trade, SLorTargetHit)
-                    strategy.setDisabled()
-
-    def trackEntryOrder(self, trade):
+                    self.squareOffStrategy(strategy, SLorTargetHit)
+
+    def squareOffStrategy(self, strategy, reason):
+        # all open legs of the strategy are squared off at once and the strategy is disabled
+        trades = [trade for trade in strategy.trades if trade.tradeState == TradeState.ACTIVE]
+        for trade in trades:
+            trade.target = self.getLastTradedPrice(trade.tradingSymbol)
+        self.squareOffTrades(trades, reason)
+        strategy.setDisabled()
+
+    def squareOffTrades(self, trades, reason):
+        # legs are sent concurrently by the leg executor, a leg that failed does not hold back the others and is
+        # squared off again in the next cycle, once its order statuses are refreshed
+        trades = [trade for trade in trades if trade.tradeState == TradeState.ACTIVE]
+        results = self.legExecutor.execute("squareOff:" + str(reason), trades,
+            lambda trade: self.squareOffLeg(trade, reason), lambda trade: trade.tradeID)
+        for result in results:
+            if result.isSuccess():
+                self.failedSquareOffs.pop(result.leg.tradeID, None)
+            else:
+                self.failedSquareOffs[result.leg.tradeID] = (result.leg, reason)
+        # journaled here, the legs only make broker calls
+        self.journalChangedTrades()
+        return results
+
+    def squareOffLeg(self, trade, reason):
+        # runs on a leg executor thread, only touches the trade and the broker
+        if self.squareOffTrade(trade, reason, journal=False) == False:
+            raise Exception("Could not cancel the SL order, position is still open")
+
+    def retryFailedSquareOffs(self):
+        # returns the trades tried again
+        retries = {}  # reason -> trades
+        for trade, reason in self.failedSquareOffs.values():
+            if trade.tradeState == TradeState.ACTIVE:
+                retries.setdefault(reason, []).append(trade)
+        self.failedSquareOffs = {}
+        retriedTrades = []
+        for reason, trades in retries.items():
+            logging.warn('TradeManager: Retrying square off with reason %s for tradeIDs %s',
+                         reason, [trade.tradeID for trade in trades])
+            self.squareOffTrades(trades, reason)
+            retriedTrades.extend(trades)
+        return retriedTrades
+
+    def trackEntryOrder(self, trade, chaseOrders=True):
         if trade.tradeState != TradeState.ACTIVE:
             return
 
         if len(trade.entryOrder) == 0:
             return
 
-        trade.filledQty = 0
-        trade.entry = 0
+        # summed up in locals so a trade whose orders did not change keeps its version
+        filledQty = 0
+        entry = 0
         orderCanceled = 0
 
         for entryOrder in trade.entryOrder:
@@ -444,55 +709,43 @@ class TradeManager(Thread):
                 orderCanceled += 1
 
             if entryOrder.filledQty > 0:
-                trade.entry = (trade.entry * trade.filledQty + entryOrder.averagePrice *
-                               entryOrder.filledQty) / (trade.filledQty+entryOrder.filledQty)
+                entry = (entry * filledQty + entryOrder.averagePrice *
+                         entryOrder.filledQty) / (filledQty+entryOrder.filledQty)
             elif entryOrder.orderStatus not in [OrderStatus.REJECTED, OrderStatus.CANCELLED] and not entryOrder.orderType in [OrderType.SL_LIMIT]:
-                omp = OrderModifyParams()
-                if trade.direction == Direction.LONG:
-                    omp.newPrice = Utils.roundToNSEPrice(entryOrder.price * 1.01) + 0.05
-                else:
-                    omp.newPrice = Utils.roundToNSEPrice(entryOrder.price * 0.99) - 0.05
-                try:  
-                    self.getOrderManager(self.getName()).modifyOrder(
-                        entryOrder, omp, trade.qty)
-                except Exception as e:
-                    if e.args[0] == "Maximum allowed order modifications exceeded.":
-                        self.getOrderManager(self.getName()).cancelOrder(entryOrder)
+                if chaseOrders:
+                    omp = OrderModifyParams()
+                    if trade.direction == Direction.LONG:
+                        omp.newPrice = Utils.roundToNSEPrice(entryOrder.price * 1.01) + 0.05
+                    else:
+                        omp.newPrice = Utils.roundToNSEPrice(entryOrder.price * 0.99) - 0.05
+                    try:  
+                        self.getOrderManager(self.getName()).modifyOrder(
+                            entryOrder, omp, trade.qty)
+                    except Exception as e:
+                        if e.args[0] == "Maximum allowed order modifications exceeded.":
+                            self.getOrderManager(self.getName()).cancelOrder(entryOrder)
             elif entryOrder.orderStatus in [OrderStatus.TRIGGER_PENDING]:
                 nowEpoch = Utils.getEpoch()
                 if nowEpoch >= Utils.getEpoch(self.strategyToInstanceMap[trade.strategy].stopTimestamp):
                     self.getOrderManager(self.getName()).cancelOrder(entryOrder)
 
-            trade.filledQty += entryOrder.filledQty
+            filledQty += entryOrder.filledQty
 
+        trade.filledQty = filledQty
+        trade.entry = entry
         if orderCanceled == len(trade.entryOrder):
-            trade.tradeState = TradeState.CANCELLED
+            self.setTradeState(trade, TradeState.CANCELLED)
         if orderCanceled > 0:
-            strategy = self.strategyToInstanceMap[trade.strategy]
-            for trade in strategy.trades:
-                if trade.tradeState in (TradeState.ACTIVE):
-                    trade.target = self.symbolToCMPMap[trade.tradingSymbol]
-                    self.squareOffTrade(trade, TradeExitReason.TRADE_FAILED)
-                strategy.setDisabled()
+            self.squareOffStrategy(self.strategyToInstanceMap[trade.strategy], TradeExitReason.TRADE_FAILED)
 
         # Update the current market price and calculate pnl
-        trade.cmp = self.symbolToCMPMap[trade.tradingSymbol]
+        trade.cmp = self.getLastTradedPrice(trade.tradingSymbol)
         Utils.calculateTradePnl(trade)
 
-        if self.questDBCursor is None or self.questDBCursor.closed:
-            self.questDBCursor = Utils.getQuestDBConnection(self.getName())
+        # written with the rest of the cycle in one batch, see TradeSnapshotWriter
+        self.snapshotWriter.addTradeRow(trade)
 
-        if self.questDBCursor is not None:
-            try:
-                query = "INSERT INTO '{0}' VALUES('{1}', '{2}', '{3}', '{4}', {5}, {6}, {7}, {8}, '{9}');"\
-                    .format(self.getName(), datetime.now(), trade.strategy, trade.tradingSymbol, trade.tradeID,
-                            trade.cmp, trade.entry, trade.pnl, trade.qty, trade.tradeState)
-                self.questDBCursor.execute(query)
-                self.questDBCursor.connection.commit()
-            except Exception as err:
-                logging.error("Error inserting into Quest DB %s", str(err))
-
-    def trackSLOrder(self, trade):
+    def trackSLOrder(self, trade, chaseOrders=True):
         if trade.tradeState != TradeState.ACTIVE:
             for entryOrder in trade.entryOrder:
                 if entryOrder.orderStatus in [OrderStatus.OPEN, OrderStatus.TRIGGER_PENDING]:
@@ -527,6 +780,8 @@ class TradeManager(Thread):
                     slRejected+=1
                 elif slOrder.orderStatus == OrderStatus.OPEN:
                     slOpen+=1
+                    if not chaseOrders:
+                        continue
                     omp = OrderModifyParams()
                     if trade.direction == Direction.LONG:
                         omp.newTriggerPrice = Utils.roundToNSEPrice(slOrder.price * 0.99) - 0.05
@@ -537,7 +792,7 @@ class TradeManager(Thread):
                         
                         
                     self.getOrderManager(self.getName()).modifyOrder(
-                        slOrder, omp, trade.qty)
+                        slOrder, omp, trade.qty, RateLimiter.EXIT)
 
             if  slCompleted == len(trade.slOrder) and len(trade.slOrder) > 0 :
                 # SL Hit
@@ -558,19 +813,14 @@ class TradeManager(Thread):
                     # SL order cancelled outside of algo (manually or by broker or by exchange)
                     logging.error('SL order tradeID %s cancelled outside of Algo. Setting the trade as completed with exit price as current market price.',
                                 trade.tradeID)
-                    exit = self.symbolToCMPMap[trade.tradingSymbol]
+                    exit = self.getLastTradedPrice(trade.tradingSymbol)
                     self.setTradeToCompleted(
                         trade, exit, TradeExitReason.SL_CANCELLED)
             elif slRejected > 0:
-                strategy = self.strategyToInstanceMap[trade.strategy]
-                for trade in strategy.trades:
-                    if trade.tradeState in (TradeState.ACTIVE):
-                        trade.target = self.symbolToCMPMap[trade.tradingSymbol]
-                        self.squareOffTrade(trade, TradeExitReason.TRADE_FAILED)
-                    strategy.setDisabled()
+                self.squareOffStrategy(self.strategyToInstanceMap[trade.strategy], TradeExitReason.TRADE_FAILED)
             elif slOpen > 0 :
                 pass #handled above, skip calling trail SL
-            else:
+            elif chaseOrders:
                 self.checkAndUpdateTrailSL(trade)
 
     def checkAndUpdateTrailSL(self, trade):
@@ -612,11 +862,12 @@ class TradeManager(Thread):
                                 oldSL, newTrailSL, trade.tradeID)
                 # IMPORTANT: Dont forget to update this on successful modification
                 trade.stopLoss = newTrailSL
+                self.journalTrade(trade)
             except Exception as e:
                 logging.error('TradeManager: Failed to modify SL order for tradeID %s : Error => %s',
                               trade.tradeID, str(e))
 
-    def trackTargetOrder(self, trade):
+    def trackTargetOrder(self, trade, chaseOrders=True):
         if trade.tradeState != TradeState.ACTIVE and self.strategyToInstanceMap[trade.strategy].isTargetORSLHit() is not None:
             return
         if trade.target == 0:  # Do not place Target order if no target provided
@@ -639,6 +890,8 @@ class TradeManager(Thread):
                     targetCancelled+=1
                 elif targetOrder.orderStatus == OrderStatus.OPEN and trade.exitReason is not None:
                     targetOpen+=1
+                    if not chaseOrders:
+                        continue
                     omp = OrderModifyParams()
                     if trade.direction == Direction.LONG:
                         omp.newTriggerPrice = Utils.roundToNSEPrice(targetOrder.price * 0.99) - 0.05
@@ -648,7 +901,7 @@ class TradeManager(Thread):
                         omp.newPrice = Utils.roundToNSEPrice(omp.newTriggerPrice * 1.01) + 0.05
                         
                     self.getOrderManager(self.getName()).modifyOrder(
-                        targetOrder, omp, trade.qty)
+                        targetOrder, omp, trade.qty, RateLimiter.EXIT)
 
             if targetCompleted == len(trade.targetOrder) and len(trade.targetOrder) > 0 :
                 # Target Hit
@@ -662,7 +915,7 @@ class TradeManager(Thread):
                 # Target order cancelled outside of algo (manually or by broker or by exchange)
                 logging.error('Target orderfor tradeID %s cancelled outside of Algo. Setting the trade as completed with exit price as current market price.',
                                trade.tradeID)
-                exit = self.symbolToCMPMap[trade.tradingSymbol]
+                exit = self.getLastTradedPrice(trade.tradingSymbol)
                 self.setTradeToCompleted(
                     trade, exit, TradeExitReason.TARGET_CANCELLED)
                 # Cancel SL order
@@ -682,15 +935,16 @@ class TradeManager(Thread):
             oip.isFnO = True
         try:
             trade.slOrder.append(self.getOrderManager(
-                self.getName()).placeOrder(oip))
+                self.getName()).placeOrder(oip, RateLimiter.EXIT))
         except Exception as e:
             logging.error(
                 'TradeManager: Failed to place SL order for tradeID %s: Error => %s', trade.tradeID, str(e))
             raise(e)
+        self.journalTrade(trade)
         logging.info('TradeManager: Successfully placed SL order %s for tradeID %s',
                      trade.slOrder[0].orderId, trade.tradeID)
 
-    def placeTargetOrder(self, trade, isMarketOrder=False):
+    def placeTargetOrder(self, trade, isMarketOrder=False, journal=True):
         oip = OrderInputParams(trade.tradingSymbol)
         oip.direction = Direction.SHORT if trade.direction == Direction.LONG else Direction.LONG
         oip.productType = trade.productType
@@ -706,11 +960,14 @@ class TradeManager(Thread):
             oip.isFnO = True
         try:
             trade.targetOrder.append(self.getOrderManager(
-                self.getName()).placeOrder(oip))
+                self.getName()).placeOrder(oip, RateLimiter.EXIT))
         except Exception as e:
             logging.error(
                 'TradeManager: Failed to place Target order for tradeID %s: Error => %s', trade.tradeID, str(e))
             raise(e)
+        # not journaled from leg executor threads, see squareOffTrades
+        if journal:
+            self.journalTrade(trade)
         logging.info('TradeManager: Successfully placed Target order %s for tradeID %s',
                      trade.targetOrder[0].orderId, trade.tradeID)
 
@@ -721,7 +978,7 @@ class TradeManager(Thread):
             if entryOrder.orderStatus == OrderStatus.CANCELLED:
                 continue
             try:
-                self.getOrderManager(self.getName()).cancelOrder(entryOrder)
+                self.getOrderManager(self.getName()).cancelOrder(entryOrder, RateLimiter.EXIT)
             except Exception as e:
                 logging.error('TradeManager: Failed to cancel Entry order %s for tradeID %s: Error => %s',
                               entryOrder.orderId, trade.tradeID, str(e))
@@ -736,7 +993,7 @@ class TradeManager(Thread):
             if slOrder.orderStatus == OrderStatus.CANCELLED:
                 continue
             try:
-                self.getOrderManager(self.getName()).cancelOrder(slOrder)
+                self.getOrderManager(self.getName()).cancelOrder(slOrder, RateLimiter.EXIT)
             except Exception as e:
                 logging.error('TradeManager: Failed to cancel SL order %s for tradeID %s: Error => %s',
                               slOrder.orderId, trade.tradeID, str(e))
@@ -751,7 +1008,7 @@ class TradeManager(Thread):
             if targetOrder.orderStatus == OrderStatus.CANCELLED:
                 continue
             try:
-                self.getOrderManager(self.getName()).cancelOrder(targetOrder)
+                self.getOrderManager(self.getName()).cancelOrder(targetOrder, RateLimiter.EXIT)
             except Exception as e:
                 logging.error('TradeManager: Failed to cancel Target order %s for tradeID %s: Error => %s',
                               targetOrder.orderId, trade.tradeID, str(e))
@@ -760,7 +1017,7 @@ class TradeManager(Thread):
                          targetOrder.orderId, trade.tradeID)
 
     def setTradeToCompleted(self, trade, exit, exitReason=None):
-        trade.tradeState = TradeState.COMPLETED
+        self.setTradeState(trade, TradeState.COMPLETED)
         trade.exit = exit
         trade.exitReason = exitReason if trade.exitReason == None else trade.exitReason
         #TODO Timestamp to be matched with last order
@@ -775,23 +1032,15 @@ class TradeManager(Thread):
 
         trade = Utils.calculateTradePnl(trade)
 
-        if self.questDBCursor is None or self.questDBCursor.closed:
-            self.questDBCursor = Utils.getQuestDBConnection(self.getName())
-
-        if self.questDBCursor is not None:
-            try:
-                query = "INSERT INTO '{0}' VALUES('{1}', '{2}', '{3}', '{4}', {5}, {6}, {7}, {8}, '{9}');"\
-                    .format(self.getName(), datetime.now(), trade.strategy, trade.tradingSymbol, trade.tradeID,
-                            trade.cmp, trade.entry, trade.pnl, trade.qty, trade.tradeState)
-                self.questDBCursor.execute(query)
-                self.questDBCursor.connection.commit()
-            except Exception as err:
-                logging.error("Error inserting into Quest DB %s", str(err))
+        # written with the rest of the cycle in one batch, see TradeSnapshotWriter
+        self.snapshotWriter.addTradeRow(trade)
+        self.journalTrade(trade)
 
         logging.info('TradeManager: setTradeToCompleted strategy = %s, symbol = %s, qty = %d, entry = %f, exit = %f, pnl = %f, exit reason = %s',
                      trade.strategy, trade.tradingSymbol, trade.filledQty, trade.entry, trade.exit, trade.pnl, trade.exitReason)
 
-    def squareOffTrade(self, trade, reason=TradeExitReason.SQUARE_OFF):
+    def squareOffTrade(self, trade, reason=TradeExitReason.SQUARE_OFF, journal=True):
+        # returns False when the position could not be exited, the square off has to be tried again
         logging.info(
             'TradeManager: squareOffTrade called for tradeID %s with reason %s', trade.tradeID, reason)
         if trade == None or trade.tradeState != TradeState.ACTIVE:
@@ -812,7 +1061,7 @@ class TradeManager(Thread):
                 #probably the order is being processed.
                 logging.info('TradeManager: squareOffTrade couldn\'t cancel SL order for %s, not placing target order, strategy will be disabled',
                          trade.tradeID)
-                return
+                return False
 
 
         if len(trade.targetOrder) > 0:
@@ -825,22 +1074,27 @@ class TradeManager(Thread):
                     omp.newPrice = Utils.roundToNSEPrice(
                         trade.cmp * (0.99 if trade.direction == Direction.LONG else 1.01))
                     self.getOrderManager(self.getName()).modifyOrder(
-                        targetOrder, omp, trade.qty)
+                        targetOrder, omp, trade.qty, RateLimiter.EXIT)
         elif trade.entry > 0:
             # Place new target order to exit position, adjust target to current market price
             trade.target = trade.cmp * \
                 (0.99 if trade.direction == Direction.LONG else 1.01)
             logging.info(
                 'TradeManager: placing new target order to exit position for tradeID %s', trade.tradeID)
-            self.placeTargetOrder(trade, True)
+            self.placeTargetOrder(trade, True, journal)
+        return True
 
     def getOrderManager(self, short_code):
-        orderManager = None
-        brokerName = getBrokerAppConfig(short_code)['broker']
-        if brokerName == "zerodha":
-            orderManager = ZerodhaOrderManager(Controller.getBrokerLogin(
-                short_code).getBrokerHandle(), getBrokerAppConfig(short_code)['clientID'])
-        # elif brokerName == "fyers": # Not implemented
+        # one order manager per account, created again only when a new login replaced the broker handle
+        brokerHandle = Controller.getBrokerLogin(short_code).getBrokerHandle()
+        orderManager = self.orderManager
+        if orderManager == None or orderManager.brokerHandle is not brokerHandle:
+            orderManager = None
+            brokerAppConfig = getBrokerAppConfig(short_code)
+            if brokerAppConfig['broker'] == "zerodha":
+                orderManager = ZerodhaOrderManager(brokerHandle, brokerAppConfig['clientID'])
+            # elif brokerName == "fyers": # Not implemented
+            self.orderManager = orderManager
         return orderManager
 
     def getNumberOfTradesPlacedByStrategy(self, strategy):
@@ -862,42 +1116,57 @@ class TradeManager(Thread):
         return tradesByStrategy
 
     def getLastTradedPrice(self, tradingSymbol):
-        return self.symbolToCMPMap[tradingSymbol]
+        return self.marketSnapshot.getLastTradedPrice(tradingSymbol)
     
     def storeTickDataInDB(self, tick):
         try:
             #check if tick is registerd to track
-            if tick.tradingSymbol not in self.trackTradingSymbols:
+            if tick.tradingSymbol not in self.trackTradingSymbols or self.tickWriter == None:
                 return
-            
-            #Check for QuestDB connection
-            if self.questDBCursor is None or self.questDBCursor.closed:
-                self.questDBCursor = Utils.getQuestDBConnection(self.getName())
-
-            query = "INSERT INTO '{0}_tickData' VALUES('{1}', '{2}', {3}, {4}, {5}, {6}, {7}, {8}, {9}, {10}, {11}, {12}, {13});"\
-                    .format(self.getName(), datetime.now(), tick.tradingSymbol, tick.lastTradedPrice, tick.lastTradedQuantity,
-                            tick.avgTradedPrice, tick.volume, tick.totalBuyQuantity, tick.totalSellQuantity, 
-                            tick.open, tick.high, tick.low, tick.close, tick.change)
-            self.questDBCursor.execute(query)
-            self.questDBCursor.connection.commit()
+
+            # only an enqueue here, the writer thread batches the rows to QuestDB
+            self.tickWriter.write(self.getName() + "_tickData", {"tradingSymbol": tick.tradingSymbol}, {
+                "ltp": float(tick.lastTradedPrice),
+                "qty": int(tick.lastTradedQuantity),
+                "avgPrice": float(tick.avgTradedPrice),
+                "volume": int(tick.volume),
+                "totalBuyQuantity": int(tick.totalBuyQuantity),
+                "totalSellQuantity": int(tick.totalSellQuantity),
+                "open": float(tick.open),
+                "high": float(tick.high),
+                "low": float(tick.low),
+                "close": float(tick.close),
+                "change": float(tick.change)
+            })
 
         except Exception as e:
-            logging.error("Error in storeTickDataInDB for symbol %s,  Error => %s", tick.symbol, str(e))
+            logging.error("Error in storeTickDataInDB for symbol %s,  Error => %s", tick.tradingSymbol, str(e))
     
     
     def registerTradingSymbolToTrack(self, tradingSymbolsList):
         for tradingSymbol in tradingSymbolsList:
             try:
-                if tradingSymbol not in self.registeredSymbols:
-                    # Algo register symbols with ticker
-                    self.ticker.registerSymbols([tradingSymbol])
-                
                 if tradingSymbol not in self.trackTradingSymbols:
+                    # Algo register symbols with ticker
+                    self.ticker.registerSymbols([tradingSymbol], mode = BaseTicker.MODE_QUOTE, owner = "tracker")
                     #Algo add symbols in tracking symbols list
-                    self.trackTradingSymbols.append(tradingSymbol)
+                    self.trackTradingSymbols.add(tradingSymbol)
+                    self.updateTickRoute(tradingSymbol)
 
             except Exception as e:
                 logging.error("Error in registerStrikeToTrack for symbol %s,  Error => %s", tradingSymbol, str(e))
 
+    def unregisterTradingSymbolToTrack(self, tradingSymbolsList):
+        for tradingSymbol in tradingSymbolsList:
+            try:
+                if tradingSymbol in self.trackTradingSymbols:
+                    self.trackTradingSymbols.discard(tradingSymbol)
+                    self.updateTickRoute(tradingSymbol)
+                    # ticker unsubscribes the symbol once no trade needs it either
+                    self.ticker.unregisterSymbols([tradingSymbol], owner = "tracker")
+
+            except Exception as e:
+                logging.error("Error in unregisterTradingSymbolToTrack for symbol %s,  Error => %s", tradingSymbol, str(e))
+
         
 
@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+import time
+
+import pymongo
+from pymongo import ReplaceOne
+
+from trademgmt.TradeSnapshot import TradeSnapshot
+
+class TradePersister(threading.Thread):
+  # Writes trades to Mongo and the trades snapshot file from a background thread so the TradeManager loop
+  # never waits on disk or Mongo. The loop submits json copies of the changed trades and now and then all trades
+  # encoded for the snapshot. Submissions waiting to be written are coalesced, a trade submitted again replaces
+  # its older copy and only the newest snapshot is written.
+  # When the oldest unsaved change is older than maxLag seconds submit() blocks up to maxBlock seconds, so a slow
+  # Mongo holds back the loop instead of letting unsaved state pile up.
+  def __init__(self, name, dbTrades, tradesFilepath, tradeJournal, maxLag = 30, maxBlock = 5, retryInterval = 5):
+    super(TradePersister, self).__init__(name=name, daemon=True)
+    self.dbTrades = dbTrades
+    self.tradesFilepath = tradesFilepath
+    self.tradeJournal = tradeJournal
+    self.maxLag = maxLag
+    self.maxBlock = maxBlock
+    self.retryInterval = retryInterval
+    self.condition = threading.Condition()
+    self.pendingTrades = {} # tradeID -> json of the trade
+    self.pendingSnapshot = None # (every trade encoded by TradeSnapshot.encodeTrade, journal segment the snapshot starts)
+    self.pendingSince = None # submit time of the oldest change not yet picked up
+    self.inFlightSince = None # submit time of the oldest change being written
+    self.submitCount = 0
+    self.coalescedCount = 0
+    self.savedCount = 0
+    self.failedSaveCount = 0
+    self.snapshotCount = 0
+    self.blockedTime = 0
+    self.lastSaveLatency = 0
+
+  def submit(self, changedTrades, snapshot = None):
+    # changedTrades: list of (tradeID, json of the trade), the json must not be touched by the caller afterwards
+    with self.condition:
+      if self.getLag() > self.maxLag:
+        logging.warn('TradePersister: %s is %.1f seconds behind, holding back the submitter', self.getName(), self.getLag())
+        startTime = time.time()
+        self.condition.wait_for(lambda: self.getLag() <= self.maxLag, self.maxBlock)
+        self.blockedTime += time.time() - startTime
+      for tradeID, tradeJSON in changedTrades:
+        if tradeID in self.pendingTrades:
+          self.coalescedCount += 1
+        self.pendingTrades[tradeID] = tradeJSON
+      if snapshot != None:
+        self.pendingSnapshot = snapshot
+      if self.pendingSince == None:
+        self.pendingSince = time.time()
+      self.submitCount += 1
+      self.condition.notify_all()
+
+  def getLag(self):
+    # seconds the oldest unsaved change has been waiting
+    oldest = [since for since in [self.pendingSince, self.inFlightSince] if since != None]
+    return time.time() - min(oldest) if len(oldest) > 0 else 0
+
+  def getStats(self):
+    return {
+      "lagSeconds": self.getLag(),
+      "pendingTrades": len(self.pendingTrades),
+      "submits": self.submitCount,
+      "coalesced": self.coalescedCount,
+      "saved": self.savedCount,
+      "failedSaves": self.failedSaveCount,
+      "snapshots": self.snapshotCount,
+      "blockedSeconds": self.blockedTime,
+      "lastSaveLatencyMs": self.lastSaveLatency * 1000
+    }
+
+  def run(self):
+    while True:
+      with self.condition:
+        self.condition.wait_for(lambda: len(self.pendingTrades) > 0 or self.pendingSnapshot != None)
+        trades = self.pendingTrades
+        snapshot = self.pendingSnapshot
+        self.pendingTrades = {}
+        self.pendingSnapshot = None
+        self.inFlightSince = self.pendingSince
+        self.pendingSince = None
+      startTime = time.time()
+      if snapshot != None:
+        self._writeSnapshot(snapshot)
+      saved = self._writeTrades(trades)
+      self.lastSaveLatency = time.time() - startTime
+      with self.condition:
+        if not saved:
+          # back in the queue unless a newer copy was submitted meanwhile
+          for tradeID, tradeJSON in trades.items():
+            self.pendingTrades.setdefault(tradeID, tradeJSON)
+          self.pendingSince = min(self.pendingSince or self.inFlightSince, self.inFlightSince)
+        self.inFlightSince = None
+        self.condition.notify_all()
+      if not saved:
+        time.sleep(self.retryInterval)
+
+  def _writeTrades(self, trades):
+    if len(trades) == 0 or self.dbTrades == None:
+      return True
+    try:
+      self.dbTrades.bulk_write([ReplaceOne({"tradeID": tradeID}, tradeJSON, upsert=True)
+        for tradeID, tradeJSON in trades.items()], ordered=False)
+    except pymongo.errors.PyMongoError as e:
+      self.failedSaveCount += 1
+      logging.error('TradePersister: Failed to save %d trades to Mongo. Error => %s', len(trades), str(e))
+      return False
+    self.savedCount += len(trades)
+    return True
+
+  def _writeSnapshot(self, snapshot):
+    encodedTrades, journalSegment = snapshot
+    try:
+      # replaced atomically so a crash never leaves it half written
+      with open(self.tradesFilepath + ".tmp", 'wb') as tFile:
+        tFile.write(TradeSnapshot.encode(encodedTrades))
+        tFile.flush()
+        os.fsync(tFile.fileno())
+      os.replace(self.tradesFilepath + ".tmp", self.tradesFilepath)
+      if journalSegment != None:
+        self.tradeJournal.removeSegmentsBefore(journalSegment)
+    except Exception as e:
+      # the journal segments stay until a later snapshot is written
+      logging.error('TradePersister: Failed to write trades snapshot %s. Error => %s', self.tradesFilepath, str(e))
+      return
+    self.snapshotCount += 1
+    logging.debug('TradePersister: Saved snapshot of %d trades to file %s', len(encodedTrades), self.tradesFilepath)
@@ -0,0 +1,85 @@
+import json
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+from ordermgmt.Order import Order
+from trademgmt.Trade import Trade
+from utils.Utils import Utils
+
+ORDER_LISTS = ['entryOrder', 'slOrder', 'targetOrder']
+
+def dumps(value):
+  if orjson != None:
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+  return json.dumps(value, separators=(',', ':')).encode("utf-8")
+
+def loads(data):
+  if orjson != None:
+    return orjson.loads(data)
+  return json.loads(data)
+
+class TradeSnapshot:
+  # Compact snapshot of all trades. A header names the trade and order fields once, then every trade is an array
+  # of its values in that field order, with its orders as arrays in the order field order.
+  # Fields are matched by name when loading: fields this version does not know are dropped and missing ones keep
+  # the defaults of a new Trade/Order. Uses orjson when it is installed, json otherwise.
+  # Snapshots written before this format (a list of trade json) are still loaded.
+  FORMAT = "trades"
+  VERSION = 2
+  TRADE_DEFAULTS = {name: value for name, value in Trade().__dict__.items() if name != '_version' and name not in ORDER_LISTS}
+  ORDER_DEFAULTS = {name: value for name, value in Order().__dict__.items() if name != '_version'}
+  TRADE_FIELDS = list(TRADE_DEFAULTS.keys())
+  ORDER_FIELDS = list(ORDER_DEFAULTS.keys())
+
+  @staticmethod
+  def encodeTrade(trade):
+    # one trade as bytes, cached by the caller until the trade changes
+    tradeData = trade.__dict__
+    row = [tradeData.get(name, None) for name in TradeSnapshot.TRADE_FIELDS]
+    for orderList in ORDER_LISTS:
+      row.append([[order.__dict__.get(name, None) for name in TradeSnapshot.ORDER_FIELDS] for order in tradeData[orderList]])
+    return dumps(row)
+
+  @staticmethod
+  def encode(encodedTrades):
+    return (b'{"format":' + dumps(TradeSnapshot.FORMAT) + b',"version":' + dumps(TradeSnapshot.VERSION)
+      + b',"tradeFields":' + dumps(TradeSnapshot.TRADE_FIELDS + ORDER_LISTS)
+      + b',"orderFields":' + dumps(TradeSnapshot.ORDER_FIELDS)
+      + b',"trades":[' + b",".join(encodedTrades) + b']}')
+
+  @staticmethod
+  def decode(data):
+    snapshot = loads(data)
+    if isinstance(snapshot, list):
+      return [Utils.convertJSONToTrade(tr) for tr in snapshot]
+    if snapshot.get("format", None) != TradeSnapshot.FORMAT or snapshot.get("version", None) != TradeSnapshot.VERSION:
+      raise Exception("Unsupported trades snapshot format " + str(snapshot.get("format", None)) + " version " + str(snapshot.get("version", None)))
+    tradeFields = snapshot["tradeFields"]
+    orderFields = snapshot["orderFields"]
+    if "tradeID" not in tradeFields or any([orderList not in tradeFields for orderList in ORDER_LISTS]):
+      raise Exception("Trades snapshot is missing tradeID or order fields")
+    # (position in the row, field name) of the fields this version knows
+    tradeColumns = [(index, name) for index, name in enumerate(tradeFields) if name in TradeSnapshot.TRADE_DEFAULTS]
+    orderColumns = [(index, name) for index, name in enumerate(orderFields) if name in TradeSnapshot.ORDER_DEFAULTS]
+    orderListColumns = [(tradeFields.index(orderList), orderList) for orderList in ORDER_LISTS]
+    trades = []
+    for row in snapshot["trades"]:
+      if len(row) != len(tradeFields):
+        raise Exception("Trades snapshot row has " + str(len(row)) + " values for " + str(len(tradeFields)) + " fields")
+      # objects are filled directly, without the per attribute version stamping of models.Versioned
+      trade = Trade.__new__(Trade)
+      trade.__dict__.update(TradeSnapshot.TRADE_DEFAULTS)
+      trade.__dict__.update([(name, row[index]) for index, name in tradeColumns])
+      for index, orderList in orderListColumns:
+        orders = []
+        for orderRow in row[index]:
+          order = Order.__new__(Order)
+          order.__dict__.update(TradeSnapshot.ORDER_DEFAULTS)
+          order.__dict__.update([(name, orderRow[orderIndex]) for orderIndex, name in orderColumns])
+          orders.append(order)
+        trade.__dict__[orderList] = orders
+      trades.append(trade)
+    return trades
@@ -0,0 +1,73 @@
+import threading
+
+from trademgmt.TradeState import TradeState
+
+class TriggerBook:
+  # Index of untriggered (CREATED) trades: tradingSymbol -> {(strategy, direction) -> [trades]}
+  # so that a tick only looks at the trades pending on its own symbol
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.symbolToPendingTrades = {}
+
+  def clear(self):
+    with self.lock:
+      self.symbolToPendingTrades = {}
+
+  def addTrade(self, trade):
+    if trade == None or trade.tradeState != TradeState.CREATED:
+      return
+    with self.lock:
+      pendingTrades = self.symbolToPendingTrades.setdefault(trade.tradingSymbol, {})
+      trades = pendingTrades.setdefault((trade.strategy, trade.direction), [])
+      if not any(tr is trade for tr in trades):
+        trades.append(trade)
+
+  def removeTrade(self, trade):
+    if trade == None:
+      return
+    with self.lock:
+      pendingTrades = self.symbolToPendingTrades.get(trade.tradingSymbol, None)
+      if pendingTrades == None:
+        return
+      key = (trade.strategy, trade.direction)
+      trades = pendingTrades.get(key, None)
+      if trades == None:
+        return
+      trades[:] = [tr for tr in trades if tr is not trade]
+      self._prune(trade.tradingSymbol, pendingTrades, key)
+
+  def hasPendingTrades(self, tradingSymbol):
+    return tradingSymbol in self.symbolToPendingTrades
+
+  def getPendingStrategies(self, tradingSymbol):
+    with self.lock:
+      pendingTrades = self.symbolToPendingTrades.get(tradingSymbol, None)
+      if pendingTrades == None:
+        return []
+      strategies = []
+      for (strategy, direction) in pendingTrades:
+        if strategy not in strategies:
+          strategies.append(strategy)
+      return strategies
+
+  def getUntriggeredTrade(self, tradingSymbol, strategy, direction):
+    with self.lock:
+      pendingTrades = self.symbolToPendingTrades.get(tradingSymbol, None)
+      if pendingTrades == None:
+        return None
+      key = (strategy, direction)
+      trades = pendingTrades.get(key, None)
+      if trades == None:
+        return None
+      # Trades can leave CREATED state without going through the book, drop them lazily here
+      while len(trades) > 0 and trades[0].tradeState != TradeState.CREATED:
+        trades.pop(0)
+      trade = trades[0] if len(trades) > 0 else None
+      self._prune(tradingSymbol, pendingTrades, key)
+      return trade
+
+  def _prune(self, tradingSymbol, pendingTrades, key):
+    if len(pendingTrades.get(key, [])) == 0:
+      pendingTrades.pop(key, None)
+    if len(pendingTrades) == 0:
+      self.symbolToPendingTrades.pop(tradingSymbol, None)
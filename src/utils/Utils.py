@@ -4,13 +4,13 @@ import uuid
 import time
 import logging
 import calendar
-import psycopg2
 
 from datetime import datetime, timedelta
 from py_vollib.black_scholes.implied_volatility import implied_volatility
 from py_vollib.black_scholes.greeks.analytical import delta, gamma, rho, theta, vega
 
 from config.Config import getHolidays
+from dbmgmt.QuestDBPool import QuestDBPool
 from models.Direction import Direction
 from ordermgmt.Order import Order
 from trademgmt.Trade import Trade
@@ -297,7 +297,7 @@ class Utils:
     
   @staticmethod
   def getVIXAdjustment(short_code):
-    return math.pow(Utils.getTradeManager(short_code).symbolToCMPMap["INDIA VIX"]/16, 0.5)
+    return math.pow(Utils.getTradeManager(short_code).getLastTradedPrice("INDIA VIX")/16, 0.5)
 
   @staticmethod
   def getUnderlyingBasedSL(inputSymbol, underLyingPrice, strikePrice, quote, percentageUnderlying, type, expiryDay=2):
@@ -404,45 +404,42 @@ class Utils:
     return trade
 
   @staticmethod
-  def getQuestDBConnection(short_code):
-    try:
-      connection = psycopg2.connect(user = "admin", password = "quest", host = "127.0.0.1", port = "8812", database = "qdb")
-      cursor = connection.cursor()
-      
-      cursor.execute('''CREATE TABLE IF NOT EXISTS {0} ( ts TIMESTAMP, strategy string, tradingSymbol string, tradeId string, cmp float, entry float, pnl float, qty int, status string) timestamp(ts) partition by year'''.format(short_code))
-      cursor.execute('''CREATE TABLE IF NOT EXISTS {0}_tickData( ts TIMESTAMP, tradingSymbol string, ltp float, qty int, avgPrice float, volume int, totalBuyQuantity int, totalSellQuantity int, open float, high float, low float, close float, change float) timestamp(ts) partition by year'''.format(short_code))
-    
-      logging.info("Connected to Quest DB")
-      return cursor
-    except Exception as err:
-      logging.info("Can't connect to QuestDB")
-      return None
-    
+  def convertOrderToJSON(order):
+    return {name: value for name, value in order.__dict__.items() if name != '_version'}
+
+  @staticmethod
+  def convertTradeToJSON(trade):
+    # plain dict of the trade and its orders, the inverse of convertJSONToTrade
+    jsonData = {name: value for name, value in trade.__dict__.items() if name != '_version'}
+    jsonData['entryOrder'] = [Utils.convertOrderToJSON(order) for order in trade.entryOrder]
+    jsonData['slOrder'] = [Utils.convertOrderToJSON(order) for order in trade.slOrder]
+    jsonData['targetOrder'] = [Utils.convertOrderToJSON(order) for order in trade.targetOrder]
+    return jsonData
+
   @staticmethod
   def getHighestPrice(short_code, startTimestamp, endTimestamp, tradingSymbol):
-    try:
-      cursor = Utils.getQuestDBConnection(short_code)
+    result = Utils.getPriceRange(short_code, startTimestamp, endTimestamp, tradingSymbol)
+    return result[0] if result != None else None
 
-      query = "select max(ltp) from '{0}_tickData' where ts BETWEEN to_timestamp('{1}', 'yyyy-MM-dd HH:mm:ss') AND to_timestamp('{2}', 'yyyy-MM-dd HH:mm:ss') AND tradingSymbol = '{3}';"\
-              .format(short_code, startTimestamp.strftime("%Y-%m-%d %H:%M:%S"), endTimestamp.strftime("%Y-%m-%d %H:%M:%S"), tradingSymbol)
-      cursor.execute(query)
-      result = cursor.fetchone()
-      return result[0]
-    
-    except Exception as err:
-      logging.info("Unable to fetch data from QuestDB", str(err))
-      return None
-    
-  def getLowestPrice(short_code, startTimestamp, endTimestamp, tradingSymbol):
+  @staticmethod
+  def getPriceRange(short_code, startTimestamp, endTimestamp, tradingSymbol):
+    # (high, low) of the stored ticks in one query, None if QuestDB could not be queried
     try:
-      cursor = Utils.getQuestDBConnection(short_code)
-      query = "select min(ltp) from '{0}_tickData' where ts BETWEEN to_timestamp('{1}', 'yyyy-MM-dd HH:mm:ss') AND to_timestamp('{2}', 'yyyy-MM-dd HH:mm:ss') AND tradingSymbol = '{3}';"\
-                .format(short_code, startTimestamp.strftime("%Y-%m-%d %H:%M:%S"), endTimestamp.strftime("%Y-%m-%d %H:%M:%S"), tradingSymbol)
-      cursor.execute(query)
-      result = cursor.fetchone()
-      return result[0]
+      questDBPool = QuestDBPool.getInstance(short_code)
+      if not questDBPool.isAvailable():
+        return None
+      with questDBPool.connection() as cursor:
+        query = "select max(ltp), min(ltp) from \"{0}_tickData\" where ts BETWEEN %s AND %s AND tradingSymbol = %s;".format(short_code)
+        cursor.execute(query, (startTimestamp, endTimestamp, tradingSymbol))
+        result = cursor.fetchone()
+        return (result[0], result[1])
     except Exception as err:
-      logging.info("Unable to fetch data from QuestDB", str(err))
+      logging.info("Unable to fetch data from QuestDB %s", str(err))
       return None
+
+  @staticmethod
+  def getLowestPrice(short_code, startTimestamp, endTimestamp, tradingSymbol):
+    result = Utils.getPriceRange(short_code, startTimestamp, endTimestamp, tradingSymbol)
+    return result[1] if result != None else None
     
 